@@ -0,0 +1,121 @@
+import os
+from typing import List, Optional, Tuple
+import numpy as np
+
+from .vector_index import selecionar_top_k
+
+
+# ============================================
+# ÍNDICE APROXIMADO (IVF-FLAT EM NUMPY)
+# ============================================
+# As linhas (já normalizadas) são agrupadas por k-means esférico em `n_listas`
+# centróides. Na busca, só as `n_probe` listas mais próximas da query são
+# pontuadas, com produto escalar exato sobre os candidatos.
+
+# A partir de quantos documentos um índice passa a usar IVF em vez de força bruta
+LIMIAR_ANN = int(os.environ.get('SENSEI_ANN_LIMIAR', '20000'))
+N_PROBE_PADRAO = int(os.environ.get('SENSEI_ANN_NPROBE', '16'))
+
+# Escolha por usuário (UserProfile.ann_mode): 'auto' segue LIMIAR_ANN; 'sempre'
+# antecipa o IVF para coleções a partir de MINIMO_ANN documentos (abaixo disso a
+# força bruta já é imediata e o k-means não tem dados para treinar); 'nunca'
+# mantém a busca exata em qualquer tamanho.
+MODO_ANN_AUTO = 'auto'
+MODO_ANN_SEMPRE = 'sempre'
+MODO_ANN_NUNCA = 'nunca'
+MINIMO_ANN = int(os.environ.get('SENSEI_ANN_MINIMO', '1000'))
+
+# Linhas processadas por vez ao atribuir listas (limita a matriz N x n_listas)
+_BLOCO_ATRIBUICAO = 16384
+
+
+def usar_ann(total: int, modo: Optional[str] = None) -> bool:
+    """Se um índice com `total` documentos deve buscar pelo IVF; modo None = 'auto'."""
+    if modo == MODO_ANN_NUNCA:
+        return False
+    if modo == MODO_ANN_SEMPRE:
+        return total >= MINIMO_ANN
+    return total >= LIMIAR_ANN
+
+
+def _mais_proximos(matriz: np.ndarray, centroides: np.ndarray) -> np.ndarray:
+    """Índice do centróide de maior produto escalar para cada linha."""
+    atribuicoes = np.empty(matriz.shape[0], dtype=np.int64)
+    for inicio in range(0, matriz.shape[0], _BLOCO_ATRIBUICAO):
+        bloco = matriz[inicio:inicio + _BLOCO_ATRIBUICAO]
+        atribuicoes[inicio:inicio + bloco.shape[0]] = np.argmax(bloco @ centroides.T, axis=1)
+    return atribuicoes
+
+
+def kmeans_esferico(matriz: np.ndarray, n_listas: int, iteracoes: int = 10, seed: int = 0) -> np.ndarray:
+    """Centróides normalizados via k-means com similaridade de cosseno."""
+    rng = np.random.default_rng(seed)
+    centroides = np.array(matriz[rng.choice(matriz.shape[0], n_listas, replace=False)], dtype=np.float32)
+
+    for _ in range(iteracoes):
+        atribuicoes = _mais_proximos(matriz, centroides)
+        somas = np.zeros_like(centroides)
+        np.add.at(somas, atribuicoes, matriz)
+        contagens = np.bincount(atribuicoes, minlength=n_listas)
+
+        # Listas vazias recebem um ponto aleatório para não desperdiçar centróides
+        vazias = np.flatnonzero(contagens == 0)
+        if vazias.size:
+            somas[vazias] = matriz[rng.choice(matriz.shape[0], vazias.size, replace=False)]
+
+        normas = np.linalg.norm(somas, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        centroides = somas / normas
+
+    return centroides
+
+
+class IndiceIVF:
+    """
+    Índice invertido sobre as linhas de uma matriz normalizada (N x D).
+    As listas guardam apenas posições; os vetores continuam na matriz original,
+    o que permite reescorar os candidatos com o produto escalar exato.
+    """
+
+    def __init__(self, matriz: np.ndarray, n_listas: Optional[int] = None, amostra_por_lista: int = 64,
+                 iteracoes: int = 10, seed: int = 0):
+        total = matriz.shape[0]
+        self.n_listas = max(1, min(total, n_listas or int(np.sqrt(total))))
+
+        # O treino usa uma amostra; a atribuição final cobre todas as linhas
+        rng = np.random.default_rng(seed)
+        tamanho_amostra = min(total, self.n_listas * amostra_por_lista)
+        amostra = matriz[np.sort(rng.choice(total, tamanho_amostra, replace=False))]
+        self.centroides = kmeans_esferico(amostra, self.n_listas, iteracoes, seed)
+
+        atribuicoes = _mais_proximos(matriz, self.centroides)
+        self._ordem = np.argsort(atribuicoes, kind='stable')
+        self._inicios = np.concatenate(([0], np.cumsum(np.bincount(atribuicoes, minlength=self.n_listas))))
+        self.tamanho_treinado = total
+        # Posições anexadas depois do treino são sempre pontuadas (força bruta)
+        self.pendentes: List[int] = []
+
+    def anexar(self, posicao: int) -> None:
+        self.pendentes.append(posicao)
+
+    def precisa_retreinar(self) -> bool:
+        return len(self.pendentes) > 0.1 * self.tamanho_treinado
+
+    def candidatos(self, query: np.ndarray, n_probe: int) -> np.ndarray:
+        """Posições das linhas nas `n_probe` listas mais próximas da query (mais as pendentes)."""
+        listas, _ = selecionar_top_k(self.centroides @ query, n_probe)
+        partes = [self._ordem[self._inicios[l]:self._inicios[l + 1]] for l in listas]
+        if self.pendentes:
+            partes.append(np.asarray(self.pendentes, dtype=np.int64))
+        return np.concatenate(partes) if partes else np.empty(0, dtype=np.int64)
+
+    def buscar(self, matriz: np.ndarray, query: np.ndarray, top_k: int, n_probe: int = N_PROBE_PADRAO) -> Tuple[np.ndarray, np.ndarray]:
+        """Top_k aproximado: (posições na matriz, similaridades exatas)."""
+        # Pendentes anexados depois de o chamador obter a matriz ficam de fora
+        posicoes = self.candidatos(query, n_probe)
+        posicoes = posicoes[posicoes < matriz.shape[0]]
+        if posicoes.size == 0:
+            return posicoes, np.empty(0, dtype=np.float32)
+        scores = matriz[posicoes] @ query
+        escolhidos, top_scores = selecionar_top_k(scores, top_k)
+        return posicoes[escolhidos], top_scores
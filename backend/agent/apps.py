@@ -0,0 +1,30 @@
+import os
+import sys
+from typing import Mapping, Optional, Sequence
+
+from django.apps import AppConfig
+
+
+def processo_servidor(argv: Optional[Sequence[str]] = None, environ: Optional[Mapping[str, str]] = None) -> bool:
+    """
+    True se este processo atende requisições: worker do gunicorn ou o processo
+    filho do runserver (o pai só vigia arquivos para o autoreload). Comandos de
+    gerenciamento (migrate, shell, testes...) não iniciam a fila.
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    if 'runserver' in argv[1:]:
+        return environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
+    # `gunicorn ...` ou `python -m gunicorn ...` (.../gunicorn/__main__.py)
+    return bool(argv) and 'gunicorn' in argv[0]
+
+
+class AgentConfig(AppConfig):
+    name = 'agent'
+
+    def ready(self):
+        # Itens deixados na outbox antes de um restart/deploy voltam a ser processados
+        # sem depender de um novo enfileiramento.
+        if processo_servidor():
+            from .fila_embeddings import fila_embeddings
+            fila_embeddings.iniciar()
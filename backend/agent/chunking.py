@@ -0,0 +1,124 @@
+import os
+from typing import List, Optional, Sequence, Tuple
+
+
+# ============================================
+# CHUNKING DE CONTEXTOS LONGOS
+# ============================================
+# Divisor recursivo no estilo do RecursiveCharacterTextSplitter (ver
+# experimental/agentes_de_ia.py): tenta quebrar por parágrafo, depois linha,
+# frase e palavra, e só em último caso corta caracteres. Os pedaços são
+# reagrupados em chunks de até `tamanho` caracteres com `sobreposicao`
+# caracteres repetidos entre chunks vizinhos.
+#
+# Cada chunk vira um documento próprio em 'inteligencia_critica', ligado ao
+# contexto original por CAMPO_PAI. Na busca, chunks do mesmo pai são
+# reagrupados em um único trecho (agrupar_chunks).
+
+TAMANHO_CHUNK = int(os.environ.get('SENSEI_CHUNK_SIZE', '1200'))
+SOBREPOSICAO_CHUNK = int(os.environ.get('SENSEI_CHUNK_OVERLAP', '150'))
+
+SEPARADORES = ["\n\n", "\n", ". ", " ", ""]
+
+CAMPO_PAI = 'contexto_pai'
+CAMPO_INDICE = 'chunk_indice'
+CAMPO_INICIO = 'chunk_inicio'
+
+# Marcador entre chunks não consecutivos do mesmo contexto
+SEPARADOR_LACUNA = "\n[...]\n"
+
+
+def _dividir_recursivo(texto: str, separadores: Sequence[str], tamanho: int) -> List[str]:
+    """Quebra o texto em pedaços de até `tamanho` caracteres sem perder nenhum caractere."""
+    for nivel, separador in enumerate(separadores):
+        if separador == "":
+            return [texto[i:i + tamanho] for i in range(0, len(texto), tamanho)]
+        if separador in texto:
+            break
+
+    partes = texto.split(separador)
+    # O separador fica colado ao fim de cada parte para a concatenação reproduzir o original
+    partes = [parte + separador for parte in partes[:-1]] + [partes[-1]]
+
+    pecas = []
+    for parte in partes:
+        if len(parte) <= tamanho:
+            if parte:
+                pecas.append(parte)
+        else:
+            pecas.extend(_dividir_recursivo(parte, separadores[nivel + 1:], tamanho))
+    return pecas
+
+
+def dividir_em_chunks(texto: str, tamanho: int = TAMANHO_CHUNK,
+                      sobreposicao: int = SOBREPOSICAO_CHUNK) -> List[Tuple[int, str]]:
+    """
+    Divide o texto em chunks de até `tamanho` caracteres.
+    Retorna (posição inicial no texto, chunk); textos curtos viram um único chunk.
+    """
+    if tamanho <= 0:
+        raise ValueError("O tamanho do chunk deve ser positivo.")
+    sobreposicao = max(0, min(sobreposicao, tamanho // 2))
+
+    if len(texto.strip()) <= tamanho:
+        return [(0, texto.strip())] if texto.strip() else []
+
+    chunks = []
+    atual: List[Tuple[int, str]] = []
+    tamanho_atual = 0
+    posicao = 0
+    for peca in _dividir_recursivo(texto, SEPARADORES, tamanho):
+        if atual and tamanho_atual + len(peca) > tamanho:
+            chunks.append(list(atual))
+            # Mantém no próximo chunk só a cauda que cabe na sobreposição
+            while atual and (tamanho_atual > sobreposicao or tamanho_atual + len(peca) > tamanho):
+                tamanho_atual -= len(atual.pop(0)[1])
+        atual.append((posicao, peca))
+        tamanho_atual += len(peca)
+        posicao += len(peca)
+    chunks.append(atual)
+
+    resultado = []
+    for pecas in chunks:
+        bruto = "".join(peca for _, peca in pecas)
+        limpo = bruto.strip()
+        if limpo:
+            resultado.append((pecas[0][0] + bruto.index(limpo), limpo))
+    return resultado
+
+
+def juntar_chunks(chunks: Sequence[Tuple[int, int, str]]) -> str:
+    """
+    Reagrupa chunks de um mesmo contexto, (índice, posição inicial, texto), em
+    ordem. Vizinhos consecutivos têm a sobreposição removida; lacunas são marcadas.
+    """
+    partes = []
+    anterior = None
+    for indice, inicio, texto in sorted(chunks):
+        if anterior is None:
+            partes.append(texto)
+        elif indice == anterior[0] + 1:
+            repetido = anterior[1] + len(anterior[2]) - inicio
+            partes.append(texto[repetido:] if repetido > 0 else " " + texto)
+        elif indice != anterior[0]:
+            partes.append(SEPARADOR_LACUNA + texto)
+        else:
+            continue
+        anterior = (indice, inicio, texto)
+    return "".join(partes)
+
+
+def agrupar_chunks(trechos: Sequence[Tuple[str, Optional[int], int, str]]) -> List[str]:
+    """
+    Recebe os trechos vencedores em ordem de relevância como (chave do contexto,
+    índice do chunk, posição inicial, texto) e devolve um texto por contexto, na
+    posição do seu chunk mais relevante. Trechos sem chunk (índice None) passam direto.
+    """
+    ordem: List[str] = []
+    grupos = {}
+    for chave, indice, inicio, texto in trechos:
+        if chave not in grupos:
+            ordem.append(chave)
+            grupos[chave] = []
+        grupos[chave].append((indice or 0, inicio, texto))
+    return [juntar_chunks(grupos[chave]) for chave in ordem]
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+import numpy as np
+
+
+# ============================================
+# CACHE DE EMBEDDINGS DE CONSULTA (MEMÓRIA + DISCO)
+# ============================================
+# Camada 1: LRU em memória com TTL, por processo.
+# Camada 2: SQLite local (sobrevive a reinícios e é compartilhado pelos workers).
+# A chave é o hash de (modelo, prefixo da tarefa, texto normalizado), então
+# perguntas repetidas com outra caixa/espaçamento reaproveitam o mesmo vetor.
+
+CAMINHO_CACHE_EMBEDDINGS = os.environ.get(
+    'SENSEI_EMBEDDING_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'embedding_cache.sqlite3'),
+)
+
+
+def normalizar_texto(texto: str) -> str:
+    """Colapsa espaços e ignora maiúsculas/minúsculas."""
+    return " ".join(texto.split()).casefold()
+
+
+def chave_embedding(modelo: str, prefixo: str, texto: str) -> str:
+    conteudo = "\x1f".join([modelo, prefixo, normalizar_texto(texto)])
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+# Hash do texto normalizado gravado em cada contexto: um contexto repetido
+# pelo mesmo usuário é detectado antes de gastar um embedding
+CAMPO_HASH = 'hash_conteudo'
+
+
+def hash_conteudo(texto: str) -> str:
+    return hashlib.sha256(normalizar_texto(texto).encode('utf-8')).hexdigest()
+
+
+class CacheEmbeddings:
+    """
+    Cache de dois níveis para embeddings de consulta. Falhas no SQLite são
+    registradas e ignoradas: o cache nunca deve derrubar uma requisição.
+    """
+
+    def __init__(self, caminho: Optional[str], max_itens: int = 2048,
+                 ttl_memoria: float = 3600, ttl_disco: float = 30 * 24 * 3600):
+        self.caminho = caminho
+        self.max_itens = max_itens
+        self.ttl_memoria = ttl_memoria
+        self.ttl_disco = ttl_disco
+        self._memoria: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+
+    def _conexao(self) -> Optional[sqlite3.Connection]:
+        """Uma conexão por thread; cria a tabela na primeira vez."""
+        if not self.caminho:
+            return None
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+            conexao = sqlite3.connect(self.caminho, timeout=5)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "chave TEXT PRIMARY KEY, vetor BLOB NOT NULL, criado_em REAL NOT NULL)"
+            )
+            self._local.conexao = conexao
+        return conexao
+
+    def obter(self, chave: str) -> Optional[np.ndarray]:
+        agora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(chave)
+            if entrada is not None and agora - entrada[1] <= self.ttl_memoria:
+                self._memoria.move_to_end(chave)
+                self.hits_memoria += 1
+                return entrada[0]
+
+        vetor = self._obter_disco(chave, agora)
+        with self._lock:
+            if vetor is None:
+                self.misses += 1
+                return None
+            self.hits_disco += 1
+        self._armazenar_memoria(chave, vetor, agora)
+        return vetor
+
+    def armazenar(self, chave: str, embedding: Sequence[float]) -> np.ndarray:
+        vetor = np.asarray(embedding, dtype=np.float32)
+        vetor.setflags(write=False)
+        agora = time.time()
+        self._armazenar_memoria(chave, vetor, agora)
+        try:
+            conexao = self._conexao()
+            if conexao is not None:
+                with conexao:
+                    conexao.execute(
+                        "INSERT OR REPLACE INTO embeddings (chave, vetor, criado_em) VALUES (?, ?, ?)",
+                        (chave, vetor.tobytes(), agora),
+                    )
+        except sqlite3.Error as e:
+            print(f"⚠️ Cache de embeddings (disco) indisponível: {e}")
+        return vetor
+
+    def estatisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits_memoria': self.hits_memoria,
+                'hits_disco': self.hits_disco,
+                'misses': self.misses,
+                'entradas_memoria': len(self._memoria),
+            }
+
+    def _armazenar_memoria(self, chave: str, vetor: np.ndarray, agora: float) -> None:
+        with self._lock:
+            self._memoria[chave] = (vetor, agora)
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.max_itens:
+                self._memoria.popitem(last=False)
+
+    def _obter_disco(self, chave: str, agora: float) -> Optional[np.ndarray]:
+        try:
+            conexao = self._conexao()
+            if conexao is None:
+                return None
+            linha = conexao.execute(
+                "SELECT vetor, criado_em FROM embeddings WHERE chave = ?", (chave,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ Cache de embeddings (disco) indisponível: {e}")
+            return None
+
+        if linha is None or agora - linha[1] > self.ttl_disco:
+            return None
+        return np.frombuffer(linha[0], dtype=np.float32)
+
+
+cache_embeddings = CacheEmbeddings(
+    CAMINHO_CACHE_EMBEDDINGS,
+    max_itens=int(os.environ.get('SENSEI_EMBEDDING_CACHE_ITENS', '2048')),
+    ttl_memoria=float(os.environ.get('SENSEI_EMBEDDING_CACHE_TTL', '3600')),
+    ttl_disco=float(os.environ.get('SENSEI_EMBEDDING_CACHE_TTL_DISCO', str(30 * 24 * 3600))),
+)
+
+# Embeddings de documentos, reaproveitados quando qualquer usuário salva um
+# texto idêntico. Mesmo arquivo SQLite (as chaves levam outro prefixo), mas
+# LRU própria para a ingestão não expulsar os embeddings de consulta.
+REUSAR_EMBEDDINGS_DOCUMENTOS = os.environ.get('SENSEI_REUSAR_EMBEDDINGS', '1') == '1'
+cache_embeddings_documentos = CacheEmbeddings(
+    CAMINHO_CACHE_EMBEDDINGS,
+    max_itens=int(os.environ.get('SENSEI_EMBEDDING_CACHE_ITENS_DOCUMENTOS', '512')),
+    ttl_memoria=float(os.environ.get('SENSEI_EMBEDDING_CACHE_TTL', '3600')),
+    ttl_disco=float(os.environ.get('SENSEI_EMBEDDING_CACHE_TTL_DISCO', str(30 * 24 * 3600))),
+)
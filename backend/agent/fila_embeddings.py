@@ -0,0 +1,178 @@
+import os
+import random
+import threading
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+from typing import List, Optional
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import utils
+from .filtros import CAMPO_FONTE, CAMPO_TAGS, CAMPO_TIMESTAMP
+from .models import Context, ContextOutbox
+
+
+# ============================================
+# FILA DE EMBEDDINGS EM SEGUNDO PLANO (OUTBOX)
+# ============================================
+# A requisição faz só uma escrita local: o Context ('pending') e seu item de
+# ContextOutbox na mesma transação (enfileirar_contextos). Embedding e
+# gravação no armazém vetorial acontecem aqui, em lotes por usuário, por uma
+# thread em cada processo ou por manage.py processar_fila_embeddings. Os
+# dois lados nunca divergem: o item só sai da outbox depois da gravação.
+#
+# Um worker reserva um item adiando next_attempt_at com um UPDATE condicional,
+# então dois workers do gunicorn nunca pegam o mesmo contexto; a reserva de um
+# worker que morreu expira sozinha após FILA_RESERVA. Falhas voltam para a fila
+# com backoff exponencial e, após FILA_MAX_TENTATIVAS, o contexto fica 'failed'.
+# O reenvio é idempotente: os documentos têm id derivado do Context (ctx-{id}),
+# então regravar sobrescreve em vez de duplicar.
+
+FILA_MAX_TENTATIVAS = int(os.environ.get('SENSEI_FILA_MAX_TENTATIVAS', '6'))
+FILA_BACKOFF_BASE = float(os.environ.get('SENSEI_FILA_BACKOFF_BASE', '5'))
+FILA_BACKOFF_MAX = float(os.environ.get('SENSEI_FILA_BACKOFF_MAX', '900'))
+FILA_RESERVA = float(os.environ.get('SENSEI_FILA_RESERVA', '300'))
+FILA_INTERVALO = float(os.environ.get('SENSEI_FILA_INTERVALO', '5'))
+FILA_LOTE = int(os.environ.get('SENSEI_FILA_LOTE', '50'))
+# Com 0, só o comando processar_fila_embeddings consome a fila
+FILA_THREAD = os.environ.get('SENSEI_FILA_THREAD', '1') == '1'
+
+
+def atraso_backoff(tentativas: int) -> float:
+    """Segundos até a próxima tentativa: base * 2^(n-1), limitado, com ±20% de jitter."""
+    atraso = min(FILA_BACKOFF_BASE * (2 ** max(0, tentativas - 1)), FILA_BACKOFF_MAX)
+    return atraso * random.uniform(0.8, 1.2)
+
+
+def id_documento(context: Context) -> str:
+    """Id estável do contexto no armazém vetorial (base dos ids dos chunks)."""
+    return f"ctx-{context.pk}"
+
+
+def metadados_contexto(context: Context) -> dict:
+    """Data de criação, origem e tags do contexto, replicadas como filtros de busca."""
+    return {CAMPO_TIMESTAMP: context.timestamp.timestamp(), CAMPO_FONTE: context.source, CAMPO_TAGS: context.tags}
+
+
+def enfileirar_contextos(contextos: List[Context]) -> List[Context]:
+    """
+    Grava contextos novos ('pending') e seus itens de outbox numa única
+    transação; a fila é acordada só depois do commit.
+    """
+    for context in contextos:
+        context.status = Context.Status.PENDING
+    with transaction.atomic():
+        contextos = Context.objects.bulk_create(contextos)
+        ContextOutbox.objects.bulk_create([ContextOutbox(context=context) for context in contextos])
+        transaction.on_commit(fila_embeddings.acordar)
+    return contextos
+
+
+def reservar_pendentes(limite: int = FILA_LOTE) -> List[ContextOutbox]:
+    """Reserva até `limite` itens vencidos da outbox, em ordem de criação."""
+    agora = timezone.now()
+    vencidos = list(
+        ContextOutbox.objects.filter(next_attempt_at__lte=agora).order_by('id').values_list('id', 'next_attempt_at')[:limite]
+    )
+    reserva_ate = agora + timedelta(seconds=FILA_RESERVA)
+    reservados = [
+        # Compare-and-set sobre o valor lido: só um worker vence a corrida
+        item_id for item_id, proxima in vencidos
+        if ContextOutbox.objects.filter(id=item_id, next_attempt_at=proxima).update(next_attempt_at=reserva_ate)
+    ]
+    return list(
+        ContextOutbox.objects.filter(id__in=reservados).select_related('context__user_profile__user').order_by('id')
+    )
+
+
+def concluir(item: ContextOutbox, sucesso: bool, erro: Optional[str]) -> None:
+    context = item.context
+    with transaction.atomic():
+        if sucesso:
+            Context.objects.filter(pk=context.pk).update(status=Context.Status.READY, error='')
+            item.delete()
+            return
+
+        tentativas = context.attempts + 1
+        if tentativas >= FILA_MAX_TENTATIVAS:
+            print(f"❌ Contexto {context.pk} falhou {tentativas} vezes; marcado como 'failed': {erro}")
+            status = Context.Status.FAILED
+            item.delete()
+        else:
+            atraso = atraso_backoff(tentativas)
+            print(f"⚠️ Contexto {context.pk} falhou (tentativa {tentativas}); nova tentativa em {atraso:.0f}s: {erro}")
+            status = Context.Status.PENDING
+            ContextOutbox.objects.filter(pk=item.pk).update(next_attempt_at=timezone.now() + timedelta(seconds=atraso))
+        Context.objects.filter(pk=context.pk).update(status=status, attempts=tentativas, error=(erro or '')[:2000])
+
+
+def processar_pendentes(limite: int = FILA_LOTE) -> int:
+    """
+    Processa um lote da outbox: os contextos de cada usuário vão juntos para
+    salvar_contextos_usuario_em_lote (embeddings e WriteBatch), com ids
+    determinísticos e os metadados do Context. Retorna quantos itens foram reservados.
+    """
+    itens = reservar_pendentes(limite)
+    por_usuario = defaultdict(list)
+    for item in itens:
+        por_usuario[item.context.user_profile.user.username].append(item)
+
+    for user_id, itens_usuario in por_usuario.items():
+        contextos = [item.context for item in itens_usuario]
+        try:
+            resultados = utils.salvar_contextos_usuario_em_lote(
+                user_id, [context.text for context in contextos], [id_documento(context) for context in contextos],
+                [metadados_contexto(context) for context in contextos],
+            )
+        except Exception as e:
+            traceback.print_exc()
+            resultados = [(False, str(e))] * len(itens_usuario)
+        for item, (sucesso, erro) in zip(itens_usuario, resultados):
+            concluir(item, sucesso, erro)
+    return len(itens)
+
+
+class FilaEmbeddings:
+    """Consumidor da fila: uma thread por processo, iniciada sob demanda."""
+
+    def __init__(self, intervalo: float = FILA_INTERVALO, habilitada: bool = FILA_THREAD):
+        self.intervalo = intervalo
+        self.habilitada = habilitada
+        self._acordar = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def iniciar(self) -> None:
+        if not self.habilitada:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.executar, name='fila-embeddings', daemon=True)
+                self._thread.start()
+                print("🧵 Fila de embeddings iniciada.")
+
+    def acordar(self) -> None:
+        """Chamado após enfileirar: processa já, sem esperar o próximo ciclo."""
+        self.iniciar()
+        self._acordar.set()
+
+    def executar(self) -> None:
+        """Laço do consumidor (também usado em primeiro plano pelo comando)."""
+        while True:
+            self._acordar.clear()
+            processados = 0
+            try:
+                close_old_connections()
+                processados = processar_pendentes()
+            except Exception as e:
+                print(f"❌ Erro na fila de embeddings: {e}")
+                traceback.print_exc()
+            finally:
+                close_old_connections()
+            if processados < FILA_LOTE:
+                self._acordar.wait(self.intervalo)
+
+
+fila_embeddings = FilaEmbeddings()
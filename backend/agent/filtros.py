@@ -0,0 +1,215 @@
+import math
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+
+# ============================================
+# FILTROS DE METADADOS E DECAIMENTO POR RECÊNCIA
+# ============================================
+# Os índices privados guardam, em paralelo à matriz, os metadados de cada
+# documento: data (timestamp), origem (fonte) e tags. A data fica numa
+# coluna float64 com a ordem cronológica em cache (intervalo = duas buscas
+# binárias); fonte e tags ficam num índice invertido (listas de posições).
+# Assim, um filtro vira um conjunto de posições ANTES da pontuação e a busca
+# só multiplica as linhas que passaram nele.
+#
+# Conceitos globais (global_knowledge) não têm esses metadados: os filtros
+# restringem apenas os contextos do usuário.
+#
+# O decaimento por recência é opcional: score * ((1 - peso) + peso * 2^(-idade/meia_vida)).
+# Com peso 0.3, um contexto muito antigo perde no máximo 30% do score.
+
+CAMPO_TIMESTAMP = 'timestamp'
+CAMPO_FONTE = 'fonte'
+CAMPO_TAGS = 'tags'
+CAMPOS_METADADOS = (CAMPO_TIMESTAMP, CAMPO_FONTE, CAMPO_TAGS)
+
+# 0 desliga o decaimento (a requisição ainda pode pedir uma meia-vida)
+MEIA_VIDA_RECENCIA_DIAS = float(os.environ.get('SENSEI_RECENCIA_MEIA_VIDA_DIAS', '0'))
+PESO_RECENCIA = float(os.environ.get('SENSEI_RECENCIA_PESO', '0.3'))
+
+SEGUNDOS_POR_DIA = 86400.0
+
+
+def para_epoch(valor) -> Optional[float]:
+    """Segundos desde a época para datetime (com ou sem fuso), ISO 8601 ou número; None se vazio."""
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    if isinstance(valor, datetime):
+        if valor.tzinfo is None:
+            valor = valor.replace(tzinfo=timezone.utc)
+        return valor.timestamp()
+    raise ValueError(f"Data inválida: {valor!r}")
+
+
+def normalizar_rotulo(valor: str) -> str:
+    return str(valor).strip().casefold()
+
+
+class FiltroBusca:
+    """
+    Restrições de uma busca: intervalo de datas [desde, ate], fontes e tags
+    (qualquer uma delas) e a meia-vida do decaimento por recência.
+    """
+
+    def __init__(self, desde=None, ate=None, fontes: Optional[Sequence[str]] = None,
+                 tags: Optional[Sequence[str]] = None, meia_vida_dias: Optional[float] = None):
+        self.desde = para_epoch(desde)
+        self.ate = para_epoch(ate)
+        self.fontes = sorted({normalizar_rotulo(f) for f in fontes or [] if str(f).strip()})
+        self.tags = sorted({normalizar_rotulo(t) for t in tags or [] if str(t).strip()})
+        self.meia_vida_dias = MEIA_VIDA_RECENCIA_DIAS if meia_vida_dias is None else float(meia_vida_dias)
+        if self.meia_vida_dias < 0:
+            raise ValueError("A meia-vida de recência não pode ser negativa.")
+
+    @classmethod
+    def de_dados(cls, dados: Optional[Dict]) -> 'FiltroBusca':
+        """
+        Lê o objeto 'filtros' da requisição:
+        {"desde": ISO 8601, "ate": ISO 8601, "fontes": [...], "tags": [...], "meia_vida_dias": n}.
+        Levanta ValueError se algum campo for inválido.
+        """
+        dados = dados or {}
+        if not isinstance(dados, dict):
+            raise ValueError("'filtros' deve ser um objeto.")
+        for campo in ('fontes', 'tags'):
+            if not isinstance(dados.get(campo) or [], list):
+                raise ValueError(f"'{campo}' deve ser uma lista.")
+        return cls(dados.get('desde'), dados.get('ate'), dados.get('fontes'), dados.get('tags'),
+                   dados.get('meia_vida_dias'))
+
+    @property
+    def restringe(self) -> bool:
+        """True se o filtro elimina documentos (o decaimento só reordena)."""
+        return bool(self.desde is not None or self.ate is not None or self.fontes or self.tags)
+
+    def __repr__(self) -> str:
+        return (f"FiltroBusca(desde={self.desde}, ate={self.ate}, fontes={self.fontes}, tags={self.tags}, "
+                f"meia_vida_dias={self.meia_vida_dias})")
+
+
+class MetadadosIndice:
+    """
+    Colunas de metadados alinhadas às posições de um índice (vetorial ou
+    léxico). Cresce junto com o índice via anexar.
+    """
+
+    def __init__(self):
+        self._timestamps = array('d')
+        self._postings: Dict[str, array] = {}
+        self._ordem_cronologica: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._bytes_postings = 0
+
+    @classmethod
+    def de_documentos(cls, metadados: Sequence[Optional[Dict]]) -> 'MetadadosIndice':
+        colunas = cls()
+        for dados in metadados:
+            colunas.anexar(dados)
+        return colunas
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    @property
+    def nbytes(self) -> int:
+        return self._timestamps.itemsize * len(self._timestamps) + self._bytes_postings
+
+    def _indexar(self, chave: str, posicao: int) -> None:
+        postings = self._postings.get(chave)
+        if postings is None:
+            postings = self._postings[chave] = array('I')
+            self._bytes_postings += 100 + len(chave)
+        postings.append(posicao)
+        self._bytes_postings += 4
+
+    def anexar(self, dados: Optional[Dict]) -> None:
+        """Metadados do próximo documento; sem data, o documento não passa em filtros de data."""
+        dados = dados or {}
+        posicao = len(self._timestamps)
+        if dados.get(CAMPO_FONTE):
+            self._indexar('fonte:' + normalizar_rotulo(dados[CAMPO_FONTE]), posicao)
+        for tag in {normalizar_rotulo(t) for t in dados.get(CAMPO_TAGS) or [] if str(t).strip()}:
+            self._indexar('tag:' + tag, posicao)
+        timestamp = para_epoch(dados.get(CAMPO_TIMESTAMP))
+        # A posição só passa a existir para os leitores depois de todas as colunas
+        self._ordem_cronologica = None
+        self._timestamps.append(math.nan if timestamp is None else timestamp)
+
+    def timestamps(self, total: int) -> np.ndarray:
+        return np.array(self._timestamps[:total], dtype=np.float64)
+
+    def timestamp(self, posicao: int) -> float:
+        return self._timestamps[posicao] if posicao < len(self._timestamps) else math.nan
+
+    def _postings_de(self, chaves: List[str], total: int) -> np.ndarray:
+        listas = [np.array(self._postings[chave], dtype=np.int64) for chave in chaves if chave in self._postings]
+        if not listas:
+            return np.empty(0, dtype=np.int64)
+        posicoes = np.unique(np.concatenate(listas))
+        return posicoes[posicoes < total]
+
+    def _intervalo(self, desde: Optional[float], ate: Optional[float], total: int) -> np.ndarray:
+        cronologia = self._ordem_cronologica
+        if cronologia is None or len(cronologia[0]) != total:
+            # Refeita só após inclusões; NaN (sem data) fica fora da ordem e nunca cai no intervalo
+            timestamps = self.timestamps(total)
+            ordem = np.argsort(timestamps, kind='stable')
+            datados = int(np.count_nonzero(~np.isnan(timestamps)))
+            cronologia = self._ordem_cronologica = (ordem, timestamps[ordem[:datados]])
+        ordem, ordenados = cronologia
+        inicio = 0 if desde is None else np.searchsorted(ordenados, desde, side='left')
+        fim = len(ordenados) if ate is None else np.searchsorted(ordenados, ate, side='right')
+        return np.sort(ordem[inicio:fim])
+
+    def posicoes(self, filtro: Optional[FiltroBusca], total: int) -> Optional[np.ndarray]:
+        """Posições (ordenadas) que passam no filtro, entre as `total` primeiras; None = todas."""
+        if filtro is None or not filtro.restringe:
+            return None
+        total = min(total, len(self._timestamps))
+        conjuntos = []
+        if filtro.fontes:
+            conjuntos.append(self._postings_de(['fonte:' + f for f in filtro.fontes], total))
+        if filtro.tags:
+            conjuntos.append(self._postings_de(['tag:' + t for t in filtro.tags], total))
+        if filtro.desde is not None or filtro.ate is not None:
+            conjuntos.append(self._intervalo(filtro.desde, filtro.ate, total))
+
+        # Interseção começando pelo menor conjunto
+        conjuntos.sort(key=len)
+        posicoes = conjuntos[0]
+        for outro in conjuntos[1:]:
+            posicoes = np.intersect1d(posicoes, outro, assume_unique=True)
+        return posicoes
+
+
+def fator_recencia(timestamps: np.ndarray, meia_vida_dias: float, peso: float = PESO_RECENCIA,
+                   agora: Optional[float] = None) -> np.ndarray:
+    """Multiplicador do score por documento; documentos sem data ficam com 1."""
+    idade_dias = np.maximum(0.0, ((agora or time.time()) - timestamps) / SEGUNDOS_POR_DIA)
+    fator = (1.0 - peso) + peso * np.exp2(-idade_dias / meia_vida_dias)
+    return np.where(np.isnan(timestamps), 1.0, fator)
+
+
+def aplicar_recencia(ranking: List, filtro: Optional[FiltroBusca], agora: Optional[float] = None) -> List:
+    """
+    Reordena um ranking (índice de origem, posição, score) aplicando o
+    decaimento por recência aos índices que têm metadados.
+    """
+    if filtro is None or not filtro.meia_vida_dias or not ranking:
+        return ranking
+    timestamps = np.array([
+        indice.metadados.timestamp(pos) if getattr(indice, 'metadados', None) is not None else math.nan
+        for indice, pos, _ in ranking
+    ], dtype=np.float64)
+    fatores = fator_recencia(timestamps, filtro.meia_vida_dias, agora=agora)
+    ajustados = [(indice, pos, score * float(fator)) for (indice, pos, score), fator in zip(ranking, fatores)]
+    ajustados.sort(key=lambda c: c[2], reverse=True)
+    return ajustados
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+from .quantization import MODO_QUANTIZACAO, CodigosQuantizados, codigos_binarios, quantizar_int8
+from .vector_index import CAMPO_NORMALIZADO, IndiceVetorial
+
+
+# ============================================
+# ÍNDICE GLOBAL EM DISCO (MMAP)
+# ============================================
+# Cada papel (role) vira três arquivos no diretório do índice:
+#   {role}.{versao}.npy   -> matriz float32 normalizada (N x D)
+#   {role}.{versao}.json  -> sidecar com ids e textos na mesma ordem das linhas
+#   {role}.json           -> manifesto apontando para a versão atual
+#   {role}.{versao}.{int8,escalas,bits}.npy -> códigos quantizados (se SENSEI_QUANTIZACAO)
+# O manifesto é trocado com os.replace, então os workers nunca veem uma versão
+# pela metade. Todos os workers abrem a matriz com mmap_mode='r' e compartilham
+# a mesma cópia no page cache do sistema operacional.
+
+DIRETORIO_INDICE_GLOBAL = os.environ.get(
+    'SENSEI_GLOBAL_INDEX_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'global_index'),
+)
+
+# Intervalo mínimo (s) entre verificações do manifesto por papel
+INTERVALO_VERIFICACAO = float(os.environ.get('SENSEI_GLOBAL_INDEX_CHECK_SECONDS', '30'))
+
+
+def _caminho(diretorio: str, nome: str) -> str:
+    return os.path.join(diretorio, nome)
+
+
+def _escrever_atomico(caminho: str, escrever) -> None:
+    """Escreve em arquivo temporário e substitui o destino de uma vez."""
+    temporario = f"{caminho}.tmp.{os.getpid()}"
+    with open(temporario, 'wb') as f:
+        escrever(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+
+
+def ler_manifesto(role: str, diretorio: str = DIRETORIO_INDICE_GLOBAL) -> Optional[Dict]:
+    try:
+        with open(_caminho(diretorio, f"{role}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _caminhos_codigos(diretorio: str, role: str, versao: str, modo: str) -> Dict[str, str]:
+    partes = ('int8', 'escalas') if modo == 'int8' else ('bits',)
+    return {parte: _caminho(diretorio, f"{role}.{versao}.{parte}.npy") for parte in partes}
+
+
+def exportar_indice_global(db, role: str, diretorio: str = DIRETORIO_INDICE_GLOBAL,
+                           quantizacao: str = MODO_QUANTIZACAO, dimensao: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Lê global_knowledge/{role}/concepts e grava a matriz + sidecar em disco
+    (e os códigos quantizados, se configurados). Com `dimensao`, conceitos de
+    outra dimensão ficam de fora.
+    Retorna (versão, total de documentos). Se o conteúdo não mudou, nada é regravado.
+    """
+    role = role.lower()
+    os.makedirs(diretorio, exist_ok=True)
+
+    ids, textos, embeddings, normalizados = [], [], [], []
+    concepts_ref = db.collection('global_knowledge').document(role).collection('concepts')
+    for doc in concepts_ref.select(['content', 'embedding', CAMPO_NORMALIZADO]).stream():
+        data = doc.to_dict()
+        if data.get('embedding') and 'content' in data:
+            ids.append(doc.id)
+            textos.append(data['content'])
+            embeddings.append(data['embedding'])
+            normalizados.append(data.get(CAMPO_NORMALIZADO, False))
+
+    indice = IndiceVetorial.de_embeddings(ids, textos, embeddings, normalizados, dimensao=dimensao)
+    matriz = np.ascontiguousarray(indice.matriz, dtype=np.float32)
+
+    sidecar = json.dumps({'ids': indice.ids, 'textos': indice.textos}, ensure_ascii=False).encode('utf-8')
+    versao = hashlib.sha1(matriz.tobytes() + sidecar).hexdigest()[:12]
+
+    manifesto_atual = ler_manifesto(role, diretorio)
+    if manifesto_atual and manifesto_atual.get('versao') == versao:
+        return versao, len(indice)
+
+    _escrever_atomico(_caminho(diretorio, f"{role}.{versao}.npy"), lambda f: np.save(f, matriz))
+    _escrever_atomico(_caminho(diretorio, f"{role}.{versao}.json"), lambda f: f.write(sidecar))
+    if quantizacao != 'nenhuma':
+        codigos = dict(zip(('int8', 'escalas'), quantizar_int8(matriz))) if quantizacao == 'int8' \
+            else {'bits': codigos_binarios(matriz)}
+        for parte, caminho in _caminhos_codigos(diretorio, role, versao, quantizacao).items():
+            _escrever_atomico(caminho, lambda f, arranjo=codigos[parte]: np.save(f, arranjo))
+
+    manifesto = {'versao': versao, 'total': len(indice), 'dimensao': int(matriz.shape[1])}
+    _escrever_atomico(_caminho(diretorio, f"{role}.json"), lambda f: f.write(json.dumps(manifesto).encode('utf-8')))
+
+    # Mantém a versão anterior para workers que ainda estejam abrindo os arquivos
+    anteriores = {versao}
+    if manifesto_atual:
+        anteriores.add(manifesto_atual.get('versao'))
+    for nome in os.listdir(diretorio):
+        partes = nome.split('.')
+        if len(partes) in (3, 4) and partes[0] == role and partes[-1] in ('npy', 'json') and partes[1] not in anteriores:
+            os.remove(_caminho(diretorio, nome))
+
+    return versao, len(indice)
+
+
+def carregar_indice_mapeado(role: str, versao: str, diretorio: str = DIRETORIO_INDICE_GLOBAL,
+                            quantizacao: str = MODO_QUANTIZACAO) -> IndiceVetorial:
+    """
+    Abre a matriz em modo mmap (somente leitura) e o sidecar de textos.
+    Os códigos quantizados exportados também são mapeados; se faltarem, são
+    calculados a partir da matriz.
+    """
+    matriz = np.load(_caminho(diretorio, f"{role}.{versao}.npy"), mmap_mode='r')
+    with open(_caminho(diretorio, f"{role}.{versao}.json"), 'r', encoding='utf-8') as f:
+        sidecar = json.load(f)
+
+    codigos = None
+    if quantizacao != 'nenhuma':
+        caminhos = _caminhos_codigos(diretorio, role, versao, quantizacao)
+        if all(os.path.exists(caminho) for caminho in caminhos.values()):
+            arranjos = {parte: np.load(caminho, mmap_mode='r') for parte, caminho in caminhos.items()}
+            codigos = CodigosQuantizados(quantizacao, **arranjos)
+    return IndiceVetorial(sidecar['ids'], sidecar['textos'], matriz, quantizacao, codigos)
+
+
+class IndicesGlobaisMapeados:
+    """
+    Mantém, por processo, o índice mapeado de cada papel e troca a referência
+    quando a versão do manifesto muda. Leitores em andamento continuam usando
+    o índice antigo até terminarem.
+    """
+
+    def __init__(self, diretorio: str = DIRETORIO_INDICE_GLOBAL, intervalo: float = INTERVALO_VERIFICACAO):
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self._indices: Dict[str, Tuple[str, IndiceVetorial]] = {}
+        self._verificado_em: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def obter(self, role: str) -> Optional[IndiceVetorial]:
+        role = role.lower()
+        agora = time.monotonic()
+        atual = self._indices.get(role)
+        if atual is not None and agora - self._verificado_em.get(role, 0) < self.intervalo:
+            return atual[1]
+
+        with self._lock:
+            self._verificado_em[role] = agora
+            manifesto = ler_manifesto(role, self.diretorio)
+            if manifesto is None:
+                return atual[1] if atual else None
+
+            atual = self._indices.get(role)
+            if atual is not None and atual[0] == manifesto['versao']:
+                return atual[1]
+
+            try:
+                indice = carregar_indice_mapeado(role, manifesto['versao'], self.diretorio)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Falha ao abrir índice global '{role}' v{manifesto['versao']}: {e}")
+                return atual[1] if atual else None
+
+            print(f"🗺️ Índice global '{role}' carregado via mmap (v{manifesto['versao']} | {len(indice)} docs)")
+            self._indices[role] = (manifesto['versao'], indice)
+            return indice
+
+
+indices_globais = IndicesGlobaisMapeados()
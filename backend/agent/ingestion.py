@@ -0,0 +1,185 @@
+import codecs
+import os
+import traceback
+import uuid
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from .chunking import SOBREPOSICAO_CHUNK, TAMANHO_CHUNK, dividir_em_chunks
+from .embedding_cache import hash_conteudo
+from .filtros import CAMPO_FONTE
+from . import utils
+from .utils import documento_contexto, gerar_embeddings_documentos
+from .vector_index import normalizar_embedding
+from .vector_store import LOTE_FIRESTORE_MAX_ESCRITAS, escopo_usuario
+
+
+# ============================================
+# INGESTÃO DE ARQUIVOS EM FLUXO
+# ============================================
+# O arquivo é lido em blocos (texto) ou página a página (PDF); o texto passa
+# por um chunker incremental e, a cada LOTE_INGESTAO_CHUNKS chunks, sai um
+# batchEmbedContents e uma gravação em lote no armazém vetorial. Memória
+# usada: ~um lote de chunks, independente do tamanho do arquivo. Cada janela
+# de CHUNKS_POR_PAI chunks consecutivos compartilha um contexto_pai
+# ("<id do arquivo>-<janela>"), então a busca reagrupa trechos vizinhos sem
+# juntar num só contexto os vencedores espalhados por um arquivo grande.
+
+EXTENSOES_TEXTO = ('.txt', '.md', '.markdown')
+EXTENSOES_PDF = ('.pdf',)
+
+UPLOAD_MAX_BYTES = int(os.environ.get('SENSEI_UPLOAD_MAX_MB', '50')) * 1024 * 1024
+# Mesmo valor de Context.Source.UPLOAD: filtra os trechos vindos de arquivos
+FONTE_UPLOAD = 'upload'
+
+LOTE_INGESTAO_CHUNKS = min(
+    int(os.environ.get('SENSEI_INGESTAO_LOTE', '100')), LOTE_FIRESTORE_MAX_ESCRITAS
+)
+TAMANHO_BLOCO_LEITURA = 64 * 1024
+CHUNKS_POR_PAI = max(1, int(os.environ.get('SENSEI_INGESTAO_CHUNKS_POR_PAI', '8')))
+
+
+class FormatoNaoSuportado(Exception):
+    pass
+
+
+def ler_texto_em_blocos(arquivo, tamanho_bloco: int = TAMANHO_BLOCO_LEITURA) -> Iterator[str]:
+    """Decodifica o upload em UTF-8 bloco a bloco (caracteres partidos entre blocos são preservados)."""
+    decodificador = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    for bloco in arquivo.chunks(tamanho_bloco):
+        texto = decodificador.decode(bloco)
+        if texto:
+            yield texto
+    final = decodificador.decode(b'', final=True)
+    if final:
+        yield final
+
+
+def ler_pdf_em_paginas(arquivo) -> Iterator[str]:
+    """Extrai o texto página a página; pypdf só é importado quando chega um PDF."""
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise FormatoNaoSuportado("Suporte a PDF indisponível: instale o pacote 'pypdf'.") from e
+
+    for pagina in PdfReader(arquivo).pages:
+        texto = pagina.extract_text() or ''
+        if texto.strip():
+            yield texto + "\n\n"
+
+
+def blocos_do_arquivo(arquivo, nome: str) -> Iterator[str]:
+    extensao = os.path.splitext(nome.lower())[1]
+    if extensao in EXTENSOES_TEXTO:
+        return ler_texto_em_blocos(arquivo)
+    if extensao in EXTENSOES_PDF:
+        return ler_pdf_em_paginas(arquivo)
+    raise FormatoNaoSuportado(
+        f"Formato '{extensao or nome}' não suportado. Use {', '.join(EXTENSOES_TEXTO + EXTENSOES_PDF)}."
+    )
+
+
+def chunks_em_fluxo(blocos: Iterable[str], tamanho: int = TAMANHO_CHUNK,
+                    sobreposicao: int = SOBREPOSICAO_CHUNK) -> Iterator[Tuple[int, str]]:
+    """
+    Chunker incremental: acumula blocos e emite (posição no arquivo, chunk)
+    assim que há texto suficiente. O último chunk de cada rodada fica no buffer,
+    pois ainda pode crescer com o próximo bloco.
+    """
+    buffer = ''
+    base = 0
+    for bloco in blocos:
+        buffer += bloco
+        if len(buffer) < 4 * tamanho:
+            continue
+        chunks = dividir_em_chunks(buffer, tamanho, sobreposicao)
+        if not chunks:
+            # Janela só com espaços em branco (ex.: região longa vazia): nada a emitir
+            base += len(buffer)
+            buffer = ''
+            continue
+        for inicio, chunk in chunks[:-1]:
+            yield base + inicio, chunk
+        corte = chunks[-1][0]
+        buffer = buffer[corte:]
+        base += corte
+
+    for inicio, chunk in dividir_em_chunks(buffer, tamanho, sobreposicao):
+        yield base + inicio, chunk
+
+
+def pai_da_janela(contexto_pai: str, indice: int) -> str:
+    """contexto_pai do chunk: um por janela de CHUNKS_POR_PAI chunks do arquivo."""
+    return f"{contexto_pai}-{indice // CHUNKS_POR_PAI}"
+
+
+def _gravar_lote(escopo: str, contexto_pai: str, lote: List[Tuple[int, int, str]],
+                 vistos: Set[str]) -> Tuple[int, int, int]:
+    """
+    Embeddings + uma gravação em lote de (índice, posição, chunk). Chunks já
+    salvos pelo usuário (mesmo hash de conteúdo, como em
+    salvar_contextos_usuario_em_lote) ou repetidos no arquivo não são embedados
+    de novo: reenviar o mesmo arquivo não duplica trechos.
+    Retorna (gravados, falhas, repetidos).
+    """
+    hashes = [hash_conteudo(chunk) for _, _, chunk in lote]
+    ja_salvos = utils.hashes_ja_salvos(escopo, [h for h in hashes if h not in vistos])
+    novos = []
+    for item, hash_chunk in zip(lote, hashes):
+        if hash_chunk not in vistos and hash_chunk not in ja_salvos:
+            novos.append((item, hash_chunk))
+        vistos.add(hash_chunk)
+    if not novos:
+        return 0, 0, len(lote)
+
+    embeddings = gerar_embeddings_documentos([chunk for (_, _, chunk), _ in novos])
+    documentos = [
+        {**documento_contexto(chunk, normalizar_embedding(embedding), pai_da_janela(contexto_pai, indice),
+                            indice, inicio, hash_chunk),
+         CAMPO_FONTE: FONTE_UPLOAD}
+        for ((indice, inicio, chunk), hash_chunk), embedding in zip(novos, embeddings) if embedding is not None
+    ]
+    if documentos:
+        utils.armazem_vetorial.adicionar_varios(escopo, documentos)
+    return len(documentos), len(novos) - len(documentos), len(lote) - len(novos)
+
+
+def _somar(estado: Dict, resultado: Tuple[int, int, int]) -> None:
+    for chave, valor in zip(('gravados', 'falhas', 'repetidos'), resultado):
+        estado[chave] += valor
+
+
+def ingerir_arquivo(user_id: str, arquivo, nome: str) -> Iterator[Dict]:
+    """
+    Processa o upload e emite eventos de progresso:
+    {"evento": "progresso" | "concluido" | "erro", "chunks", "gravados", "falhas", "repetidos", ...}
+    """
+    contexto_pai = uuid.uuid4().hex
+    estado = {'arquivo': nome, 'contexto_pai': contexto_pai, 'chunks': 0, 'gravados': 0, 'falhas': 0, 'repetidos': 0}
+    print(f"\n--- INICIANDO ingerir_arquivo ({nome} | User: {user_id}) ---")
+
+    try:
+        blocos = blocos_do_arquivo(arquivo, nome)
+        escopo = escopo_usuario(user_id)
+
+        lote: List[Tuple[int, int, str]] = []
+        vistos: Set[str] = set()
+        for inicio, chunk in chunks_em_fluxo(blocos):
+            lote.append((estado['chunks'], inicio, chunk))
+            estado['chunks'] += 1
+            if len(lote) >= LOTE_INGESTAO_CHUNKS:
+                _somar(estado, _gravar_lote(escopo, contexto_pai, lote, vistos))
+                lote = []
+                yield {'evento': 'progresso', **estado}
+
+        if lote:
+            _somar(estado, _gravar_lote(escopo, contexto_pai, lote, vistos))
+
+    except Exception as e:
+        print(f"❌ Erro em ingerir_arquivo: {e}")
+        traceback.print_exc()
+        yield {'evento': 'erro', 'erro': str(e), **estado}
+        return
+
+    print(f"LOG: ✅ {nome}: {estado['gravados']}/{estado['chunks']} chunks gravados "
+          f"({estado['repetidos']} já salvos) para o user_id: {user_id}")
+    yield {'evento': 'concluido', **estado}
@@ -0,0 +1,199 @@
+import math
+import os
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+
+from .filtros import FiltroBusca, MetadadosIndice
+from .vector_index import CacheIndicesUsuario, selecionar_top_k
+
+
+# ============================================
+# ÍNDICE LÉXICO (BM25) E FUSÃO POR RRF
+# ============================================
+# Índice invertido por escopo (contextos do usuário ou conceitos de um papel),
+# mantido em memória no mesmo esquema de cache do índice vetorial e atualizado
+# incrementalmente a cada contexto salvo. Serve a dois propósitos:
+#   1. Busca híbrida: o ranking BM25 é fundido ao vetorial por Reciprocal Rank
+#      Fusion (RRF), o que ajuda em perguntas com termos exatos (siglas, nomes).
+#   2. Fallback: se o embedding da pergunta falhar (cota do Gemini esgotada),
+#      a busca continua só com o BM25 em vez de responder sem contexto.
+#
+# Montar o índice exige ler o texto de todos os documentos do escopo, então
+# isso nunca acontece no caminho da requisição da busca híbrida: sem índice em
+# cache, a pergunta usa só o ranking vetorial e a montagem é agendada em segundo
+# plano, apenas para coleções de até LIMITE_DOCS_HIBRIDA documentos. Só o
+# fallback (sem embedding) monta o índice na hora, por não ter alternativa.
+
+BUSCA_HIBRIDA = os.environ.get('SENSEI_BUSCA_HIBRIDA', '1') == '1'
+# Coleções maiores ficam só com o ranking vetorial (o BM25 custaria ler todos os textos)
+LIMITE_DOCS_HIBRIDA = int(os.environ.get('SENSEI_BUSCA_HIBRIDA_MAX_DOCS', '2000'))
+# Candidatos de cada ranking que entram na fusão
+CANDIDATOS_RRF = int(os.environ.get('SENSEI_RRF_CANDIDATOS', '20'))
+# Constante do RRF: 1 / (k + posição); 60 é o valor do artigo original
+K_RRF = int(os.environ.get('SENSEI_RRF_K', '60'))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_PALAVRA = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e ela ele em entre era essa esse esta este eu foi ha isso ja la lhe mais mas
+me mesmo meu minha muito na nao nas nem no nos o os ou para pela pelas pelo pelos por qual quando que quem se sem
+ser seu sua suas seus so sobre tambem te tem um uma umas uns voce
+an and are as at be by for from how in is it of on or that the this to was what when where which who why with
+""".split())
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Minúsculas, sem acentos, sem stopwords e sem tokens de um caractere."""
+    sem_acentos = unicodedata.normalize('NFKD', texto.casefold())
+    sem_acentos = "".join(c for c in sem_acentos if not unicodedata.combining(c))
+    return [t for t in _PALAVRA.findall(sem_acentos) if len(t) > 1 and t not in STOPWORDS]
+
+
+class IndiceLexico:
+    """
+    Índice invertido com pontuação BM25. Cada termo guarda as posições dos
+    documentos e as frequências em arrays compactos; `ids`/`textos` seguem a
+    mesma convenção do IndiceVetorial, então os dois rankings podem ser
+    misturados e resolvidos pela mesma fase 2 (trechos_vencedores). Também
+    como ele, `metadados` (índices privados) permite filtrar antes de pontuar.
+    """
+
+    def __init__(self, textos: Optional[List[str]] = None, metadados: Optional[MetadadosIndice] = None):
+        self.ids: List[str] = []
+        self._ids_conhecidos = set()
+        self.textos = textos
+        self.metadados = metadados
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._comprimentos = array('I')
+        self._total_tokens = 0
+        self._bytes_postings = 0
+
+    @classmethod
+    def de_textos(cls, ids: List[str], textos: List[str], guardar_textos: bool = False,
+                  metadados: Optional[Sequence[Dict]] = None) -> 'IndiceLexico':
+        """Monta o índice; com `guardar_textos`, os textos ficam disponíveis para a fase 2."""
+        indice = cls(textos=list(textos) if guardar_textos else None,
+                     metadados=None if metadados is None else MetadadosIndice.de_documentos(metadados))
+        for doc_id, texto in zip(ids, textos):
+            indice._indexar(doc_id, texto)
+        return indice
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Estimativa: arrays de postings + ids (textos guardados não são copiados)."""
+        total = self._bytes_postings + self._comprimentos.itemsize * len(self._comprimentos) + 64 * len(self.ids)
+        return total + (self.metadados.nbytes if self.metadados is not None else 0)
+
+    def _indexar(self, doc_id: str, texto: str) -> None:
+        posicao = len(self.ids)
+        termos = Counter(tokenizar(texto))
+        for termo, frequencia in termos.items():
+            postings = self._postings.get(termo)
+            if postings is None:
+                postings = self._postings[termo] = (array('I'), array('H'))
+                self._bytes_postings += 100 + len(termo)
+            postings[0].append(posicao)
+            postings[1].append(min(frequencia, 65535))
+            self._bytes_postings += 6
+        self.ids.append(doc_id)
+        self._ids_conhecidos.add(doc_id)
+        comprimento = sum(termos.values())
+        self._comprimentos.append(comprimento)
+        self._total_tokens += comprimento
+
+    def anexar(self, doc_id: str, texto: Optional[str], embedding: Sequence[float] = (),
+               metadados: Optional[Dict] = None) -> bool:
+        """Mesma assinatura do IndiceVetorial.anexar, para o CacheIndicesUsuario (False se o id já existe)."""
+        if doc_id in self._ids_conhecidos:
+            return False
+        if self.textos is not None:
+            self.textos.append(texto or '')
+        if self.metadados is not None:
+            self.metadados.anexar(metadados)
+        self._indexar(doc_id, texto or '')
+        return True
+
+    def buscar(self, query: str, top_k: int, posicoes_filtro: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Posições e scores BM25 dos top_k documentos com algum termo da query;
+        com `posicoes_filtro`, só os postings dessas posições são pontuados.
+        """
+        total = len(self.ids)
+        termos = [t for t in dict.fromkeys(tokenizar(query)) if t in self._postings]
+        if not total or not termos:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        comprimentos = np.array(self._comprimentos[:total], dtype=np.float32)
+        normalizacao = BM25_K1 * (1 - BM25_B + BM25_B * comprimentos / max(self._total_tokens / total, 1e-9))
+        scores = np.zeros(total, dtype=np.float32)
+        permitidas = None
+        if posicoes_filtro is not None:
+            permitidas = np.zeros(total, dtype=bool)
+            permitidas[posicoes_filtro[posicoes_filtro < total]] = True
+        for termo in termos:
+            # Cópias (não views): anexar pode crescer os arrays em outra thread; posições
+            # além de `total` são de documentos anexados depois do início da busca
+            posicoes = np.array(self._postings[termo][0], dtype=np.int64)
+            frequencias = np.array(self._postings[termo][1], dtype=np.float32)
+            posicoes, frequencias = posicoes[posicoes < total], frequencias[posicoes < total]
+            # O idf usa a coleção inteira: o filtro não muda o peso de um termo
+            idf = math.log(1 + (total - len(posicoes) + 0.5) / (len(posicoes) + 0.5))
+            if permitidas is not None:
+                mantidas = permitidas[posicoes]
+                posicoes, frequencias = posicoes[mantidas], frequencias[mantidas]
+            scores[posicoes] += idf * frequencias * (BM25_K1 + 1) / (frequencias + normalizacao[posicoes])
+
+        encontrados = np.flatnonzero(scores > 0)
+        ordem, melhores = selecionar_top_k(scores[encontrados], top_k)
+        return encontrados[ordem], melhores
+
+
+def ranquear_lexico(query: str, indices: List[IndiceLexico], top_k: int,
+                    filtro: Optional[FiltroBusca] = None) -> List[Tuple[IndiceLexico, int, float]]:
+    """Equivalente léxico de ranquear_indices: (índice de origem, posição, score BM25)."""
+    candidatos = []
+    for indice in indices:
+        filtradas = indice.metadados.posicoes(filtro, len(indice)) if indice.metadados is not None else None
+        if filtradas is not None and len(filtradas) == 0:
+            continue
+        posicoes, scores = indice.buscar(query, top_k, filtradas)
+        candidatos.extend((indice, int(p), float(s)) for p, s in zip(posicoes, scores))
+    candidatos.sort(key=lambda c: c[2], reverse=True)
+    return candidatos[:top_k]
+
+
+def fundir_rrf(rankings: Sequence[Sequence[Tuple[object, int, float]]], escopos_por_indice: Dict[int, str],
+               top_k: int, k: int = K_RRF) -> List[Tuple[object, int, float]]:
+    """
+    Reciprocal Rank Fusion: cada documento soma 1 / (k + posição) em cada
+    ranking em que aparece. Documentos são identificados por (escopo, doc_id),
+    então o mesmo contexto vindo do índice vetorial e do léxico conta uma vez.
+    Devolve (índice de origem, posição, score RRF) no formato de ranquear_indices.
+    """
+    fundidos: Dict[Hashable, List] = {}
+    for ranking in rankings:
+        for posicao_ranking, (indice, pos, _) in enumerate(ranking):
+            chave = (escopos_por_indice[id(indice)], indice.ids[pos])
+            if chave not in fundidos:
+                fundidos[chave] = [indice, pos, 0.0]
+            fundidos[chave][2] += 1.0 / (k + posicao_ranking + 1)
+    melhores = sorted(fundidos.values(), key=lambda item: item[2], reverse=True)[:top_k]
+    return [(indice, pos, score) for indice, pos, score in melhores]
+
+
+# Cache dos índices léxicos por escopo (cada worker do gunicorn tem o seu). Escritas
+# locais são anexadas; o TTL, mais longo que o do vetorial, só traz as de outros
+# workers, que até lá continuam encontráveis pelo ranking vetorial.
+cache_indices_lexicos = CacheIndicesUsuario(
+    max_bytes=int(os.environ.get('SENSEI_LEXICO_CACHE_MAX_MB', '64')) * 1024 * 1024,
+    ttl=float(os.environ.get('SENSEI_LEXICO_CACHE_TTL', '1800')),
+)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from agent.global_index import DIRETORIO_INDICE_GLOBAL, exportar_indice_global
+from agent.utils import init_firebase
+from agent.vector_index import DIMENSAO_EMBEDDING
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta global_knowledge/{role}/concepts para matrizes .npy + sidecar de textos, "
+        "que os workers do gunicorn abrem via mmap. Sem --roles, exporta todos os papéis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--roles', nargs='*', help='Papéis a exportar (padrão: todos).')
+        parser.add_argument('--diretorio', default=DIRETORIO_INDICE_GLOBAL)
+
+    def handle(self, *args, **options):
+        try:
+            db = init_firebase()
+            roles = options['roles'] or [ref.id for ref in db.collection('global_knowledge').list_documents()]
+        except Exception as e:
+            raise CommandError(f"Falha ao acessar o Firestore: {e}")
+
+        for role in roles:
+            versao, total = exportar_indice_global(db, role, options['diretorio'], dimensao=DIMENSAO_EMBEDDING)
+            self.stdout.write(f"🗺️ {role}: v{versao} ({total} conceitos)")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Índice global gravado em {options['diretorio']}"))
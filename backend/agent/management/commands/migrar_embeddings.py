@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+
+from agent.utils import init_firebase
+from agent.vector_index import CAMPO_NORMALIZADO, normalizar_embedding
+
+# Limite do Firestore é de 500 escritas por WriteBatch
+LOTE_MAXIMO = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Regrava os embeddings existentes no Firestore normalizados (L2) em float32, "
+        "marcando o documento com 'embedding_normalizado'. Pode ser executado mais de uma vez."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=400, help='Documentos por WriteBatch (máx. 500).')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas conta o que seria migrado.')
+
+    def handle(self, *args, **options):
+        self.lote = min(options['lote'], LOTE_MAXIMO)
+        self.dry_run = options['dry_run']
+        db = init_firebase()
+
+        total = 0
+        for user_ref in db.collection('users').list_documents():
+            total += self.migrar_collection(db, user_ref.collection('inteligencia_critica'), f"users/{user_ref.id}")
+
+        for role_ref in db.collection('global_knowledge').list_documents():
+            total += self.migrar_collection(db, role_ref.collection('concepts'), f"global_knowledge/{role_ref.id}")
+
+        acao = "seriam migrados" if self.dry_run else "migrados"
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} documentos {acao}."))
+
+    def migrar_collection(self, db, collection_ref, rotulo: str) -> int:
+        """Normaliza os documentos ainda sem a flag, gravando em lotes."""
+        batch = db.batch()
+        pendentes = 0
+        migrados = 0
+
+        for doc in collection_ref.select(['embedding', CAMPO_NORMALIZADO]).stream():
+            data = doc.to_dict()
+            if not data.get('embedding') or data.get(CAMPO_NORMALIZADO):
+                continue
+
+            migrados += 1
+            if self.dry_run:
+                continue
+
+            batch.update(doc.reference, {
+                'embedding': normalizar_embedding(data['embedding']),
+                CAMPO_NORMALIZADO: True,
+            })
+            pendentes += 1
+            if pendentes >= self.lote:
+                batch.commit()
+                batch = db.batch()
+                pendentes = 0
+
+        if pendentes:
+            batch.commit()
+
+        if migrados:
+            self.stdout.write(f"📦 {rotulo}: {migrados} documentos")
+        return migrados
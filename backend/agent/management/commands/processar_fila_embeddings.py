@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from agent.fila_embeddings import FILA_LOTE, FilaEmbeddings, processar_pendentes
+
+
+class Command(BaseCommand):
+    help = (
+        "Consome a fila de embeddings (contextos 'pending') em primeiro plano. Útil com "
+        "SENSEI_FILA_THREAD=0, para tirar o trabalho dos workers do gunicorn."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true', help='Processa os itens vencidos e sai.')
+
+    def handle(self, *args, **options):
+        if not options['uma_vez']:
+            self.stdout.write("🧵 Consumindo a fila de embeddings (Ctrl+C para sair)...")
+            FilaEmbeddings(habilitada=True).executar()
+            return
+
+        total = 0
+        while True:
+            processados = processar_pendentes()
+            total += processados
+            if processados < FILA_LOTE:
+                break
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} contextos processados."))
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from agent import utils
+from agent.vector_index import DIMENSAO_EMBEDDING, normalizar_embedding
+
+# Textos por rodada de embeddings + gravação (batchEmbedContents aceita 100 por chamada)
+LOTE_MAXIMO = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Regera, com a dimensão configurada em SENSEI_EMBEDDING_DIM, os embeddings gravados com outra "
+        "dimensão. Até a migração terminar, esses documentos ficam fora da busca. Pode ser executado "
+        "mais de uma vez."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escopos', nargs='*', help='Ex.: users/<id> global_knowledge/<role> (padrão: todos).')
+        parser.add_argument('--lote', type=int, default=100, help=f'Documentos por rodada (máx. {LOTE_MAXIMO}).')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas conta o que seria regerado.')
+
+    def handle(self, *args, **options):
+        armazem = utils.armazem_vetorial
+        lote = max(1, min(options['lote'], LOTE_MAXIMO))
+        try:
+            escopos = options['escopos'] or armazem.escopos()
+        except Exception as e:
+            raise CommandError(f"Falha ao listar os escopos do armazém vetorial: {e}")
+
+        total, falhas = 0, 0
+        for escopo in escopos:
+            documentos = armazem.documentos_fora_da_dimensao(escopo, DIMENSAO_EMBEDDING)
+            if not documentos:
+                continue
+            self.stdout.write(f"📦 {escopo}: {len(documentos)} documentos")
+            if options['dry_run']:
+                total += len(documentos)
+                continue
+
+            for inicio in range(0, len(documentos), lote):
+                bloco = documentos[inicio:inicio + lote]
+                try:
+                    embeddings = utils.gerar_embeddings_em_lote([texto for _, texto in bloco])
+                except Exception as e:
+                    raise CommandError(f"Falha ao gerar embeddings ({escopo}): {e}")
+
+                novos = {
+                    doc_id: normalizar_embedding(embedding)
+                    for (doc_id, _), embedding in zip(bloco, embeddings) if embedding is not None
+                }
+                if novos:
+                    armazem.atualizar_embeddings(escopo, novos)
+                total += len(novos)
+                falhas += len(bloco) - len(novos)
+
+        acao = "seriam regerados" if options['dry_run'] else "regerados"
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} documentos {acao} para {DIMENSAO_EMBEDDING} dimensões."))
+        if falhas:
+            self.stdout.write(self.style.WARNING(f"⚠️ {falhas} documentos falharam; execute o comando novamente."))
+        if total and not options['dry_run']:
+            self.stdout.write("ℹ️ Atualize o índice global em disco com: manage.py construir_indice_global")
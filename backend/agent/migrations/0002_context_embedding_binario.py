@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+from django.db import migrations, models
+
+
+def json_para_float32(apps, schema_editor):
+    Context = apps.get_model('agent', 'Context')
+    atualizados = []
+    for context in Context.objects.exclude(embedding__isnull=True).exclude(embedding='').only('id', 'embedding').iterator():
+        context.embedding_binario = np.asarray(json.loads(context.embedding), dtype=np.float32).tobytes()
+        atualizados.append(context)
+        if len(atualizados) >= 500:
+            Context.objects.bulk_update(atualizados, ['embedding_binario'])
+            atualizados = []
+    Context.objects.bulk_update(atualizados, ['embedding_binario'])
+
+
+def float32_para_json(apps, schema_editor):
+    Context = apps.get_model('agent', 'Context')
+    atualizados = []
+    for context in Context.objects.exclude(embedding_binario__isnull=True).only('id', 'embedding_binario').iterator():
+        context.embedding = json.dumps(np.frombuffer(context.embedding_binario, dtype=np.float32).tolist())
+        atualizados.append(context)
+        if len(atualizados) >= 500:
+            Context.objects.bulk_update(atualizados, ['embedding'])
+            atualizados = []
+    Context.objects.bulk_update(atualizados, ['embedding'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='context',
+            name='embedding_binario',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(json_para_float32, float32_para_json),
+        migrations.RemoveField(
+            model_name='context',
+            name='embedding',
+        ),
+        migrations.RenameField(
+            model_name='context',
+            old_name='embedding_binario',
+            new_name='embedding',
+        ),
+    ]
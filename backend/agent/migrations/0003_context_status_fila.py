@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0002_context_embedding_binario'),
+    ]
+
+    operations = [
+        # Contextos existentes foram gravados de forma síncrona: já estão prontos
+        migrations.AddField(
+            model_name='context',
+            name='status',
+            field=models.CharField(
+                choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')],
+                default='ready', max_length=10,
+            ),
+        ),
+        migrations.AlterField(
+            model_name='context',
+            name='status',
+            field=models.CharField(
+                choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')],
+                default='pending', max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name='context',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='context',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='context',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddIndex(
+            model_name='context',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='context_fila_idx'),
+        ),
+    ]
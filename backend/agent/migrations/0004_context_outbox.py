@@ -0,0 +1,49 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def pendentes_para_outbox(apps, schema_editor):
+    Context = apps.get_model('agent', 'Context')
+    ContextOutbox = apps.get_model('agent', 'ContextOutbox')
+    ContextOutbox.objects.bulk_create([
+        ContextOutbox(context_id=context_id, next_attempt_at=proxima or django.utils.timezone.now())
+        for context_id, proxima in Context.objects.filter(status='pending').values_list('id', 'next_attempt_at')
+    ], batch_size=500)
+
+
+def outbox_para_pendentes(apps, schema_editor):
+    Context = apps.get_model('agent', 'Context')
+    ContextOutbox = apps.get_model('agent', 'ContextOutbox')
+    for item in ContextOutbox.objects.all().iterator():
+        Context.objects.filter(pk=item.context_id).update(next_attempt_at=item.next_attempt_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0003_context_status_fila'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContextOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('context', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='agent.context',
+                )),
+            ],
+        ),
+        migrations.RunPython(pendentes_para_outbox, outbox_para_pendentes),
+        migrations.RemoveIndex(
+            model_name='context',
+            name='context_fila_idx',
+        ),
+        migrations.RemoveField(
+            model_name='context',
+            name='next_attempt_at',
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0004_context_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='context',
+            name='source',
+            field=models.CharField(
+                choices=[('manual', 'Manual'), ('bulk', 'Bulk'), ('upload', 'Upload')],
+                default='manual', max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name='context',
+            name='tags',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
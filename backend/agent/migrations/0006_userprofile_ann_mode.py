@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0005_context_source_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='ann_mode',
+            field=models.CharField(
+                choices=[('auto', 'Auto'), ('sempre', 'Always'), ('nunca', 'Never')],
+                default='auto', max_length=10,
+            ),
+        ),
+    ]
@@ -1,30 +1,71 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
-import json # Import json for manual serialization/deserialization
+import numpy as np
 
 
 class UserProfile(models.Model):
+    class AnnMode(models.TextChoices):
+        # Mesmos valores de ann.MODO_ANN_*: busca aproximada (IVF) no índice privado
+        AUTO = 'auto'
+        ALWAYS = 'sempre'
+        NEVER = 'nunca'
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     groq_api_key = models.CharField(max_length=255, blank=True, null=True)
     google_api_key = models.CharField(max_length=255, blank=True, null=True)
+    ann_mode = models.CharField(max_length=10, choices=AnnMode.choices, default=AnnMode.AUTO)
 
     def __str__(self):
         return self.user.username
 
 
 class Context(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        READY = 'ready'
+        FAILED = 'failed'
+
+    class Source(models.TextChoices):
+        MANUAL = 'manual'
+        BULK = 'bulk'
+        UPLOAD = 'upload'
+
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
     text = models.TextField()
-    # Storing embedding as a TextField for SQLite compatibility
-    embedding = models.TextField(blank=True, null=True)
+    # float32 contíguo (4 bytes por dimensão); lido sem cópia com np.frombuffer
+    embedding = models.BinaryField(blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Metadados replicados no armazém vetorial e usados como filtros de busca
+    source = models.CharField(max_length=10, choices=Source.choices, default=Source.MANUAL)
+    tags = models.JSONField(default=list, blank=True)
+
+    # Estado da sincronização com o armazém vetorial (ver ContextOutbox)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
 
     def set_embedding(self, data):
-        self.embedding = json.dumps(data)
+        self.embedding = np.asarray(data, dtype=np.float32).tobytes()
 
     def get_embedding(self):
-        return json.loads(self.embedding) if self.embedding else None
+        # Visão somente leitura sobre os bytes do banco (bytes ou memoryview, conforme o backend)
+        return np.frombuffer(self.embedding, dtype=np.float32) if self.embedding else None
 
     def __str__(self):
         return f"Context for {self.user_profile.user.username}: {self.text[:50]}..."
 
+
+class ContextOutbox(models.Model):
+    """
+    Outbox transacional: gravado na mesma transação que o Context e consumido
+    pela fila (agent/fila_embeddings.py), que replica o contexto no armazém
+    vetorial e apaga o item. next_attempt_at marca quando o item pode ser
+    (re)tentado e também serve de reserva enquanto um worker o processa.
+    """
+    context = models.ForeignKey(Context, on_delete=models.CASCADE, related_name='outbox')
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Outbox do contexto {self.context_id}"
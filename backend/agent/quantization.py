@@ -0,0 +1,123 @@
+import os
+from typing import Optional, Tuple
+import numpy as np
+
+
+# ============================================
+# QUANTIZAÇÃO DE EMBEDDINGS (INT8 E BINÁRIA)
+# ============================================
+# Com SENSEI_QUANTIZACAO ligado, a varredura de um índice passa a ler só
+# códigos compactos e apenas os candidatos são reescorados com o float32:
+#   int8    -> 1 byte por dimensão (4x menor); pré-seleciona top_k * FATOR_RESCORE
+#   binaria -> 1 bit por dimensão (32x menor), distância de Hamming;
+#              pré-seleciona top_k * FATOR_BINARIO
+# A matriz float32 continua existindo, mas fora da memória anônima do
+# processo (arquivo mapeado), e só as linhas candidatas são lidas.
+
+MODOS_QUANTIZACAO = ('nenhuma', 'int8', 'binaria')
+MODO_QUANTIZACAO = os.environ.get('SENSEI_QUANTIZACAO', 'nenhuma').lower()
+FATOR_RESCORE = int(os.environ.get('SENSEI_QUANT_FATOR_RESCORE', '4'))
+FATOR_BINARIO = int(os.environ.get('SENSEI_QUANT_FATOR_BINARIO', '20'))
+
+# Linhas convertidas por vez na varredura (limita os temporários a ~BLOCO x D)
+_BLOCO_VARREDURA = 4096
+
+# Número de bits 1 de cada byte, para a contagem de Hamming
+_BITS_POR_BYTE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+
+def quantizar_int8(matriz: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantização escalar por linha: (códigos int8 N x D, escalas float32 N)."""
+    maximos = np.abs(matriz).max(axis=1) if matriz.shape[1] else np.zeros(matriz.shape[0], dtype=np.float32)
+    escalas = (maximos / 127.0).astype(np.float32)
+    escalas[escalas == 0] = 1.0
+    codigos = np.rint(matriz / escalas[:, None]).astype(np.int8)
+    return codigos, escalas
+
+
+def codigos_binarios(matriz: np.ndarray) -> np.ndarray:
+    """Um bit por dimensão (sinal), empacotado em bytes: N x ceil(D / 8)."""
+    return np.packbits(matriz > 0, axis=1)
+
+
+def distancias_hamming(codigos: np.ndarray, codigo_query: np.ndarray) -> np.ndarray:
+    return _BITS_POR_BYTE[np.bitwise_xor(codigos, codigo_query)].sum(axis=1)
+
+
+def _menores(valores: np.ndarray, n: int) -> np.ndarray:
+    """Posições dos n menores valores (sem ordenar)."""
+    if n >= valores.shape[0]:
+        return np.arange(valores.shape[0])
+    return np.argpartition(valores, n - 1)[:n]
+
+
+class CodigosQuantizados:
+    """
+    Códigos compactos das linhas de uma matriz normalizada. Podem ser
+    calculados na hora ou recebidos prontos (ex.: arquivos .npy mapeados).
+    """
+
+    def __init__(self, modo: str, int8: Optional[np.ndarray] = None, escalas: Optional[np.ndarray] = None,
+                 bits: Optional[np.ndarray] = None):
+        if modo not in MODOS_QUANTIZACAO[1:]:
+            raise ValueError(f"Quantização inválida: '{modo}' (use {', '.join(MODOS_QUANTIZACAO)}).")
+        self.modo = modo
+        self._int8, self._escalas, self._bits = int8, escalas, bits
+        self._tamanho = (int8 if modo == 'int8' else bits).shape[0]
+
+    @classmethod
+    def de_matriz(cls, modo: str, matriz: np.ndarray) -> 'CodigosQuantizados':
+        if modo == 'int8':
+            int8, escalas = quantizar_int8(matriz)
+            return cls(modo, int8=int8, escalas=escalas)
+        return cls(modo, bits=codigos_binarios(matriz))
+
+    def __len__(self) -> int:
+        return self._tamanho
+
+    @property
+    def nbytes(self) -> int:
+        if self.modo == 'int8':
+            return int(self._int8[:self._tamanho].nbytes + self._escalas[:self._tamanho].nbytes)
+        return int(self._bits[:self._tamanho].nbytes)
+
+    def anexar(self, vetor: np.ndarray) -> None:
+        """Acrescenta uma linha (capacidade dobra quando necessário)."""
+        linha = vetor[None, :]
+        if self.modo == 'int8':
+            int8, escala = quantizar_int8(linha)
+            self._int8 = self._garantir_capacidade(self._int8)
+            self._escalas = self._garantir_capacidade(self._escalas)
+            self._int8[self._tamanho] = int8[0]
+            self._escalas[self._tamanho] = escala[0]
+        else:
+            self._bits = self._garantir_capacidade(self._bits)
+            self._bits[self._tamanho] = codigos_binarios(linha)[0]
+        self._tamanho += 1
+
+    def _garantir_capacidade(self, arranjo: np.ndarray) -> np.ndarray:
+        if self._tamanho < arranjo.shape[0] and arranjo.flags.writeable:
+            return arranjo
+        novo = np.empty((max(4, self._tamanho * 2),) + arranjo.shape[1:], dtype=arranjo.dtype)
+        novo[:self._tamanho] = arranjo[:self._tamanho]
+        return novo
+
+    def candidatos(self, query: np.ndarray, top_k: int) -> np.ndarray:
+        """Posições que serão reescoradas com precisão total."""
+        # O tamanho é lido antes dos arranjos: anexar troca os arranjos antes de crescer
+        tamanho = self._tamanho
+        if self.modo == 'int8':
+            int8, escalas = self._int8, self._escalas
+            scores = np.empty(tamanho, dtype=np.float32)
+            for inicio in range(0, tamanho, _BLOCO_VARREDURA):
+                fim = min(inicio + _BLOCO_VARREDURA, tamanho)
+                scores[inicio:fim] = (int8[inicio:fim].astype(np.float32) @ query) * escalas[inicio:fim]
+            return _menores(-scores, top_k * FATOR_RESCORE)
+
+        bits = self._bits
+        codigo_query = codigos_binarios(query[None, :])[0]
+        distancias = np.empty(tamanho, dtype=np.uint16)
+        for inicio in range(0, tamanho, _BLOCO_VARREDURA):
+            fim = min(inicio + _BLOCO_VARREDURA, tamanho)
+            distancias[inicio:fim] = distancias_hamming(bits[inicio:fim], codigo_query)
+        return _menores(distancias, top_k * FATOR_BINARIO)
@@ -0,0 +1,138 @@
+import math
+import os
+from typing import Dict, List, Sequence
+import numpy as np
+
+
+# ============================================
+# PERFIS DE RECUPERAÇÃO E ORÇAMENTO DE CONTEXTO
+# ============================================
+# Cada papel tem seu perfil de RAG: quantos contextos buscar, a similaridade
+# mínima para um contexto entrar no prompt (como o retriever
+# "similarity_score_threshold" de experimental/agentes_de_ia.py) e um teto de
+# tokens para o bloco de contexto. Prompts menores custam menos no Groq/Gemini
+# e respondem mais rápido; contextos pouco parecidos com a pergunta só
+# atrapalham a resposta.
+#
+# O teto é distribuído por "nivelamento": contextos curtos entram inteiros e
+# os mais longos são aparados para um mesmo limite. Se esse limite ficar
+# pequeno demais, os contextos menos relevantes saem primeiro.
+#
+# Antes do orçamento, candidatos quase idênticos (notas coladas com
+# sobreposição, a mesma ideia reescrita) são descartados: só o mais relevante de
+# cada grupo vai ao prompt. A comparação usa os embeddings normalizados que a
+# fase 1 já pontuou (um produto escalar), antes de a fase 2 ler os textos.
+
+TOP_K_PADRAO = int(os.environ.get('SENSEI_RAG_TOP_K', '5'))
+SCORE_MINIMO_PADRAO = float(os.environ.get('SENSEI_RAG_SCORE_MINIMO', '0.3'))
+MAX_TOKENS_CONTEXTO_PADRAO = int(os.environ.get('SENSEI_RAG_MAX_TOKENS', '1500'))
+
+# Estimativa barata (sem tokenizer): ~4 caracteres por token em português/inglês
+CARACTERES_POR_TOKEN = 4
+# Abaixo disso, um trecho aparado já não carrega informação útil
+TOKENS_MINIMOS_TRECHO = 60
+MARCADOR_CORTE = " [...]"
+
+# Cosseno entre embeddings a partir do qual dois candidatos são redundantes
+# (textos só relacionados já ficam na casa de 0.8-0.9 com os embeddings do Gemini)
+LIMIAR_REDUNDANCIA = float(os.environ.get('SENSEI_RAG_LIMIAR_REDUNDANCIA', '0.95'))
+# Candidatos além do top_k buscados para repor os redundantes descartados
+CANDIDATOS_EXTRAS = int(os.environ.get('SENSEI_RAG_CANDIDATOS_EXTRAS', '3'))
+
+
+class PerfilRecuperacao:
+    """Parâmetros de RAG de um papel."""
+
+    def __init__(self, top_k: int = TOP_K_PADRAO, score_minimo: float = SCORE_MINIMO_PADRAO,
+                 max_tokens_contexto: int = MAX_TOKENS_CONTEXTO_PADRAO):
+        self.top_k = top_k
+        self.score_minimo = score_minimo
+        self.max_tokens_contexto = max_tokens_contexto
+
+    def __repr__(self) -> str:
+        return (f"PerfilRecuperacao(top_k={self.top_k}, score_minimo={self.score_minimo}, "
+                f"max_tokens_contexto={self.max_tokens_contexto})")
+
+
+PERFIL_PADRAO = PerfilRecuperacao()
+
+PERFIS_RECUPERACAO: Dict[str, PerfilRecuperacao] = {
+    'mentor': PERFIL_PADRAO,
+    # Aulas se beneficiam de mais material de apoio
+    'professor': PerfilRecuperacao(top_k=TOP_K_PADRAO + 2, max_tokens_contexto=MAX_TOKENS_CONTEXTO_PADRAO * 2),
+    # Atendimento: respostas curtas e só com contexto bem aderente
+    'atendente': PerfilRecuperacao(top_k=3, score_minimo=SCORE_MINIMO_PADRAO + 0.1,
+                                   max_tokens_contexto=MAX_TOKENS_CONTEXTO_PADRAO // 2),
+    'nutricionista': PerfilRecuperacao(score_minimo=SCORE_MINIMO_PADRAO + 0.05),
+}
+
+
+def perfil_recuperacao(role: str) -> PerfilRecuperacao:
+    """Perfil do papel (mesmo fallback de arquivo_persona: mentor)."""
+    return PERFIS_RECUPERACAO.get((role or '').lower(), PERFIL_PADRAO)
+
+
+def estimar_tokens(texto: str) -> int:
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def aparar_texto(texto: str, max_tokens: int) -> str:
+    """Corta o texto em até `max_tokens`, de preferência no fim de uma palavra."""
+    if estimar_tokens(texto) <= max_tokens:
+        return texto
+    limite = max(0, max_tokens * CARACTERES_POR_TOKEN - len(MARCADOR_CORTE))
+    corte = texto.rfind(" ", 0, limite + 1)
+    if corte < limite // 2:
+        corte = limite
+    return texto[:corte].rstrip() + MARCADOR_CORTE
+
+
+def _limite_nivelado(tamanhos: Sequence[int], orcamento: int) -> float:
+    """Maior limite por contexto tal que a soma de min(tamanho, limite) caiba no orçamento."""
+    restante = orcamento
+    ordenados = sorted(tamanhos)
+    for i, tamanho in enumerate(ordenados):
+        cota = restante / (len(ordenados) - i)
+        if tamanho > cota:
+            return cota
+        restante -= tamanho
+    return math.inf
+
+
+def aplicar_orcamento(contextos: Sequence[str], max_tokens: int,
+                      minimo_por_trecho: int = TOKENS_MINIMOS_TRECHO) -> List[str]:
+    """
+    Ajusta os contextos (em ordem de relevância) ao orçamento de tokens:
+    mantém a ordem, apara os mais longos e descarta os menos relevantes
+    quando o limite de cada um ficaria abaixo de `minimo_por_trecho`.
+    """
+    selecionados = list(contextos)
+    if max_tokens <= 0 or not selecionados:
+        return selecionados
+
+    while selecionados:
+        limite = _limite_nivelado([estimar_tokens(c) for c in selecionados], max_tokens)
+        if limite >= minimo_por_trecho or len(selecionados) == 1:
+            break
+        selecionados.pop()
+
+    if limite == math.inf:
+        return selecionados
+    return [aparar_texto(contexto, int(limite)) for contexto in selecionados]
+
+
+def nao_redundantes(vetores: np.ndarray, limiar: float = LIMIAR_REDUNDANCIA) -> List[int]:
+    """
+    Percorre os candidatos (linhas normalizadas, em ordem de relevância) e
+    devolve as posições dos que não são quase idênticos a um já mantido.
+    Linhas zeradas (candidato sem vetor) nunca são consideradas redundantes.
+    """
+    if len(vetores) < 2:
+        return list(range(len(vetores)))
+
+    similaridades = vetores @ vetores.T
+    mantidos: List[int] = []
+    for i in range(len(vetores)):
+        if not mantidos or similaridades[i, mantidos].max() < limiar:
+            mantidos.append(i)
+    return mantidos
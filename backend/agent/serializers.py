@@ -8,17 +8,34 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = UserProfile
-        fields = ['user_id', 'username', 'groq_api_key', 'google_api_key']
+        fields = ['user_id', 'username', 'groq_api_key', 'google_api_key', 'ann_mode']
         extra_kwargs = {
             'groq_api_key': {'write_only': True, 'required': False},
             'google_api_key': {'write_only': True, 'required': False},
+            'ann_mode': {'required': False},
         }
 
 
+def campo_tags():
+    return serializers.ListField(
+        child=serializers.CharField(max_length=50, trim_whitespace=True), max_length=20, required=False
+    )
+
+
 class ContextSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user_profile.user.username', read_only=True)
+    tags = campo_tags()
 
     class Meta:
         model = Context
-        fields = ['id', 'user_profile', 'username', 'text', 'timestamp']
-        read_only_fields = ['user_profile', 'timestamp']
+        fields = ['id', 'user_profile', 'username', 'text', 'timestamp', 'source', 'tags', 'status', 'attempts', 'error']
+        read_only_fields = ['user_profile', 'timestamp', 'source', 'status', 'attempts', 'error']
+
+
+class ContextBulkSerializer(serializers.Serializer):
+    contextos = serializers.ListField(
+        child=serializers.CharField(allow_blank=True, trim_whitespace=True),
+        allow_empty=False,
+    )
+    # Aplicadas a todos os contextos do lote
+    tags = campo_tags()
@@ -0,0 +1,201 @@
+import json
+import os
+import time
+import traceback
+from contextlib import closing
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+from . import utils
+from .filtros import FiltroBusca
+from .utils import InvalidGoogleApiKey, InvalidGroqApiKey, QuotaExceededError
+
+
+# ============================================
+# RESPOSTAS EM FLUXO (SERVER-SENT EVENTS)
+# ============================================
+# O chat em fluxo repassa os tokens do provedor assim que chegam (Groq com
+# "stream": true, Gemini com streamGenerateContent?alt=sse), então o usuário
+# vê a resposta começar em vez de esperar a geração inteira.
+#
+# O fallback entre provedores segue a mesma ordem de processar_query_usuario
+# (chaves do usuário, Groq do proprietário, chaves Google do proprietário) e
+# só vale ATÉ o primeiro token: depois que algo foi enviado ao cliente, trocar
+# de provedor repetiria ou misturaria respostas, então uma falha no meio do
+# fluxo vira um evento 'erro' e a resposta parcial fica como está.
+#
+# Eventos emitidos (cada um com um JSON em data:):
+#   contexto {num_contextos} -> inicio {ia_usada} -> token {texto}... -> fim {ia_usada, num_contextos, ms_*}
+#   erro {codigo, erro} em qualquer ponto, encerrando o fluxo.
+
+URL_GROQ = "https://api.groq.com/openai/v1/chat/completions"
+URL_GOOGLE = "https://generativelanguage.googleapis.com/v1beta/models/{modelo}:streamGenerateContent"
+MODELO_GROQ = "llama-3.1-8b-instant"
+MODELO_GOOGLE = "gemini-2.0-flash"
+
+# (conexão, leitura): a leitura limita o intervalo entre dois pedaços, não a resposta inteira
+TIMEOUT_FLUXO = (10, float(os.environ.get('SENSEI_STREAM_TIMEOUT_LEITURA', '30')))
+
+
+class FalhaFluxo(Exception):
+    """Erro do provedor durante uma resposta em fluxo."""
+
+
+def _dados_sse(response) -> Iterator[str]:
+    """Conteúdo das linhas 'data:' de uma resposta SSE."""
+    for linha in response.iter_lines(decode_unicode=True):
+        if linha and linha.startswith('data:'):
+            yield linha[5:].strip()
+
+
+def fluxo_groq(prompt: str, api_key: str, model: str = MODELO_GROQ) -> Iterator[str]:
+    """Tokens da Groq (API compatível com OpenAI, 'stream': true)."""
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.7,
+        "max_tokens": 2048,
+        "stream": True,
+    }
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    response = requests.post(URL_GROQ, json=payload, headers=headers, stream=True, timeout=TIMEOUT_FLUXO)
+    with closing(response):
+        if response.status_code == 401:
+            raise InvalidGroqApiKey("Chave da API Groq inválida.")
+        if response.status_code != 200:
+            raise FalhaFluxo(f"Erro {response.status_code}: {response.text}")
+
+        for dados in _dados_sse(response):
+            if dados == '[DONE]':
+                return
+            evento = json.loads(dados)
+            if 'error' in evento:
+                raise FalhaFluxo(str(evento['error']))
+            for escolha in evento.get('choices', []):
+                texto = (escolha.get('delta') or {}).get('content')
+                if texto:
+                    yield texto
+
+
+def fluxo_google(prompt: str, api_key: str, model_name: str = MODELO_GOOGLE) -> Iterator[str]:
+    """Tokens do Gemini via streamGenerateContent em SSE."""
+    url = URL_GOOGLE.format(modelo=model_name)
+    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    response = requests.post(url, params={'alt': 'sse', 'key': api_key}, json=payload, stream=True,
+                             timeout=TIMEOUT_FLUXO)
+    with closing(response):
+        if response.status_code == 400 and "API key not valid" in response.text:
+            raise InvalidGoogleApiKey("Chave da API Google inválida.")
+        if response.status_code == 429:
+            raise QuotaExceededError(f"Quota excedida para a chave: ...{api_key[-4:]}")
+        if response.status_code != 200:
+            raise FalhaFluxo(f"Erro na API do Google: {response.status_code} - {response.text}")
+
+        for dados in _dados_sse(response):
+            evento = json.loads(dados)
+            if 'error' in evento:
+                raise FalhaFluxo(str(evento['error']))
+            block_reason = (evento.get('promptFeedback') or {}).get('blockReason')
+            if block_reason:
+                yield f"A resposta foi bloqueada por segurança: {block_reason}"
+                return
+            for candidato in evento.get('candidates', [])[:1]:
+                for parte in (candidato.get('content') or {}).get('parts', []):
+                    if parte.get('text'):
+                        yield parte['text']
+
+
+FLUXOS_PROVEDORES: Dict[str, Callable[[str, str], Iterator[str]]] = {
+    'groq': fluxo_groq,
+    'google': fluxo_google,
+}
+
+
+def tentativas_de_provedores(preferred_provider: Optional[str], groq_api_key: Optional[str],
+                             google_api_key: Optional[str]) -> List[Tuple[str, str, str]]:
+    """(ia_usada, provedor, chave) na mesma ordem de fallback de processar_query_usuario."""
+    tentativas = [
+        (ia_usada, 'groq' if ia_usada == 'groq' else 'google', chave)
+        for ia_usada, chave in utils.ordem_chaves_usuario(preferred_provider, groq_api_key, google_api_key) if chave
+    ]
+    admin_groq_key = os.environ.get("GROQ_API_KEY")
+    if admin_groq_key:
+        tentativas.append(('groq_owner', 'groq', admin_groq_key))
+    tentativas.extend(
+        (f"google_owner_key_{i + 1}", 'google', chave) for i, chave in enumerate(utils.get_owner_google_keys())
+    )
+    return tentativas
+
+
+def transmitir_resposta(prompt: str, tentativas: List[Tuple[str, str, str]]) -> Iterator[Tuple[str, Dict]]:
+    """
+    Tenta cada provedor até um deles produzir o primeiro token e então repassa
+    o fluxo dele. Emite (evento, dados): 'inicio', 'token'..., e 'fim' ou 'erro'.
+    """
+    erros = []
+    for ia_usada, provedor, chave in tentativas:
+        fluxo = FLUXOS_PROVEDORES[provedor](prompt, chave)
+        try:
+            try:
+                primeiro = next(fluxo)
+            except StopIteration:
+                erros.append(f"{ia_usada}: resposta vazia")
+                continue
+            except Exception as e:
+                print(f"⚠️ {ia_usada} falhou antes do primeiro token: {e}")
+                erros.append(f"{ia_usada}: {e}")
+                continue
+
+            yield 'inicio', {'ia_usada': ia_usada}
+            yield 'token', {'texto': primeiro}
+            try:
+                for texto in fluxo:
+                    yield 'token', {'texto': texto}
+            except Exception as e:
+                print(f"❌ Fluxo de {ia_usada} interrompido: {e}")
+                yield 'erro', {'codigo': 'INTERROMPIDO', 'erro': f"{ia_usada}: {e}"}
+                return
+            yield 'fim', {'ia_usada': ia_usada}
+            return
+        finally:
+            fluxo.close()
+
+    if any("quota" in erro.lower() for erro in erros):
+        yield 'erro', {
+            'codigo': 'QUOTA_EXCEEDED',
+            'erro': "Todas as chaves de API disponíveis atingiram o limite de quota. "
+                    "Por favor, insira sua própria chave para continuar.",
+        }
+        return
+    erro_completo = " | ".join(erros) if erros else "Nenhum provedor de IA configurado."
+    yield 'erro', {'codigo': 'FALHA_IA', 'erro': f"Todas as IAs falharam: {erro_completo}"}
+
+
+def evento_sse(evento: str, dados: Dict) -> str:
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+def eventos_chat(user_id: str, query: str, groq_api_key: Optional[str] = None,
+                 google_api_key: Optional[str] = None, preferred_provider: Optional[str] = None,
+                 role: str = 'mentor', filtro: Optional[FiltroBusca] = None) -> Iterator[str]:
+    """Versão em fluxo de processar_query_usuario: RAG, depois os tokens do provedor, como SSE."""
+    inicio = time.perf_counter()
+    try:
+        prompt, contextos = utils.montar_prompt_usuario(user_id, query, role, filtro)
+    except Exception as e:
+        traceback.print_exc()
+        yield evento_sse('erro', {'codigo': 'FALHA_RAG', 'erro': str(e)})
+        return
+    yield evento_sse('contexto', {'num_contextos': len(contextos)})
+
+    ms_primeiro_token = None
+    for evento, dados in transmitir_resposta(prompt, tentativas_de_provedores(preferred_provider, groq_api_key,
+                                                                              google_api_key)):
+        if evento == 'inicio':
+            ms_primeiro_token = round((time.perf_counter() - inicio) * 1000)
+            print(f"⚡ Primeiro token em {ms_primeiro_token} ms ({dados['ia_usada']})")
+        elif evento == 'fim':
+            dados = {**dados, 'num_contextos': len(contextos), 'ms_primeiro_token': ms_primeiro_token,
+                     'ms_total': round((time.perf_counter() - inicio) * 1000)}
+        yield evento_sse(evento, dados)
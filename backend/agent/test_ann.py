@@ -0,0 +1,60 @@
+import numpy as np
+
+from . import ann, vector_index
+
+
+def _corpus(n=500, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return vector_index.normalizar_linhas(rng.standard_normal((n, dim)).astype(np.float32))
+
+
+def test_ivf_com_todas_as_listas_equivale_a_busca_exata():
+    """ Sondando todas as listas, o IVF deve devolver exatamente o top_k exato. """
+    matriz = _corpus()
+    ivf = ann.IndiceIVF(matriz, n_listas=10)
+    query = matriz[7]
+
+    posicoes, scores = ivf.buscar(matriz, query, top_k=5, n_probe=ivf.n_listas)
+    esperado, esperado_scores = vector_index.selecionar_top_k(matriz @ query, 5)
+
+    assert posicoes.tolist() == esperado.tolist()
+    assert np.allclose(scores, esperado_scores)
+
+
+def test_indice_vetorial_usa_ivf_acima_do_limiar(monkeypatch):
+    """ Acima do limiar o índice treina o IVF e documentos novos continuam encontráveis. """
+    monkeypatch.setattr(ann, 'LIMIAR_ANN', 100)
+    matriz = _corpus()
+    indice = vector_index.IndiceVetorial([str(i) for i in range(500)], ['t'] * 500, matriz)
+
+    posicoes, _ = indice.buscar(matriz[3], top_k=1)
+    assert posicoes.tolist() == [3]
+    assert indice._ivf is not None
+
+    novo = np.zeros(16, dtype=np.float32)
+    novo[0] = 1.0
+    indice.anexar('novo', 'novo', novo)
+    posicoes, scores = indice.buscar(novo, top_k=1)
+    assert posicoes.tolist() == [500]
+    assert np.isclose(scores[0], 1.0)
+
+
+def test_modo_ann_por_usuario(monkeypatch):
+    """ 'sempre' antecipa o IVF abaixo do limiar global e 'nunca' mantém a busca exata acima dele. """
+    monkeypatch.setattr(ann, 'MINIMO_ANN', 100)
+    cache = vector_index.CacheIndicesUsuario(max_bytes=1 << 24, ttl=60)
+    matriz = _corpus()
+    cache.definir_modo_ann('users/rapido', ann.MODO_ANN_SEMPRE)
+    for usuario in ('users/rapido', 'users/padrao'):
+        cache.armazenar(usuario, vector_index.IndiceVetorial([str(i) for i in range(500)], None, matriz))
+        cache.obter(usuario).buscar(matriz[3], top_k=1)
+
+    assert cache.obter('users/rapido')._ivf is not None
+    assert cache.obter('users/padrao')._ivf is None  # 500 < SENSEI_ANN_LIMIAR
+
+    monkeypatch.setattr(ann, 'LIMIAR_ANN', 100)
+    cache.definir_modo_ann('users/padrao', ann.MODO_ANN_NUNCA)
+    posicoes, _ = cache.obter('users/padrao').buscar(matriz[3], top_k=1)
+    assert posicoes.tolist() == [3] and cache.obter('users/padrao')._ivf is None
+    cache.definir_modo_ann('users/padrao', ann.MODO_ANN_AUTO)
+    assert cache._modos_ann == {'users/rapido': ann.MODO_ANN_SEMPRE}
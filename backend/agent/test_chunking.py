@@ -0,0 +1,36 @@
+from .chunking import agrupar_chunks, dividir_em_chunks, juntar_chunks
+
+
+TEXTO = "\n\n".join(
+    f"Parágrafo {i}. " + " ".join(f"palavra{j}" for j in range(40)) for i in range(12)
+)
+
+
+def test_dividir_em_chunks_respeita_tamanho_e_posicoes():
+    """ Nenhum chunk passa do limite e cada um aponta para sua posição no original. """
+    chunks = dividir_em_chunks(TEXTO, tamanho=300, sobreposicao=60)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 300 for _, chunk in chunks)
+    assert all(TEXTO[inicio:inicio + len(chunk)] == chunk for inicio, chunk in chunks)
+    # Vizinhos compartilham a sobreposição
+    assert any(a[0] + len(a[1]) > b[0] for a, b in zip(chunks, chunks[1:]))
+    assert dividir_em_chunks("  curto  ") == [(0, "curto")]
+
+
+def test_juntar_chunks_remove_sobreposicao_e_marca_lacunas():
+    """ Chunks consecutivos reconstroem o texto; chunks distantes ganham um marcador. """
+    chunks = [(i, inicio, chunk) for i, (inicio, chunk) in enumerate(dividir_em_chunks(TEXTO, 300, 60))]
+
+    assert " ".join(juntar_chunks(chunks).split()) == " ".join(TEXTO.split())
+    assert "[...]" in juntar_chunks([chunks[0], chunks[3]])
+
+
+def test_agrupar_chunks_mantem_ordem_de_relevancia():
+    """ Chunks do mesmo contexto viram um trecho na posição do mais relevante. """
+    trechos = [
+        ('pai', 1, 5, 'mundo. Tudo bem?'),
+        ('solto', None, 0, 'outro'),
+        ('pai', 0, 0, 'Olá, mundo.'),
+    ]
+    assert agrupar_chunks(trechos) == ['Olá, mundo. Tudo bem?', 'outro']
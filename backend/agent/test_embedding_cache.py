@@ -0,0 +1,32 @@
+import numpy as np
+
+from . import embedding_cache
+
+
+def test_chave_ignora_caixa_e_espacos_mas_nao_o_prefixo():
+    """ A chave depende do modelo, do prefixo da tarefa e do texto normalizado. """
+    chave = embedding_cache.chave_embedding('modelo', 'Contexto para mentor: ', 'Olá   Mundo')
+
+    assert chave == embedding_cache.chave_embedding('modelo', 'Contexto para mentor: ', ' olá mundo ')
+    assert chave != embedding_cache.chave_embedding('modelo', 'Contexto para professor: ', 'olá mundo')
+    assert chave != embedding_cache.chave_embedding('outro-modelo', 'Contexto para mentor: ', 'olá mundo')
+
+
+def test_camada_de_disco_sobrevive_a_reinicio(tmp_path):
+    """ Um novo processo (nova instância) deve encontrar o vetor no SQLite. """
+    caminho = str(tmp_path / 'cache.sqlite3')
+    embedding_cache.CacheEmbeddings(caminho).armazenar('k', [0.5, 0.25])
+
+    novo = embedding_cache.CacheEmbeddings(caminho)
+    assert np.allclose(novo.obter('k'), [0.5, 0.25])
+    assert novo.obter('k') is not None
+    assert novo.estatisticas() == {'hits_memoria': 1, 'hits_disco': 1, 'misses': 0, 'entradas_memoria': 1}
+
+
+def test_ttl_expira_memoria_e_disco(tmp_path):
+    """ Entradas vencidas contam como miss nas duas camadas. """
+    cache = embedding_cache.CacheEmbeddings(str(tmp_path / 'cache.sqlite3'), ttl_memoria=-1, ttl_disco=-1)
+    cache.armazenar('k', [1.0])
+
+    assert cache.obter('k') is None
+    assert cache.estatisticas()['misses'] == 1
@@ -0,0 +1,73 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from . import fila_embeddings
+from .apps import processo_servidor
+from .models import Context, ContextOutbox, UserProfile
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def perfil():
+    return UserProfile.objects.create(user=User.objects.create(username='u1'))
+
+
+@patch('agent.utils.salvar_contextos_usuario_em_lote')
+def test_fila_processa_com_retentativa_e_backoff(mock_salvar, perfil):
+    """ Uma falha reagenda o item da outbox com backoff; o sucesso deixa o contexto 'ready' e esvazia a outbox. """
+    context, = fila_embeddings.enfileirar_contextos([Context(user_profile=perfil, text='Nota')])
+    assert context.status == Context.Status.PENDING
+    assert ContextOutbox.objects.filter(context=context).count() == 1
+
+    mock_salvar.return_value = [(False, 'Quota Excedida')]
+    assert fila_embeddings.processar_pendentes() == 1
+    context.refresh_from_db()
+    assert (context.status, context.attempts, context.error) == (Context.Status.PENDING, 1, 'Quota Excedida')
+    assert context.outbox.get().next_attempt_at > timezone.now()
+    assert fila_embeddings.processar_pendentes() == 0  # ainda no backoff
+
+    ContextOutbox.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+    mock_salvar.return_value = [(True, None)]
+    assert fila_embeddings.processar_pendentes() == 1
+    context.refresh_from_db()
+    assert (context.status, context.error) == (Context.Status.READY, '')
+    assert not ContextOutbox.objects.exists()
+    # Ids determinísticos: reenviar o mesmo contexto sobrescreve em vez de duplicar;
+    # data, origem e tags do Context seguem como metadados de filtro
+    mock_salvar.assert_called_with('u1', ['Nota'], [f'ctx-{context.pk}'], [
+        {'timestamp': context.timestamp.timestamp(), 'fonte': 'manual', 'tags': []}
+    ])
+
+
+@patch('agent.utils.salvar_contextos_usuario_em_lote', side_effect=RuntimeError('Firestore fora do ar'))
+def test_fila_reserva_itens_e_marca_failed_apos_limite(mock_salvar, perfil, monkeypatch):
+    """ Um item reservado não é pego de novo; esgotadas as tentativas, o contexto vira 'failed'. """
+    monkeypatch.setattr(fila_embeddings, 'FILA_MAX_TENTATIVAS', 2)
+    context, = fila_embeddings.enfileirar_contextos([Context(user_profile=perfil, text='Nota', attempts=1)])
+
+    assert [item.context_id for item in fila_embeddings.reservar_pendentes()] == [context.pk]
+    assert fila_embeddings.reservar_pendentes() == []
+
+    ContextOutbox.objects.update(next_attempt_at=timezone.now())
+    assert fila_embeddings.processar_pendentes() == 1
+    context.refresh_from_db()
+    assert (context.status, context.attempts, context.error) == (Context.Status.FAILED, 2, 'Firestore fora do ar')
+    assert not ContextOutbox.objects.exists()
+
+
+@pytest.mark.parametrize('argv, environ, esperado', [
+    (['/usr/local/bin/gunicorn', 'senseidb_backend.wsgi'], {}, True),
+    (['manage.py', 'runserver'], {'RUN_MAIN': 'true'}, True),
+    (['manage.py', 'runserver'], {}, False),  # processo do autoreload
+    (['manage.py', 'runserver', '--noreload'], {}, True),
+    (['manage.py', 'migrate'], {}, False),
+    (['manage.py', 'processar_fila_embeddings'], {}, False),
+])
+def test_fila_inicia_so_em_processos_servidor(argv, environ, esperado):
+    """ No boot (AppConfig.ready), a outbox deixada por um deploy volta a ser consumida só nos servidores. """
+    assert processo_servidor(argv, environ) is esperado
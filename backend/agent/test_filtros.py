@@ -0,0 +1,49 @@
+import math
+
+import numpy as np
+import pytest
+
+from .filtros import FiltroBusca, MetadadosIndice, aplicar_recencia, fator_recencia
+
+DIA = 86400.0
+
+
+def test_metadados_filtram_por_data_fonte_e_tags():
+    """ Cada filtro vira um conjunto de posições; vários filtros se intersectam. """
+    metadados = MetadadosIndice.de_documentos([
+        {'timestamp': 30 * DIA, 'fonte': 'manual', 'tags': ['Trabalho']},
+        {'timestamp': 10 * DIA, 'fonte': 'upload', 'tags': ['trabalho', 'okr']},
+        {'timestamp': None, 'fonte': 'manual', 'tags': []},
+        {'timestamp': 20 * DIA, 'fonte': 'manual', 'tags': ['pessoal']},
+    ])
+
+    assert metadados.posicoes(FiltroBusca(), 4) is None
+    assert metadados.posicoes(FiltroBusca(desde=15 * DIA), 4).tolist() == [0, 3]
+    assert metadados.posicoes(FiltroBusca(ate=20 * DIA), 4).tolist() == [1, 3]
+    assert metadados.posicoes(FiltroBusca(tags=['TRABALHO ']), 4).tolist() == [0, 1]
+    assert metadados.posicoes(FiltroBusca(fontes=['manual'], tags=['trabalho', 'pessoal']), 4).tolist() == [0, 3]
+
+    # Documentos anexados depois entram na ordem cronológica
+    metadados.anexar({'timestamp': 40 * DIA, 'fonte': 'bulk'})
+    assert metadados.posicoes(FiltroBusca(desde=25 * DIA), 5).tolist() == [0, 4]
+
+
+def test_filtro_de_dados_da_requisicao():
+    filtro = FiltroBusca.de_dados({'desde': '2026-01-01T00:00:00+00:00', 'tags': ['x'], 'meia_vida_dias': 30})
+    assert filtro.restringe and filtro.meia_vida_dias == 30
+    with pytest.raises(ValueError):
+        FiltroBusca.de_dados({'tags': 'x'})
+    with pytest.raises(ValueError):
+        FiltroBusca.de_dados({'desde': 'ontem'})
+
+
+def test_recencia_reordena_sem_zerar_os_antigos():
+    agora = 1000 * DIA
+    fatores = fator_recencia(np.array([agora, agora - 30 * DIA, math.nan]), meia_vida_dias=30, peso=0.3, agora=agora)
+    assert fatores.tolist() == pytest.approx([1.0, 0.85, 1.0])
+
+    class Indice:
+        metadados = MetadadosIndice.de_documentos([{'timestamp': agora - 365 * DIA}, {'timestamp': agora}])
+
+    ranking = aplicar_recencia([(Indice, 0, 0.80), (Indice, 1, 0.75)], FiltroBusca(meia_vida_dias=30), agora=agora)
+    assert [pos for _, pos, _ in ranking] == [1, 0]
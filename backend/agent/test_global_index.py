@@ -0,0 +1,44 @@
+import numpy as np
+from unittest.mock import MagicMock
+
+from . import global_index
+
+
+def _db_com_conceitos(conceitos):
+    """ Monta um cliente Firestore falso com os conceitos de um papel. """
+    docs = []
+    for i, (texto, embedding) in enumerate(conceitos):
+        doc = MagicMock(id=f'c{i}')
+        doc.to_dict.return_value = {'content': texto, 'embedding': embedding}
+        docs.append(doc)
+    db = MagicMock()
+    db.collection.return_value.document.return_value.collection.return_value.select.return_value.stream.return_value = docs
+    return db
+
+
+def test_exportar_e_carregar_indice_mapeado(tmp_path):
+    """ O índice exportado deve ser aberto via mmap com as linhas normalizadas. """
+    db = _db_com_conceitos([('Princípio AMV', [3.0, 4.0]), ('Porto Seguro', [0.0, 2.0])])
+
+    versao, total = global_index.exportar_indice_global(db, 'Mentor', str(tmp_path))
+    indice = global_index.carregar_indice_mapeado('mentor', versao, str(tmp_path))
+
+    assert total == 2
+    assert isinstance(np.load(tmp_path / f'mentor.{versao}.npy', mmap_mode='r'), np.memmap)
+    assert indice.textos == ['Princípio AMV', 'Porto Seguro']
+    assert np.allclose(indice.matriz, [[0.6, 0.8], [0.0, 1.0]])
+
+
+def test_indices_globais_trocam_de_versao(tmp_path):
+    """ Uma nova exportação deve ser vista pelos workers após o intervalo de verificação. """
+    indices = global_index.IndicesGlobaisMapeados(str(tmp_path), intervalo=0)
+    assert indices.obter('mentor') is None
+
+    global_index.exportar_indice_global(_db_com_conceitos([('v1', [1.0, 0.0])]), 'mentor', str(tmp_path))
+    primeiro = indices.obter('mentor')
+    assert primeiro.textos == ['v1']
+    assert indices.obter('mentor') is primeiro  # mesma versão, mesma instância
+
+    global_index.exportar_indice_global(_db_com_conceitos([('v2', [0.0, 1.0])]), 'mentor', str(tmp_path))
+    assert indices.obter('mentor').textos == ['v2']
+    assert primeiro.textos == ['v1']  # leitores antigos não são afetados
@@ -0,0 +1,86 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from . import ingestion
+from .chunking import dividir_em_chunks
+
+
+TEXTO = "\n\n".join(f"## Seção {i}\nConteúdo ç ã é {i}. " * 8 for i in range(60))
+
+
+def test_chunks_em_fluxo_aponta_posicoes_do_arquivo_inteiro():
+    """ O chunker incremental cobre o texto todo com posições absolutas e tamanho limitado. """
+    blocos = [TEXTO[i:i + 500] for i in range(0, len(TEXTO), 500)]
+
+    chunks = list(ingestion.chunks_em_fluxo(blocos, tamanho=300, sobreposicao=50))
+
+    assert all(len(chunk) <= 300 and TEXTO[inicio:inicio + len(chunk)] == chunk for inicio, chunk in chunks)
+    assert chunks[0] == dividir_em_chunks(TEXTO, 300, 50)[0]
+    assert chunks[-1][0] + len(chunks[-1][1]) == len(TEXTO.rstrip())
+
+
+def test_chunks_em_fluxo_atravessa_regiao_so_de_espacos():
+    """ Um arquivo que começa com uma região longa em branco não derruba o upload (dividir_em_chunks devolve []). """
+    texto = " " * 2000 + "\n" * 2000 + "Início do conteúdo." + " " * 3000 + "Fim do arquivo."
+    blocos = [texto[i:i + 500] for i in range(0, len(texto), 500)]
+
+    chunks = list(ingestion.chunks_em_fluxo(blocos, tamanho=300, sobreposicao=50))
+
+    assert chunks == dividir_em_chunks(texto, 300, 50)
+    assert {chunk for _, chunk in chunks} == {"Início do conteúdo.", "Fim do arquivo."}
+
+
+def test_ler_texto_em_blocos_preserva_caracteres_partidos():
+    """ Um caractere multibyte cortado entre dois blocos não pode virar lixo. """
+    arquivo = SimpleUploadedFile('a.txt', 'ação'.encode('utf-8'))
+    assert ''.join(ingestion.ler_texto_em_blocos(arquivo, tamanho_bloco=2)) == 'ação'
+
+
+@patch('agent.ingestion.gerar_embeddings_documentos')
+@patch('agent.utils.init_firebase')
+def test_ingerir_arquivo_grava_em_lotes_e_reporta_progresso(mock_init_firebase, mock_lote, monkeypatch):
+    """ Cada lote de chunks vira um WriteBatch e um evento de progresso. """
+    monkeypatch.setattr(ingestion, 'LOTE_INGESTAO_CHUNKS', 5)
+    monkeypatch.setattr(ingestion, 'CHUNKS_POR_PAI', 3)
+    mock_lote.side_effect = lambda textos: [[1.0, 0.0]] * len(textos)
+    db = MagicMock()
+    mock_init_firebase.return_value = db
+    arquivo = SimpleUploadedFile('base.md', TEXTO.encode('utf-8'))
+
+    eventos = list(ingestion.ingerir_arquivo('u1', arquivo, 'base.md'))
+
+    assert eventos[-1]['evento'] == 'concluido'
+    assert all(e['evento'] == 'progresso' for e in eventos[:-1])
+    assert eventos[-1]['gravados'] == eventos[-1]['chunks'] > 5
+    assert db.batch.return_value.commit.call_count == -(-eventos[-1]['chunks'] // 5)
+    documentos = [chamada[0][1] for chamada in db.batch.return_value.set.call_args_list]
+    # Um contexto_pai por janela de 3 chunks, todos derivados do id do arquivo
+    pai = eventos[-1]['contexto_pai']
+    assert [d['contexto_pai'] for d in documentos] == [f"{pai}-{d['chunk_indice'] // 3}" for d in documentos]
+    assert len({d['contexto_pai'] for d in documentos}) == -(-eventos[-1]['chunks'] // 3)
+
+
+@patch('agent.ingestion.gerar_embeddings_documentos')
+def test_reenviar_o_mesmo_arquivo_nao_duplica_trechos(mock_lote, tmp_path, monkeypatch):
+    """ Chunks já salvos (mesmo hash) não são embedados nem gravados de novo. """
+    from .vector_index import CacheIndicesUsuario
+    from .vector_store import ArmazemLocal, escopo_usuario
+    armazem = ArmazemLocal(str(tmp_path / 'store.sqlite3'), CacheIndicesUsuario(max_bytes=1 << 20, ttl=60),
+                           cache_lexico=CacheIndicesUsuario(max_bytes=1 << 20, ttl=60))
+    monkeypatch.setattr('agent.utils.armazem_vetorial', armazem)
+    mock_lote.side_effect = lambda textos: [[1.0, 0.0]] * len(textos)
+
+    primeiro = list(ingestion.ingerir_arquivo('u1', SimpleUploadedFile('base.md', TEXTO.encode('utf-8')), 'base.md'))[-1]
+    segundo = list(ingestion.ingerir_arquivo('u1', SimpleUploadedFile('base.md', TEXTO.encode('utf-8')), 'base.md'))[-1]
+
+    assert primeiro['gravados'] == primeiro['chunks'] > 1
+    assert (segundo['evento'], segundo['gravados'], segundo['repetidos']) == ('concluido', 0, segundo['chunks'])
+    assert armazem.contar(escopo_usuario('u1')) == primeiro['gravados']
+    # Só o primeiro envio gastou embeddings
+    assert sum(len(chamada[0][0]) for chamada in mock_lote.call_args_list) == primeiro['chunks']
+
+
+def test_formato_nao_suportado():
+    with pytest.raises(ingestion.FormatoNaoSuportado):
+        ingestion.blocos_do_arquivo(SimpleUploadedFile('planilha.xlsx', b''), 'planilha.xlsx')
@@ -0,0 +1,34 @@
+from .lexical import IndiceLexico, fundir_rrf, ranquear_lexico, tokenizar
+from .vector_index import IndiceVetorial, ranquear_indices
+
+
+def test_tokenizar_remove_acentos_e_stopwords():
+    assert tokenizar("A Reunião é às 10h com o João") == ['reuniao', '10h', 'joao']
+
+
+def test_bm25_prioriza_termos_raros_e_aceita_anexar():
+    """ Termo raro pesa mais que termo comum; documentos anexados entram na busca. """
+    indice = IndiceLexico.de_textos(
+        ['d1', 'd2', 'd3'],
+        ['Projeto Apollo atrasado', 'Projeto novo no time', 'Projeto de marketing'],
+    )
+    posicoes, _ = indice.buscar('status do projeto apollo', top_k=3)
+    assert [indice.ids[p] for p in posicoes][0] == 'd1'
+    assert len(indice.buscar('kubernetes', top_k=3)[0]) == 0
+
+    assert indice.anexar('d4', 'Migração para Kubernetes')
+    posicoes, _ = indice.buscar('kubernetes', top_k=3)
+    assert [indice.ids[p] for p in posicoes] == ['d4']
+
+
+def test_rrf_funde_rankings_vetorial_e_lexico():
+    """ Um documento bem colocado nos dois rankings vence quem só aparece em um. """
+    ids, textos = ['a', 'b', 'c'], ['Sigla XPTO do contrato', 'Texto parecido', 'Outro assunto']
+    vetorial = IndiceVetorial.de_embeddings(ids, None, [[0.9, 0.1], [1.0, 0.0], [0.0, 1.0]])
+    lexico = IndiceLexico.de_textos(ids, textos)
+    escopos = {id(vetorial): 'users/u1', id(lexico): 'users/u1'}
+
+    ranking = fundir_rrf(
+        [ranquear_indices([1.0, 0.0], [vetorial], 3), ranquear_lexico('contrato XPTO', [lexico], 3)], escopos, top_k=2
+    )
+    assert [indice.ids[pos] for indice, pos, _ in ranking] == ['a', 'b']
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+from django.contrib.auth.models import User
+
+from .models import Context, UserProfile
+
+pytestmark = pytest.mark.django_db
+
+
+def test_context_embedding_binario_float32():
+    """ O embedding é gravado como float32 contíguo e lido de volta sem conversão de JSON. """
+    perfil = UserProfile.objects.create(user=User.objects.create(username='u1'))
+    context = Context(user_profile=perfil, text='Nota')
+    context.set_embedding([0.5, 1.5, -2.0])
+    context.save()
+
+    salvo = Context.objects.get(pk=context.pk)
+    assert len(bytes(salvo.embedding)) == 3 * 4
+    assert salvo.get_embedding().dtype == np.float32
+    assert np.array_equal(salvo.get_embedding(), [0.5, 1.5, -2.0])
+    assert Context.objects.create(user_profile=perfil, text='Sem vetor').get_embedding() is None
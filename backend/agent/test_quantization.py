@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+import pytest
+
+from . import global_index
+from .quantization import CodigosQuantizados, distancias_hamming, codigos_binarios, quantizar_int8
+from .vector_index import IndiceVetorial, normalizar_linhas, selecionar_top_k
+
+
+def _corpus(n=3000, dim=256, seed=0):
+    rng = np.random.default_rng(seed)
+    centros = rng.standard_normal((30, dim))
+    return normalizar_linhas((centros[rng.integers(0, 30, n)] + rng.standard_normal((n, dim)) * 0.5).astype(np.float32))
+
+
+def test_codigos_int8_e_binarios():
+    """ int8 reconstrói o vetor com erro pequeno; Hamming conta bits diferentes. """
+    matriz = _corpus(10)
+    codigos, escalas = quantizar_int8(matriz)
+    assert codigos.dtype == np.int8
+    assert np.abs(codigos * escalas[:, None] - matriz).max() < 0.01
+
+    bits = codigos_binarios(np.array([[1.0, -1.0, 1.0], [1.0, 1.0, 1.0]], dtype=np.float32))
+    assert distancias_hamming(bits, bits[0]).tolist() == [0, 1]
+
+
+@pytest.mark.parametrize('modo, recall_minimo', [('int8', 0.95), ('binaria', 0.8)])
+def test_indice_quantizado_reescora_com_float32(tmp_path, monkeypatch, modo, recall_minimo):
+    """ A busca quantizada recupera quase os mesmos top_k da exata, com scores exatos. """
+    monkeypatch.setattr('agent.vector_index.DIRETORIO_MATRIZES_QUANTIZADAS', str(tmp_path))
+    matriz = _corpus()
+    consultas = normalizar_linhas(matriz[:50] + np.random.default_rng(1).standard_normal((50, 256)).astype(np.float32) * 0.05)
+    exato = IndiceVetorial([str(i) for i in range(len(matriz))], None, matriz, 'nenhuma')
+    quantizado = IndiceVetorial([str(i) for i in range(len(matriz))], None, matriz, modo)
+
+    acertos = 0
+    for q in consultas:
+        esperadas, _ = selecionar_top_k(matriz @ q, 5)
+        posicoes, scores = quantizado.buscar(q, 5)
+        acertos += len(set(esperadas.tolist()) & set(posicoes.tolist()))
+        assert np.allclose(scores, matriz[posicoes] @ q, atol=1e-6)
+
+    assert acertos / (len(consultas) * 5) >= recall_minimo
+    assert quantizado.nbytes < exato.nbytes / 3
+
+    # Documentos anexados entram nos códigos e na matriz em disco
+    quantizado.anexar('novo', None, consultas[0])
+    posicoes, _ = quantizado.buscar(consultas[0], 1)
+    assert quantizado.ids[posicoes[0]] == 'novo'
+
+
+def test_indice_global_exporta_e_mapeia_codigos(tmp_path):
+    """ O export grava os códigos do modo configurado e o carregamento os usa mapeados. """
+    from unittest.mock import MagicMock
+    docs = []
+    for i, embedding in enumerate(_corpus(20)):
+        doc = MagicMock(id=f'c{i}')
+        doc.to_dict.return_value = {'content': f'conceito {i}', 'embedding': embedding.tolist()}
+        docs.append(doc)
+    db = MagicMock()
+    db.collection.return_value.document.return_value.collection.return_value.select.return_value.stream.return_value = docs
+
+    versao, _ = global_index.exportar_indice_global(db, 'mentor', str(tmp_path), quantizacao='binaria')
+    indice = global_index.carregar_indice_mapeado('mentor', versao, str(tmp_path), quantizacao='binaria')
+
+    assert (tmp_path / f'mentor.{versao}.bits.npy').exists()
+    assert isinstance(indice._codigos, CodigosQuantizados)
+    posicoes, _ = indice.buscar(np.asarray(docs[3].to_dict()['embedding'], dtype=np.float32), 1)
+    assert indice.textos[posicoes[0]] == 'conceito 3'
+
+
+def test_indice_global_quantizado_continua_mapeado_no_npy(tmp_path, monkeypatch):
+    """ Com quantização, a matriz float32 do índice global segue mapeada no .npy exportado (sem cópia por worker). """
+    monkeypatch.setattr('agent.vector_index.DIRETORIO_MATRIZES_QUANTIZADAS', str(tmp_path / 'temporarias'))
+    matriz = _corpus(20)
+    np.save(tmp_path / 'mentor.v1.npy', matriz)
+    sidecar = {'ids': [f'c{i}' for i in range(20)], 'textos': [f'conceito {i}' for i in range(20)]}
+    (tmp_path / 'mentor.v1.json').write_text(json.dumps(sidecar))
+
+    indice = global_index.carregar_indice_mapeado('mentor', 'v1', str(tmp_path), quantizacao='int8')
+
+    assert isinstance(indice._matriz, np.memmap)
+    assert indice._matriz.filename == str(tmp_path / 'mentor.v1.npy')
+    assert not (tmp_path / 'temporarias').exists()
+    assert indice.nbytes < matriz.nbytes
@@ -0,0 +1,47 @@
+import numpy as np
+
+from .recuperacao import (
+    MARCADOR_CORTE,
+    aparar_texto,
+    aplicar_orcamento,
+    estimar_tokens,
+    nao_redundantes,
+    perfil_recuperacao,
+)
+
+
+def test_perfil_por_papel_com_fallback_para_mentor():
+    assert perfil_recuperacao('Atendente').top_k == 3
+    assert perfil_recuperacao('desconhecido') is perfil_recuperacao('mentor')
+
+
+def test_orcamento_mantem_curtos_e_apara_os_longos():
+    """ Contextos curtos entram inteiros; os longos dividem o que sobra do orçamento. """
+    curto, longo, medio = "a" * 40, "palavra " * 200, "b" * 400
+    resultado = aplicar_orcamento([curto, longo, medio], max_tokens=100, minimo_por_trecho=10)
+
+    assert resultado[0] == curto
+    assert resultado[1].endswith(MARCADOR_CORTE) and resultado[2].endswith(MARCADOR_CORTE)
+    assert sum(estimar_tokens(c) for c in resultado) <= 100
+    assert aplicar_orcamento([curto, medio], max_tokens=1000) == [curto, medio]
+
+
+def test_orcamento_descarta_os_menos_relevantes_quando_nao_cabem():
+    contextos = ["x" * 400] * 5
+    assert len(aplicar_orcamento(contextos, max_tokens=100, minimo_por_trecho=40)) == 2
+    assert aparar_texto("uma frase curta", 100) == "uma frase curta"
+
+
+def test_descarta_candidatos_quase_identicos_mantendo_o_mais_relevante():
+    """ Pelo cosseno dos embeddings: paráfrases muito próximas viram uma só; linhas sem vetor ficam. """
+    vetores = np.array([
+        [1.0, 0.0, 0.0],
+        [0.0, 1.0, 0.0],
+        [0.99, 0.14, 0.0],  # quase o primeiro
+        [0.0, 0.0, 0.0],  # candidato sem vetor
+        [0.7, 0.7, 0.14],  # relacionado, mas distinto
+    ], dtype=np.float32)
+    vetores /= np.maximum(np.linalg.norm(vetores, axis=1, keepdims=True), 1e-9)
+
+    assert nao_redundantes(vetores, limiar=0.95) == [0, 1, 3, 4]
+    assert nao_redundantes(vetores[:1]) == [0]
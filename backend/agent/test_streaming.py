@@ -0,0 +1,102 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from . import streaming
+
+
+def resposta_sse(status_code=200, linhas=(), text=''):
+    response = MagicMock()
+    response.status_code = status_code
+    response.text = text
+    response.iter_lines.return_value = iter(linhas)
+    return response
+
+
+def linhas_groq(*textos, fim=True):
+    linhas = [f"data: {json.dumps({'choices': [{'delta': {'content': t}}]})}" for t in textos]
+    return linhas + (['data: [DONE]'] if fim else [])
+
+
+def linhas_google(*textos):
+    return [f"data: {json.dumps({'candidates': [{'content': {'parts': [{'text': t}]}}]})}" for t in textos]
+
+
+def eventos(sse: str):
+    """Converte a saída de eventos_chat em [(evento, dados)]."""
+    resultado = []
+    for bloco in sse.strip().split("\n\n"):
+        evento, dados = bloco.split("\n")
+        resultado.append((evento[len("event: "):], json.loads(dados[len("data: "):])))
+    return resultado
+
+
+@patch('agent.streaming.requests.post')
+def test_fallback_para_google_antes_do_primeiro_token(mock_post):
+    """ Groq falha antes de qualquer token: o fluxo segue pelo Gemini e o cliente só vê a resposta dele. """
+    mock_post.side_effect = [
+        resposta_sse(500, text='Erro interno'),
+        resposta_sse(linhas=linhas_google('Olá', ', mundo')),
+    ]
+    tentativas = [('groq', 'groq', 'gsk'), ('google_user', 'google', 'AIza')]
+
+    resultado = list(streaming.transmitir_resposta('prompt', tentativas))
+
+    assert resultado == [
+        ('inicio', {'ia_usada': 'google_user'}),
+        ('token', {'texto': 'Olá'}),
+        ('token', {'texto': ', mundo'}),
+        ('fim', {'ia_usada': 'google_user'}),
+    ]
+    assert mock_post.call_args.kwargs['params']['alt'] == 'sse'
+
+
+@patch('agent.streaming.requests.post')
+def test_falha_no_meio_do_fluxo_nao_troca_de_provedor(mock_post):
+    """ Depois do primeiro token, uma falha encerra com 'erro' em vez de misturar respostas de outro provedor. """
+    groq = resposta_sse(linhas=linhas_groq('Parte', fim=False))
+    groq.iter_lines.return_value = iter(list(groq.iter_lines.return_value) + ['data: {"error": "overloaded"}'])
+    mock_post.side_effect = [groq]
+    tentativas = [('groq', 'groq', 'gsk'), ('google_user', 'google', 'AIza')]
+
+    resultado = list(streaming.transmitir_resposta('prompt', tentativas))
+
+    assert resultado[:2] == [('inicio', {'ia_usada': 'groq'}), ('token', {'texto': 'Parte'})]
+    assert resultado[-1][0] == 'erro' and resultado[-1][1]['codigo'] == 'INTERROMPIDO'
+    assert mock_post.call_count == 1
+    groq.close.assert_called()
+
+
+@patch('agent.streaming.requests.post')
+def test_todas_as_chaves_sem_quota(mock_post):
+    mock_post.return_value = resposta_sse(429)
+
+    resultado = list(streaming.transmitir_resposta('prompt', [('google_owner_key_1', 'google', 'AIza1234')]))
+
+    assert resultado == [('erro', {'codigo': 'QUOTA_EXCEEDED', 'erro': resultado[0][1]['erro']})]
+
+
+@patch('agent.streaming.utils.get_owner_google_keys', return_value=['dono'])
+@patch('agent.streaming.utils.montar_prompt_usuario', return_value=('prompt', ['ctx1', 'ctx2']))
+@patch('agent.streaming.requests.post')
+def test_eventos_chat_reporta_contexto_e_tempo_ate_primeiro_token(mock_post, mock_prompt, mock_owner, monkeypatch):
+    monkeypatch.delenv('GROQ_API_KEY', raising=False)
+    mock_post.return_value = resposta_sse(linhas=linhas_groq('Resposta'))
+
+    resultado = eventos(''.join(streaming.eventos_chat('u1', 'pergunta', groq_api_key='gsk')))
+
+    assert [evento for evento, _ in resultado] == ['contexto', 'inicio', 'token', 'fim']
+    assert resultado[0][1] == {'num_contextos': 2}
+    fim = resultado[-1][1]
+    assert (fim['ia_usada'], fim['num_contextos']) == ('groq', 2)
+    assert 0 <= fim['ms_primeiro_token'] <= fim['ms_total']
+    assert mock_post.call_args.kwargs['json']['stream'] is True
+
+
+def test_ordem_das_tentativas(monkeypatch):
+    monkeypatch.setenv('GROQ_API_KEY', 'dono_groq')
+    with patch('agent.streaming.utils.get_owner_google_keys', return_value=['g1', 'g2']):
+        tentativas = streaming.tentativas_de_provedores('google', 'gsk', 'AIza')
+
+    assert [ia for ia, _, _ in tentativas] == [
+        'google_user', 'groq', 'groq_owner', 'google_owner_key_1', 'google_owner_key_2'
+    ]
@@ -1,16 +1,69 @@
 
 import pytest
 from unittest.mock import patch, MagicMock
+import threading
 import numpy as np
 import requests
 
 # Importa as funções do seu utilitário
-from . import utils
+from . import chunking, utils
+from .embedding_cache import CacheEmbeddings
+from .global_index import IndicesGlobaisMapeados
+from .vector_index import CacheIndicesUsuario
+from .vector_store import ArmazemFirestore, ArmazemLocal
 
 # Marcador para todos os testes neste arquivo usarem o banco de dados
 pytestmark = pytest.mark.django_db
 
 
+@pytest.fixture(autouse=True)
+def cache_indices_limpo(monkeypatch, tmp_path):
+    """ Isola cada teste dos índices em memória/disco compartilhados pelo processo. """
+    monkeypatch.setattr(utils, 'armazem_vetorial', ArmazemFirestore(
+        lambda: utils.init_firebase(),
+        CacheIndicesUsuario(max_bytes=1 << 20, ttl=60),
+        IndicesGlobaisMapeados(str(tmp_path), intervalo=0),
+        cache_lexico=CacheIndicesUsuario(max_bytes=1 << 20, ttl=60),
+    ))
+    monkeypatch.setattr(utils, 'cache_embeddings', CacheEmbeddings(None))
+    monkeypatch.setattr(utils, 'cache_embeddings_documentos', CacheEmbeddings(None))
+
+
+def _mock_firestore(privado, globais=()):
+    """
+    Cliente Firestore falso para a busca em duas fases: cada fluxo é uma lista
+    de (doc_id, dados). A projeção de cada collection devolve seus documentos
+    e o get_all devolve os textos por id.
+    """
+    todos = {doc_id: dados for fluxo in (privado, globais) for doc_id, dados in fluxo}
+
+    def colecao(fluxo):
+        docs = []
+        for doc_id, dados in fluxo:
+            doc = MagicMock(id=doc_id)
+            doc.to_dict.return_value = dados
+            docs.append(doc)
+        mock_colecao = MagicMock()
+        mock_colecao.select.return_value.stream.return_value = docs
+        mock_colecao.document.side_effect = lambda doc_id: MagicMock(id=doc_id)
+        return mock_colecao
+
+    def get_all(refs, field_paths=None):
+        for ref in refs:
+            snap = MagicMock(id=ref.id, exists=ref.id in todos)
+            snap.to_dict.return_value = {k: v for k, v in todos.get(ref.id, {}).items() if k in field_paths}
+            yield snap
+
+    raizes = {'users': MagicMock(), 'global_knowledge': MagicMock()}
+    raizes['users'].document.return_value.collection.return_value = colecao(privado)
+    raizes['global_knowledge'].document.return_value.collection.return_value = colecao(globais)
+
+    db = MagicMock()
+    db.collection.side_effect = lambda nome: raizes[nome]
+    db.get_all.side_effect = get_all
+    return db
+
+
 @patch('os.environ.get')
 @patch('agent.utils.requests.post')
 @patch('agent.utils.init_firebase')
@@ -30,6 +83,7 @@ def test_salvar_contexto_usuario_sucesso(mock_init_firebase, mock_requests_post,
     mock_firestore_db = MagicMock()
     mock_user_doc = MagicMock()
     mock_collection = MagicMock()
+    mock_collection.add.return_value = (None, MagicMock(id="novo_doc"))
     mock_user_doc.collection.return_value = mock_collection
     mock_firestore_db.collection.return_value.document.return_value = mock_user_doc
     mock_init_firebase.return_value = mock_firestore_db
@@ -43,7 +97,8 @@ def test_salvar_contexto_usuario_sucesso(mock_init_firebase, mock_requests_post,
     mock_collection.add.assert_called_once()
     saved_data = mock_collection.add.call_args[0][0]
     assert saved_data['contexto'] == "Eu sou um desenvolvedor Python."
-    assert saved_data['embedding'] == [0.1, 0.2, 0.3]
+    assert np.allclose(saved_data['embedding'], np.array([0.1, 0.2, 0.3]) / np.linalg.norm([0.1, 0.2, 0.3]))
+    assert saved_data['embedding_normalizado'] is True
 
 @patch('os.environ.get')
 @patch('agent.utils.requests.post')
@@ -76,16 +131,11 @@ def test_buscar_contextos_relevantes_sucesso(mock_init_firebase, mock_requests_p
         'embedding': {'values': [1.0, 0.0, 0.0]}
     }
     mock_requests_post.return_value = mock_embedding_response
-    doc1_data = {'contexto': 'Gosto de cachorros', 'embedding': [0.9, 0.1, 0.0]}
-    doc2_data = {'contexto': 'Gosto de gatos', 'embedding': [0.2, 0.8, 0.1]}
-    doc3_data = {'contexto': 'Gosto de pássaros', 'embedding': [0.5, 0.5, 0.5]}
-    mock_doc1, mock_doc2, mock_doc3 = MagicMock(), MagicMock(), MagicMock()
-    mock_doc1.to_dict.return_value = doc1_data
-    mock_doc2.to_dict.return_value = doc2_data
-    mock_doc3.to_dict.return_value = doc3_data
-    mock_firestore_db = MagicMock()
-    mock_firestore_db.collection.return_value.document.return_value.collection.return_value.stream.return_value = [mock_doc1, mock_doc2, mock_doc3]
-    mock_init_firebase.return_value = mock_firestore_db
+    mock_init_firebase.return_value = _mock_firestore([
+        ('d1', {'contexto': 'Gosto de cachorros', 'embedding': [0.9, 0.1, 0.0]}),
+        ('d2', {'contexto': 'Gosto de gatos', 'embedding': [0.2, 0.8, 0.1]}),
+        ('d3', {'contexto': 'Gosto de pássaros', 'embedding': [0.5, 0.5, 0.5]}),
+    ])
 
     # --- Execução ---
     contextos = utils.buscar_contextos_relevantes("test_user_abc", "animal de estimação", top_k=2)
@@ -186,3 +236,254 @@ def test_gerar_prompt_sistema_sem_contexto():
     assert "OBSERVAÇÃO:" in prompt
     assert "Este usuário ainda não adicionou contextos pessoais" in prompt
     assert "CONTEXTO DO USUÁRIO:" not in prompt
+
+
+@patch('agent.utils.gerar_embedding_google')
+@patch('agent.utils.init_firebase')
+def test_buscar_contextos_relevantes_combina_privado_e_global(mock_init_firebase, mock_embedding):
+    """
+    Testa se os fluxos privado e global são pontuados juntos, se documentos
+    com dimensão diferente são ignorados e se só os textos dos vencedores são lidos.
+    """
+    mock_embedding.return_value = [1.0, 0.0, 0.0]
+    db = _mock_firestore(
+        [
+            ('p1', {'contexto': 'Nota privada', 'embedding': [0.6, 0.8, 0.0]}),
+            ('p2', {'contexto': 'Nota antiga', 'embedding': [1.0, 0.0]}),
+            ('p3', {'contexto': 'Nota irrelevante', 'embedding': [0.0, 0.0, 1.0]}),
+        ],
+        [('g1', {'content': 'Conceito global', 'embedding': [0.95, 0.05, 0.0]})],
+    )
+    mock_init_firebase.return_value = db
+
+    contextos = utils.buscar_contextos_relevantes("user", "query", top_k=2, role="mentor")
+
+    assert contextos == ['Conceito global', 'Nota privada']
+    ids_lidos = [ref.id for chamada in db.get_all.call_args_list for ref in chamada[0][0]]
+    assert sorted(ids_lidos) == ['g1', 'p1']
+
+
+@patch('agent.utils.gerar_embedding_google')
+@patch('agent.utils.init_firebase')
+def test_buscar_contextos_reagrupa_chunks_do_mesmo_contexto(mock_init_firebase, mock_embedding):
+    """ Chunks vencedores de um mesmo contexto voltam como um único trecho, sem a sobreposição. """
+    mock_embedding.return_value = [1.0, 0.0]
+    chunk = {'contexto_pai': 'pai1'}
+    db = _mock_firestore([
+        ('c1', {**chunk, 'contexto': 'mundo. Tudo bem?', 'embedding': [1.0, 0.0], 'chunk_indice': 1, 'chunk_inicio': 5}),
+        ('n1', {'contexto': 'Nota solta', 'embedding': [0.8, 0.6]}),
+        ('c0', {**chunk, 'contexto': 'Olá, mundo.', 'embedding': [0.6, 0.8], 'chunk_indice': 0, 'chunk_inicio': 0}),
+    ])
+    mock_init_firebase.return_value = db
+
+    contextos = utils.buscar_contextos_relevantes("user", "query", top_k=3)
+
+    assert contextos == ['Olá, mundo. Tudo bem?', 'Nota solta']
+
+
+@patch('agent.utils.gerar_embedding_google')
+@patch('agent.utils.init_firebase')
+def test_buscar_contextos_embedding_e_firestore_em_paralelo(mock_init_firebase, mock_embedding):
+    """
+    A leitura do Firestore não deve esperar o embedding da query terminar,
+    e uma falha no embedding continua resultando em lista vazia.
+    """
+    firestore_lido = threading.Event()
+    db = _mock_firestore([('p1', {'contexto': 'Nota', 'embedding': [1.0, 0.0]})])
+    projecao = db.collection('users').document('user').collection('inteligencia_critica').select.return_value
+    docs = projecao.stream.return_value
+
+    def stream():
+        firestore_lido.set()
+        return docs
+
+    projecao.stream.side_effect = stream
+    mock_init_firebase.return_value = db
+
+    def embedding_lento(texto):
+        assert firestore_lido.wait(timeout=5), "Firestore só foi lido depois do embedding"
+        raise Exception("Quota Excedida")
+
+    mock_embedding.side_effect = embedding_lento
+
+    assert utils.buscar_contextos_relevantes("user", "query") == []
+    assert firestore_lido.is_set()
+
+
+@patch('agent.utils.gerar_embedding_google')
+def test_gerar_embedding_consulta_usa_cache(mock_embedding):
+    """ Perguntas repetidas (com outra caixa/espaçamento) não chamam a API de novo. """
+    mock_embedding.return_value = [0.1, 0.2]
+
+    primeiro = utils.gerar_embedding_consulta("Como  organizar meu dia?", role="mentor")
+    segundo = utils.gerar_embedding_consulta("como organizar meu dia?", role="mentor")
+    utils.gerar_embedding_consulta("como organizar meu dia?", role="professor")
+
+    assert np.allclose(primeiro, segundo)
+    assert mock_embedding.call_count == 2
+    mock_embedding.assert_any_call("Contexto para mentor: Como  organizar meu dia?")
+
+
+def _resposta(status_code, dados=None, texto=''):
+    resposta = MagicMock(status_code=status_code, text=texto)
+    resposta.json.return_value = dados
+    return resposta
+
+
+@patch('agent.utils.chaves_embedding_google', return_value=['chave1', 'chave2'])
+@patch('agent.utils.requests.post')
+def test_gerar_embeddings_em_lote_rotaciona_e_completa_item_a_item(mock_post, mock_chaves):
+    """
+    Um lote em cota passa para a próxima chave; itens que faltarem na resposta
+    do lote são refeitos individualmente via embedContent.
+    """
+    def post(url, json=None, timeout=None):
+        if ':batchEmbedContents' in url:
+            if 'key=chave1' in url:
+                return _resposta(429, texto='quota')
+            return _resposta(200, {'embeddings': [{'values': [1.0]}, {'values': [2.0]}]})
+        return _resposta(200, {'embedding': {'values': [3.0]}})
+
+    mock_post.side_effect = post
+
+    resultado = utils.gerar_embeddings_em_lote(['a', 'b', 'c'])
+
+    assert resultado == [[1.0], [2.0], [3.0]]
+    urls = [chamada[0][0] for chamada in mock_post.call_args_list]
+    assert sum(':batchEmbedContents' in u for u in urls) == 2
+    assert sum(':embedContent' in u for u in urls) == 1
+
+
+def test_requisicao_embedding_pede_dimensao_reduzida(monkeypatch):
+    """ outputDimensionality só é enviado quando a dimensão configurada não é a completa. """
+    assert 'outputDimensionality' not in utils.requisicao_embedding('texto')
+
+    monkeypatch.setattr(utils, 'DIMENSAO_EMBEDDING', 768)
+    assert utils.requisicao_embedding('texto')['outputDimensionality'] == 768
+
+
+def test_dividir_em_lotes_respeita_limites(monkeypatch):
+    """ Lotes não passam de 100 itens nem do limite de caracteres. """
+    assert [len(l) for l in utils.dividir_em_lotes(['x'] * 250)] == [100, 100, 50]
+
+    monkeypatch.setattr(utils, 'LOTE_EMBEDDING_MAX_CARACTERES', 10)
+    assert utils.dividir_em_lotes(['12345', '12345', '1', '123456789012']) == [[0, 1], [2], [3]]
+
+
+@patch('agent.utils.gerar_embeddings_em_lote')
+@patch('agent.utils.init_firebase')
+def test_salvar_contextos_em_lote_usa_write_batch(mock_init_firebase, mock_lote, monkeypatch):
+    """ Escritas são agrupadas em WriteBatch e falhas de embedding ficam por item. """
+    monkeypatch.setattr(utils, 'LOTE_FIRESTORE_MAX_ESCRITAS', 2)
+    mock_lote.return_value = [[3.0, 4.0], None, [1.0, 0.0], [0.0, 2.0]]
+    db = MagicMock()
+    ids = iter(['d0', 'd2', 'd3'])
+    db.collection.return_value.document.return_value.collection.return_value.document.side_effect = (
+        lambda doc_id=None: MagicMock(id=doc_id or next(ids))
+    )
+    mock_init_firebase.return_value = db
+
+    resultado = utils.salvar_contextos_usuario_em_lote('u1', ['a', 'b', 'c', 'd'])
+
+    assert [sucesso for sucesso, _ in resultado] == [True, False, True, True]
+    assert db.batch.return_value.commit.call_count == 2
+    dados = db.batch.return_value.set.call_args_list[0][0][1]
+    assert dados['embedding_normalizado'] is True
+    assert dados['embedding'] == pytest.approx([0.6, 0.8])
+
+
+@patch('agent.utils.gerar_embeddings_em_lote')
+@patch('agent.utils.init_firebase')
+def test_salvar_contexto_longo_grava_chunks_ligados_ao_pai(mock_init_firebase, mock_lote, monkeypatch):
+    """ Um contexto longo vira vários documentos com o mesmo contexto_pai, num único WriteBatch. """
+    monkeypatch.setattr(utils, 'dividir_em_chunks', lambda texto: chunking.dividir_em_chunks(texto, 40, 10))
+    mock_lote.side_effect = lambda textos: [[1.0, 0.0]] * len(textos)
+    db = MagicMock()
+    mock_init_firebase.return_value = db
+
+    sucesso, erro = utils.salvar_contexto_usuario('u1', 'Primeira frase do texto. Segunda frase do texto. Terceira.')
+
+    assert sucesso is True and erro is None
+    documentos = [chamada[0][1] for chamada in db.batch.return_value.set.call_args_list]
+    assert len(documentos) > 1
+    assert len({d['contexto_pai'] for d in documentos}) == 1
+    assert [d['chunk_indice'] for d in documentos] == list(range(len(documentos)))
+    db.batch.return_value.commit.assert_called_once()
+
+
+@patch('agent.utils.gerar_embeddings_em_lote')
+def test_contextos_duplicados_nao_geram_embedding_nem_documento(mock_lote, monkeypatch, tmp_path):
+    """
+    Texto já salvo (após normalizar espaços e caixa) ou repetido no lote não é
+    gravado de novo; texto idêntico de outro usuário reaproveita o embedding.
+    """
+    armazem = ArmazemLocal(str(tmp_path / 'store.sqlite3'), CacheIndicesUsuario(max_bytes=1 << 20, ttl=60),
+                           cache_lexico=CacheIndicesUsuario(max_bytes=1 << 20, ttl=60))
+    monkeypatch.setattr(utils, 'armazem_vetorial', armazem)
+    mock_lote.side_effect = lambda textos: [[float(len(t)), 1.0] for t in textos]
+
+    resultado = utils.salvar_contextos_usuario_em_lote('u1', ['Nota A', 'nota   a', 'Nota B'])
+    assert resultado == [(True, None)] * 3
+    assert mock_lote.call_args[0][0] == ['Nota A', 'Nota B']
+    assert armazem.contar('users/u1') == 2
+
+    assert utils.salvar_contexto_usuario('u1', ' NOTA A ') == (True, None)
+    assert utils.salvar_contexto_usuario('u2', 'Nota B') == (True, None)
+    assert mock_lote.call_count == 1
+    assert armazem.contar('users/u1') == 2
+    assert armazem.contar('users/u2') == 1
+
+
+@patch('agent.utils.gerar_embedding_consulta')
+def test_buscar_contextos_usa_busca_lexica_sem_embedding(mock_embedding, tmp_path, monkeypatch):
+    """ Sem o embedding da pergunta (cota esgotada), o BM25 ainda encontra o contexto. """
+    armazem = ArmazemLocal(str(tmp_path / 'store.sqlite3'), CacheIndicesUsuario(max_bytes=1 << 20, ttl=60),
+                           cache_lexico=CacheIndicesUsuario(max_bytes=1 << 20, ttl=60))
+    monkeypatch.setattr(utils, 'armazem_vetorial', armazem)
+    armazem.adicionar_varios('users/u1', [
+        {'texto': 'Reunião de OKRs na sexta', 'embedding': [1.0, 0.0]},
+        {'texto': 'Prefiro café sem açúcar', 'embedding': [0.0, 1.0]},
+    ])
+    mock_embedding.side_effect = utils.QuotaExceededError("cota esgotada")
+
+    assert utils.buscar_contextos_relevantes('u1', 'quando são os okrs?') == ['Reunião de OKRs na sexta']
+
+
+@patch('agent.utils.gerar_embedding_consulta', return_value=[1.0, 0.0])
+def test_buscar_contextos_descarta_redundantes_pelos_embeddings(mock_embedding, tmp_path, monkeypatch):
+    """ A paráfrase quase idêntica sai antes da fase 2, mesmo sem palavras em comum. """
+    armazem = ArmazemLocal(str(tmp_path / 'store.sqlite3'), CacheIndicesUsuario(max_bytes=1 << 20, ttl=60),
+                           cache_lexico=CacheIndicesUsuario(max_bytes=1 << 20, ttl=60))
+    monkeypatch.setattr(utils, 'armazem_vetorial', armazem)
+    armazem.adicionar_varios('users/u1', [
+        {'texto': 'Corro 10 km três vezes por semana', 'embedding': [0.99, 0.1]},
+        {'texto': 'Meu treino: trinta quilômetros semanais', 'embedding': [0.98, 0.12]},
+        {'texto': 'Prefiro café sem açúcar', 'embedding': [0.6, 0.8]},
+    ])
+
+    assert utils.buscar_contextos_relevantes('u1', 'exercícios', top_k=3, limiar_redundancia=0.95) == [
+        'Corro 10 km três vezes por semana', 'Prefiro café sem açúcar'
+    ]
+    assert len(utils.buscar_contextos_relevantes('u1', 'exercícios', top_k=3)) == 3
+
+
+@patch('agent.utils.gerar_embedding_consulta', return_value=[1.0, 0.0])
+def test_redundantes_sao_repostos_e_so_os_top_k_sao_lidos(mock_embedding, tmp_path, monkeypatch):
+    """ O candidato extra repõe o redundante e a fase 2 lê apenas os top_k vencedores. """
+    armazem = ArmazemLocal(str(tmp_path / 'store.sqlite3'), CacheIndicesUsuario(max_bytes=1 << 20, ttl=60),
+                           cache_lexico=CacheIndicesUsuario(max_bytes=1 << 20, ttl=60))
+    monkeypatch.setattr(utils, 'armazem_vetorial', armazem)
+    armazem.adicionar_varios('users/u1', [
+        {'texto': 'Corro 10 km três vezes por semana', 'embedding': [0.99, 0.1]},
+        {'texto': 'Meu treino: trinta quilômetros semanais', 'embedding': [0.98, 0.12]},
+        {'texto': 'Prefiro café sem açúcar', 'embedding': [0.6, 0.8]},
+        {'texto': 'Durmo às onze', 'embedding': [0.1, 0.99]},
+    ])
+    ler_documentos = armazem.ler_documentos
+    lidos = []
+    monkeypatch.setattr(armazem, 'ler_documentos', lambda escopo, ids: lidos.extend(ids) or ler_documentos(escopo, ids))
+
+    assert utils.buscar_contextos_relevantes('u1', 'exercícios', top_k=2, limiar_redundancia=0.95) == [
+        'Corro 10 km três vezes por semana', 'Prefiro café sem açúcar'
+    ]
+    assert len(lidos) == 2
@@ -0,0 +1,91 @@
+import numpy as np
+
+from . import vector_index
+
+
+def test_similaridade_cosseno_equivale_ao_calculo_por_documento():
+    """ A versão vetorizada deve bater com o np.dot / normas documento a documento. """
+    query = [1.0, 0.0, 0.0]
+    embeddings = [[0.9, 0.1, 0.0], [0.2, 0.8, 0.1], [0.5, 0.5, 0.5]]
+
+    scores = vector_index.similaridade_cosseno(query, vector_index.montar_matriz(embeddings))
+
+    esperado = [np.dot(query, e) / (np.linalg.norm(query) * np.linalg.norm(e)) for e in embeddings]
+    assert np.allclose(scores, esperado, atol=1e-6)
+
+
+def test_selecionar_top_k_ordena_apenas_os_vencedores():
+    """ Testa se o top_k vem em ordem decrescente e respeita o tamanho pedido. """
+    scores = np.array([0.1, 0.9, 0.3, 0.7, 0.5], dtype=np.float32)
+
+    indices, top_scores = vector_index.selecionar_top_k(scores, 3)
+
+    assert indices.tolist() == [1, 3, 4]
+    assert np.allclose(top_scores, [0.9, 0.7, 0.5])
+
+
+def test_selecionar_top_k_maior_que_total():
+    """ Pedir mais itens do que existem devolve todos, ordenados. """
+    indices, _ = vector_index.selecionar_top_k(np.array([0.2, 0.8], dtype=np.float32), 5)
+    assert indices.tolist() == [1, 0]
+
+    vazio, _ = vector_index.selecionar_top_k(np.empty(0, dtype=np.float32), 5)
+    assert vazio.size == 0
+
+
+def test_indice_vetorial_anexar_normaliza_e_cresce():
+    """ Anexar documentos deve normalizar o vetor e preservar os já existentes. """
+    indice = vector_index.IndiceVetorial.de_embeddings(['a'], ['texto a'], [[3.0, 4.0]])
+
+    for i in range(10):
+        assert indice.anexar(f'n{i}', f'novo {i}', [0.0, 2.0])
+
+    assert len(indice) == 11
+    assert np.allclose(indice.matriz[0], [0.6, 0.8])
+    assert np.allclose(indice.matriz[-1], [0.0, 1.0])
+    assert indice.anexar('x', 'dimensão errada', [1.0, 0.0, 0.0]) is False
+
+
+def test_ranquear_indices_combina_fontes():
+    """ Testa o ranking conjunto de vários índices. """
+    privado = vector_index.IndiceVetorial.de_embeddings(['p'], ['privado'], [[0.6, 0.8]])
+    glob = vector_index.IndiceVetorial.de_embeddings(['g1', 'g2'], ['global 1', 'global 2'], [[1.0, 0.1], [0.0, 1.0]])
+
+    ranking = vector_index.ranquear_indices([1.0, 0.0], [privado, glob], top_k=2)
+
+    assert [indice.textos[pos] for indice, pos, _ in ranking] == ['global 1', 'privado']
+
+
+def test_cache_indices_usuario_lru_por_bytes():
+    """ O cache deve despejar o usuário menos recente ao passar do limite de bytes. """
+    def indice(texto):
+        return vector_index.IndiceVetorial.de_embeddings(['id'], [texto], [[1.0] * 8])
+
+    tamanho = indice('x').nbytes
+    cache = vector_index.CacheIndicesUsuario(max_bytes=tamanho * 2, ttl=60)
+    cache.armazenar('u1', indice('x'))
+    cache.armazenar('u2', indice('x'))
+    assert cache.obter('u1') is not None  # u1 passa a ser o mais recente
+    cache.armazenar('u3', indice('x'))
+
+    assert cache.obter('u2') is None
+    assert cache.obter('u3') is not None
+    assert cache.anexar('u1', 'id2', 'y', [1.0] * 8)
+
+    stats = cache.estatisticas()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['evictions'] >= 1
+    assert stats['bytes'] <= stats['max_bytes']
+
+
+def test_indice_respeita_embeddings_ja_normalizados():
+    """ Vetores marcados como normalizados não têm a norma recalculada. """
+    embedding = vector_index.normalizar_embedding([3.0, 4.0])
+    assert np.allclose(embedding, [0.6, 0.8])
+
+    indice = vector_index.IndiceVetorial.de_embeddings(
+        ['a', 'b'], ['a', 'b'], [embedding, [0.0, 5.0]], normalizados=[True, False]
+    )
+
+    assert np.allclose(indice.matriz, [[0.6, 0.8], [0.0, 1.0]])
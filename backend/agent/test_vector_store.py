@@ -0,0 +1,163 @@
+import time
+
+import pytest
+
+from .filtros import FiltroBusca
+from .vector_index import CacheIndicesUsuario
+from .vector_store import ArmazemLocal, ArmazemVetorial, criar_armazem, escopo_global, escopo_usuario
+
+
+@pytest.fixture
+def armazem(tmp_path):
+    return ArmazemLocal(str(tmp_path / 'store.sqlite3'), CacheIndicesUsuario(max_bytes=1 << 20, ttl=60),
+                        cache_lexico=CacheIndicesUsuario(max_bytes=1 << 20, ttl=60))
+
+
+def test_armazem_local_adiciona_busca_e_reagrupa_chunks(armazem):
+    """ O backend local grava, busca nos escopos combinados e reagrupa chunks, sem rede. """
+    usuario, papel = escopo_usuario('u1'), escopo_global('Mentor')
+    armazem.adicionar_varios(usuario, [
+        {'texto': 'Olá, mundo.', 'embedding': [0.6, 0.8], 'contexto_pai': 'p', 'chunk_indice': 0, 'chunk_inicio': 0},
+        {'texto': 'mundo. Tudo bem?', 'embedding': [1.0, 0.0], 'contexto_pai': 'p', 'chunk_indice': 1, 'chunk_inicio': 5},
+        {'texto': 'Irrelevante', 'embedding': [-1.0, 0.0]},
+    ])
+    armazem.adicionar(papel, {'texto': 'Conceito global', 'embedding': [0.8, 0.6]})
+
+    assert armazem.contar(usuario) == 3
+    assert armazem.contar(papel) == 1
+    assert armazem.buscar([usuario, papel], [1.0, 0.0], top_k=3) == ['Olá, mundo. Tudo bem?', 'Conceito global']
+
+
+def test_armazem_local_remove_e_mantem_cache_coerente(armazem):
+    """ Inclusões atualizam o índice em cache; remoções o invalidam. """
+    escopo = escopo_usuario('u1')
+    assert armazem.buscar([escopo], [1.0, 0.0], top_k=1) == []  # aquece o cache com o índice vazio
+
+    primeiro, segundo = armazem.adicionar_varios(escopo, [
+        {'texto': 'A', 'embedding': [1.0, 0.0]},
+        {'texto': 'B', 'embedding': [0.0, 1.0]},
+    ])
+    assert armazem.buscar([escopo], [1.0, 0.0], top_k=1) == ['A']
+
+    assert armazem.remover(escopo, [primeiro]) == 1
+    assert armazem.contar(escopo) == 1
+    assert armazem.buscar([escopo], [1.0, 0.0], top_k=1) == ['B']
+
+
+def test_armazem_ignora_e_regera_embeddings_de_outra_dimensao(tmp_path):
+    """ Vetores de outra dimensão ficam fora da busca até serem regerados. """
+    armazem = ArmazemLocal(str(tmp_path / 'store.sqlite3'), CacheIndicesUsuario(max_bytes=1 << 20, ttl=60), dimensao=2,
+                           cache_lexico=CacheIndicesUsuario(max_bytes=1 << 20, ttl=60))
+    escopo = escopo_usuario('u1')
+    antigo, novo = armazem.adicionar_varios(escopo, [
+        {'texto': 'Antigo', 'embedding': [1.0, 0.0, 0.0]},
+        {'texto': 'Novo', 'embedding': [0.0, 1.0]},
+    ])
+    assert armazem.buscar([escopo], [0.0, 1.0], top_k=2) == ['Novo']
+    assert armazem.escopos() == [escopo]
+    assert armazem.documentos_fora_da_dimensao(escopo, 2) == [(antigo, 'Antigo')]
+
+    assert armazem.atualizar_embeddings(escopo, {antigo: [0.6, 0.8]}) == 1
+    assert armazem.documentos_fora_da_dimensao(escopo, 2) == []
+    assert armazem.buscar([escopo], [0.0, 1.0], top_k=2) == ['Novo', 'Antigo']
+    assert armazem.buscar([escopo], [1.0, 0.0], top_k=1) == ['Antigo']
+
+
+def test_armazem_local_regravar_com_id_sobrescreve(armazem):
+    """ Documentos com id determinístico (reenvio da outbox) não são duplicados. """
+    escopo = escopo_usuario('u1')
+    for texto in ('Versão 1', 'Versão 2'):
+        assert armazem.adicionar(escopo, {'id': 'ctx-1', 'texto': texto, 'embedding': [1.0, 0.0]}) == 'ctx-1'
+    assert armazem.contar(escopo) == 1
+    assert armazem.ler_documentos(escopo, ['ctx-1'])['ctx-1']['texto'] == 'Versão 2'
+
+
+def test_regravar_com_cache_quente_nao_duplica_no_ranking(armazem):
+    """ Com o índice já em cache, regravar o mesmo id não deixa uma segunda linha (vetorial nem BM25). """
+    escopo = escopo_usuario('u1')
+    armazem.adicionar_varios(escopo, [{'id': 'ctx-2', 'texto': 'Outro assunto', 'embedding': [0.0, 1.0]}])
+    assert armazem.buscar([escopo], [1.0, 0.0], top_k=5, query_texto='reuniao') == ['Outro assunto']  # aquece
+
+    for _ in range(2):
+        armazem.adicionar(escopo, {'id': 'ctx-1', 'texto': 'Pauta da reuniao', 'embedding': [1.0, 0.0]})
+
+    assert armazem.buscar([escopo], [1.0, 0.0], top_k=5, query_texto='reuniao') == [
+        'Pauta da reuniao', 'Outro assunto'
+    ]
+    assert len(armazem.carregar_indice(escopo)) == len(armazem.carregar_indice_lexico(escopo)) == 2
+
+
+def test_criar_armazem_rejeita_backend_desconhecido():
+    with pytest.raises(ValueError):
+        criar_armazem(lambda: None, backend='pinecone')
+
+
+def test_buscar_descarta_contextos_abaixo_do_score_minimo(armazem):
+    escopo = escopo_usuario('u1')
+    armazem.adicionar_varios(escopo, [
+        {'texto': 'Parecido', 'embedding': [0.9, 0.1]},
+        {'texto': 'Distante', 'embedding': [0.1, 0.9]},
+    ])
+    assert armazem.buscar([escopo], [1.0, 0.0], top_k=2, score_minimo=0.5) == ['Parecido']
+
+
+def test_score_minimo_vale_tambem_para_os_acertos_do_bm25(armazem):
+    """ Na busca híbrida, um acerto por palavra-chave pouco similar à pergunta não passa pelo limiar do papel. """
+    escopo = escopo_usuario('u1')
+    armazem.adicionar_varios(escopo, [
+        {'texto': 'Parecido', 'embedding': [0.9, 0.1]},
+        {'texto': 'Sigla XPTO solta', 'embedding': [0.1, 0.9]},
+    ])
+    assert armazem.buscar([escopo], [1.0, 0.0], top_k=2, query_texto='xpto') == ['Sigla XPTO solta', 'Parecido']
+    assert armazem.buscar([escopo], [1.0, 0.0], top_k=2, query_texto='xpto', score_minimo=0.5) == ['Parecido']
+    # Sem embedding (fallback léxico) não há similaridade para comparar
+    assert armazem.buscar([escopo], None, top_k=2, query_texto='xpto', score_minimo=0.5) == ['Sigla XPTO solta']
+
+
+def test_buscar_com_filtro_pontua_so_os_contextos_do_usuario_que_passam(armazem):
+    """ Filtros valem para os contextos do usuário; conceitos globais não têm esses metadados. """
+    usuario, papel = escopo_usuario('u1'), escopo_global('Mentor')
+    armazem.adicionar_varios(usuario, [
+        {'texto': 'Antigo', 'embedding': [1.0, 0.0], 'timestamp': 1000.0, 'tags': ['trabalho']},
+        {'texto': 'Recente', 'embedding': [0.8, 0.6], 'timestamp': 5000.0, 'fonte': 'upload'},
+    ])
+    armazem.adicionar(papel, {'texto': 'Conceito', 'embedding': [0.6, 0.8]})
+    armazem.invalidar(usuario)  # o índice recarregado do SQLite mantém os metadados
+
+    assert armazem.buscar([usuario, papel], [1.0, 0.0], top_k=3, filtro=FiltroBusca(desde=2000.0)) == [
+        'Recente', 'Conceito'
+    ]
+    assert armazem.buscar([usuario], [1.0, 0.0], top_k=3, filtro=FiltroBusca(tags=['Trabalho'])) == ['Antigo']
+    assert armazem.buscar([usuario], None, top_k=3, query_texto='antigo recente',
+                          filtro=FiltroBusca(fontes=['upload'])) == ['Recente']
+
+
+class ArmazemRemoto(ArmazemLocal):
+    """SQLite, mas com a política de BM25 dos backends remotos (sem montagem no caminho da requisição)."""
+    indice_lexico_disponivel = ArmazemVetorial.indice_lexico_disponivel
+
+
+def test_busca_hibrida_monta_bm25_em_segundo_plano(tmp_path, monkeypatch):
+    """ Sem BM25 em cache, a pergunta segue só com o vetorial e o índice léxico é montado fora da requisição. """
+    armazem = ArmazemRemoto(str(tmp_path / 'store.sqlite3'), CacheIndicesUsuario(max_bytes=1 << 20, ttl=60),
+                            cache_lexico=CacheIndicesUsuario(max_bytes=1 << 20, ttl=60))
+    escopo = escopo_usuario('u1')
+    armazem.adicionar_varios(escopo, [
+        {'texto': 'Alfa', 'embedding': [1.0, 0.0]},
+        {'texto': 'Sigla XPTO', 'embedding': [0.0, 1.0]},
+    ])
+    armazem.invalidar(escopo)
+
+    assert armazem.buscar([escopo], [1.0, 0.0], top_k=1, query_texto='xpto') == ['Alfa']
+    for _ in range(100):
+        if armazem.cache_lexico.obter(escopo) is not None:
+            break
+        time.sleep(0.02)
+    assert armazem.buscar([escopo], [1.0, 0.0], top_k=1, query_texto='xpto') == ['Sigla XPTO']
+
+    # Acima do limite, o escopo fica só com o ranking vetorial
+    monkeypatch.setattr('agent.vector_store.LIMITE_DOCS_HIBRIDA', 1)
+    armazem.cache_lexico.invalidar(escopo)
+    assert armazem.indice_lexico_disponivel(escopo, 2) is None
+    time.sleep(0.05)
+    assert armazem.cache_lexico.obter(escopo) is None
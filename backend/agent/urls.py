@@ -3,10 +3,16 @@ from . import views
 
 urlpatterns = [
     path('chat/', views.chat_endpoint, name='chat'),
+    path('chat/stream/', views.chat_stream_endpoint, name='chat_stream'),
 
     path('contextos/', views.ContextListView.as_view(), name='context_list'), # New
+    path('contextos/<int:pk>/', views.ContextDetailView.as_view(), name='context_detail'),
+    path('contextos/lote/', views.ContextBulkCreateView.as_view(), name='context_bulk_create'),
+    path('contextos/upload/', views.ContextUploadView.as_view(), name='context_upload'),
     path('health/', views.health_check, name='health'),
     path('contexto/check/<str:user_id>/', views.check_user_contexts, name='check_contexts'),
     path('api-keys/', views.UserApiKeysView.as_view(), name='user_api_keys'),
     path('personas/', views.PersonaListView.as_view(), name='persona_list'),
+    path('cache/indices/', views.index_cache_stats, name='index_cache_stats'),
+    path('cache/embeddings/', views.embedding_cache_stats, name='embedding_cache_stats'),
 ]
@@ -1,5 +1,5 @@
 import os
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Sequence, Tuple
 import firebase_admin
 from firebase_admin import credentials, firestore
 import google.generativeai as genai
@@ -9,6 +9,36 @@ import requests
 import google.auth
 import traceback
 import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .chunking import CAMPO_INDICE, CAMPO_INICIO, CAMPO_PAI, agrupar_chunks, dividir_em_chunks
+from .embedding_cache import (
+    CAMPO_HASH,
+    REUSAR_EMBEDDINGS_DOCUMENTOS,
+    cache_embeddings,
+    cache_embeddings_documentos,
+    chave_embedding,
+    hash_conteudo,
+)
+from .filtros import FiltroBusca
+from .lexical import BUSCA_HIBRIDA
+from .recuperacao import (
+    CANDIDATOS_EXTRAS,
+    LIMIAR_REDUNDANCIA,
+    aplicar_orcamento,
+    estimar_tokens,
+    perfil_recuperacao,
+)
+from .vector_index import DIMENSAO_EMBEDDING, DIMENSAO_EMBEDDING_COMPLETA, normalizar_embedding
+from .vector_store import (
+    LOTE_FIRESTORE_MAX_ESCRITAS,
+    criar_armazem,
+    descartar_redundantes,
+    escopo_global,
+    escopo_usuario,
+    ranquear_escopos,
+)
 
 
 # Exceções personalizadas para erros de chave de API
@@ -91,6 +121,17 @@ def carregar_persona(nome_arquivo: str) -> str:
         # Fallback para o Mentor se o arquivo falhar
         return "VOCÊ É: Um assistente útil..."
 
+# Pool limitado para as leituras concorrentes do RAG (Firestore/Gemini).
+# Só recebe tarefas "folha": nenhuma tarefa do pool espera por outra do pool.
+executor_rag = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('SENSEI_RAG_THREADS', '8')),
+    thread_name_prefix='sensei-rag',
+)
+
+# Onde os contextos são gravados e buscados (SENSEI_VECTOR_STORE: firestore | local).
+# O cliente Firestore é resolvido a cada uso, não na importação.
+armazem_vetorial = criar_armazem(lambda: init_firebase())
+
 # ID do usuário admin
 ADMIN_USER_ID = os.environ.get("ADMIN_USER_ID", "default_admin_id")
 print(ADMIN_USER_ID)
@@ -98,23 +139,26 @@ print(ADMIN_USER_ID)
 # ============================================ 
 # PROMPT SYSTEM
 # ============================================ 
-def gerar_prompt_sistema(contextos: List[str], role: str = 'mentor') -> str:
-    """
-    Seleciona e carrega a persona correta baseada no papel (role),
-    injetando o contexto do RAG.
-    """
-    # 1. Mapeamento de Papéis para Arquivos
+def arquivo_persona(role: str) -> str:
+    """Mapeamento de Papéis para Arquivos"""
     mapa_personas = {
         'mentor': 'mentor_sensei.txt',
         'professor': 'professor.txt',
         'atendente': 'atendente.txt',
         'nutricionista': 'nutricionista.txt'
     }
+    return mapa_personas.get(role.lower(), 'mentor_sensei.txt')
 
-    arquivo_persona = mapa_personas.get(role.lower(), 'mentor_sensei.txt')
 
-    # 2. Carregamento do Texto
-    prompt_base = carregar_persona(arquivo_persona)
+def gerar_prompt_sistema(contextos: List[str], role: str = 'mentor', prompt_base: Optional[str] = None) -> str:
+    """
+    Seleciona e carrega a persona correta baseada no papel (role),
+    injetando o contexto do RAG. `prompt_base` permite reaproveitar
+    uma persona já carregada (ex.: em paralelo com a busca).
+    """
+    # 1 e 2. Mapeamento do papel e carregamento do texto
+    if prompt_base is None:
+        prompt_base = carregar_persona(arquivo_persona(role))
 
     # 3. Injeção de Contexto (RAG)
     if contextos:
@@ -132,11 +176,19 @@ def gerar_prompt_sistema(contextos: List[str], role: str = 'mentor') -> str:
 # ============================================ 
 # FUNÇÕES DE EMBEDDING E BUSCA
 # ============================================ 
-def gerar_embedding_google(texto: str) -> List[float]:
-    """
-    Gera embedding usando Google AI com rotação de chaves.
-    Tenta a chave principal (GOOGLE_API_KEY) e depois as do proprietário (1 a 10).
-    """
+MODELO_EMBEDDING = "gemini-embedding-001"
+
+# Identifica modelo + dimensão no cache de embeddings de consulta
+ASSINATURA_EMBEDDING = MODELO_EMBEDDING if DIMENSAO_EMBEDDING == DIMENSAO_EMBEDDING_COMPLETA \
+    else f"{MODELO_EMBEDDING}@{DIMENSAO_EMBEDDING}"
+
+# Limites de uma chamada batchEmbedContents (máx. 100 requisições por lote)
+LOTE_EMBEDDING_MAX_ITENS = 100
+LOTE_EMBEDDING_MAX_CARACTERES = int(os.environ.get('SENSEI_EMBEDDING_LOTE_MAX_CHARS', '200000'))
+
+
+def chaves_embedding_google() -> List[str]:
+    """Chave principal (GOOGLE_API_KEY) seguida das chaves de rotação do proprietário."""
     keys_to_try = []
     
     # 1. Tenta a chave principal do ambiente
@@ -149,12 +201,29 @@ def gerar_embedding_google(texto: str) -> List[float]:
     
     if not keys_to_try:
         raise InvalidGoogleApiKey("Nenhuma chave Google API encontrada para gerar embeddings.")
+    return keys_to_try
+
+
+def requisicao_embedding(texto: str) -> Dict:
+    """Corpo de um embedContent; pede a dimensão reduzida quando configurada (SENSEI_EMBEDDING_DIM)."""
+    requisicao = {"model": f"models/{MODELO_EMBEDDING}", "content": {"parts": [{"text": texto}]}}
+    if DIMENSAO_EMBEDDING != DIMENSAO_EMBEDDING_COMPLETA:
+        requisicao["outputDimensionality"] = DIMENSAO_EMBEDDING
+    return requisicao
+
+
+def gerar_embedding_google(texto: str) -> List[float]:
+    """
+    Gera embedding usando Google AI com rotação de chaves.
+    Tenta a chave principal (GOOGLE_API_KEY) e depois as do proprietário (1 a 10).
+    """
+    keys_to_try = chaves_embedding_google()
 
     last_error = None
     for i, api_key in enumerate(keys_to_try):
         try:
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-embedding-001:embedContent?key={api_key}"
-            payload = {"model": "models/gemini-embedding-001", "content": {"parts": [{"text": texto}]}}
+            url = f"https://generativelanguage.googleapis.com/v1beta/models/{MODELO_EMBEDDING}:embedContent?key={api_key}"
+            payload = requisicao_embedding(texto)
             
             # print(f"🧠 Tentando gerar embedding com chave {i+1}...")
             response = requests.post(url, json=payload, timeout=20)
@@ -181,80 +250,224 @@ def gerar_embedding_google(texto: str) -> List[float]:
     raise Exception(f"Falha total ao gerar embedding após tentar {len(keys_to_try)} chaves. Último erro: {last_error}")
 
 
-def buscar_contextos_relevantes(user_id: str, query: str, top_k: int = 5, role: str = None) -> List[str]:
+def dividir_em_lotes(textos: List[str]) -> List[List[int]]:
+    """Agrupa os índices dos textos respeitando o limite de itens e de caracteres por chamada."""
+    lotes, atual, caracteres = [], [], 0
+    for i, texto in enumerate(textos):
+        if atual and (len(atual) >= LOTE_EMBEDDING_MAX_ITENS or caracteres + len(texto) > LOTE_EMBEDDING_MAX_CARACTERES):
+            lotes.append(atual)
+            atual, caracteres = [], 0
+        atual.append(i)
+        caracteres += len(texto)
+    if atual:
+        lotes.append(atual)
+    return lotes
+
+
+def gerar_embeddings_em_lote(textos: List[str]) -> List[Optional[List[float]]]:
+    """
+    Gera embeddings de vários textos com batchEmbedContents (um request por lote),
+    com a mesma rotação de chaves de gerar_embedding_google.
+    Se um lote falhar por outro motivo que não cota/chave, ou vier incompleto, os
+    itens afetados são refeitos um a um; itens que ainda falharem ficam como None.
+    Lança exceção apenas se nenhum embedding puder ser gerado.
+    """
+    if not textos:
+        return []
+    if len(textos) == 1:
+        # Um único texto não ganha nada com o endpoint de lote
+        return [gerar_embedding_google(textos[0])]
+
+    keys_to_try = chaves_embedding_google()
+    resultados: List[Optional[List[float]]] = [None] * len(textos)
+    last_error = None
+    chave_atual = 0
+
+    for lote in dividir_em_lotes(textos):
+        embeddings_lote = None
+        while chave_atual < len(keys_to_try) and embeddings_lote is None:
+            api_key = keys_to_try[chave_atual]
+            try:
+                url = f"https://generativelanguage.googleapis.com/v1beta/models/{MODELO_EMBEDDING}:batchEmbedContents?key={api_key}"
+                payload = {"requests": [requisicao_embedding(textos[i]) for i in lote]}
+                response = requests.post(url, json=payload, timeout=60)
+
+                if response.status_code == 200:
+                    embeddings_lote = [e.get('values') for e in response.json().get('embeddings', [])]
+                    print(f"✅ Lote de {len(lote)} embeddings gerado (Chave {chave_atual+1}).")
+                    break
+
+                error_data = response.text
+                if response.status_code == 429 or "API key not valid" in error_data:
+                    print(f"⚠️ Chave {chave_atual+1} indisponível para lote ({response.status_code}). Tentando próxima...")
+                    last_error = f"Erro {response.status_code}: {error_data}"
+                    chave_atual += 1
+                    continue
+
+                # Erro do próprio lote (ex.: um texto inválido): refaz item a item
+                print(f"❓ Lote rejeitado ({response.status_code}): {error_data[:200]}")
+                last_error = f"Erro {response.status_code}: {error_data}"
+                break
+            except Exception as e:
+                print(f"⚠️ Erro no lote com chave {chave_atual+1}: {e}")
+                last_error = str(e)
+                break
+
+        if chave_atual >= len(keys_to_try):
+            # Todas as chaves em cota/inválidas: refazer item a item só gastaria mais requests
+            continue
+
+        for posicao, i in enumerate(lote):
+            if embeddings_lote is not None and posicao < len(embeddings_lote) and embeddings_lote[posicao]:
+                resultados[i] = embeddings_lote[posicao]
+                continue
+            try:
+                resultados[i] = gerar_embedding_google(textos[i])
+            except Exception as e:
+                print(f"❌ Embedding do item {i} falhou: {e}")
+                last_error = str(e)
+
+    if all(r is None for r in resultados):
+        raise Exception(f"Falha total ao gerar embeddings em lote. Último erro: {last_error}")
+    return resultados
+
+
+def gerar_embeddings_documentos(textos: List[str]) -> List[Optional[Sequence[float]]]:
+    """
+    Como gerar_embeddings_em_lote, mas textos idênticos a um já embutido (por
+    qualquer usuário, ou repetidos no próprio lote) reaproveitam o vetor em vez
+    de chamar a API. Desligado com SENSEI_REUSAR_EMBEDDINGS=0.
+    """
+    if not REUSAR_EMBEDDINGS_DOCUMENTOS:
+        return gerar_embeddings_em_lote(textos)
+
+    chaves = [chave_embedding(ASSINATURA_EMBEDDING, "documento", texto) for texto in textos]
+    resultados: List[Optional[Sequence[float]]] = [cache_embeddings_documentos.obter(chave) for chave in chaves]
+    faltantes = {}
+    for i, resultado in enumerate(resultados):
+        if resultado is None:
+            faltantes.setdefault(chaves[i], i)
+
+    if faltantes:
+        novos = gerar_embeddings_em_lote([textos[i] for i in faltantes.values()])
+        por_chave = {
+            chave: cache_embeddings_documentos.armazenar(chave, embedding)
+            for chave, embedding in zip(faltantes, novos) if embedding is not None
+        }
+        resultados = [resultado if resultado is not None else por_chave.get(chave)
+                      for resultado, chave in zip(resultados, chaves)]
+
+    reaproveitados = len(textos) - len(faltantes)
+    if reaproveitados:
+        print(f"♻️ {reaproveitados} embeddings reaproveitados de textos idênticos.")
+    return resultados
+
+
+def gerar_embedding_consulta(query: str, role: Optional[str] = None) -> Sequence[float]:
+    """
+    Embedding da busca com cache de dois níveis (memória + SQLite).
+    A chave considera o modelo, o prefixo da tarefa e o texto normalizado;
+    só em caso de miss a API do Gemini (com rotação de chaves) é chamada.
+    """
+    prefixo = f"Contexto para {role}: " if role else ""
+    chave = chave_embedding(ASSINATURA_EMBEDDING, prefixo, query)
+
+    embedding = cache_embeddings.obter(chave)
+    if embedding is not None:
+        print("⚡ Embedding da busca encontrado em cache.")
+        return embedding
+
+    return cache_embeddings.armazenar(chave, gerar_embedding_google(f"{prefixo}{query}"))
+
+
+def buscar_contextos_relevantes(user_id: str, query: str, top_k: int = 5, role: str = None,
+                                score_minimo: Optional[float] = None,
+                                filtro: Optional[FiltroBusca] = None,
+                                limiar_redundancia: Optional[float] = None) -> List[str]:
     """
     Busca contextos em fluxo duplo: 
     1. Privado (Usuário - inteligência_critica)
     2. Global (Papel - global_knowledge)
+    A busca é feita em duas fases: pontua só os embeddings (e o BM25, na
+    busca híbrida, fundidos por RRF) e depois lê, em lote, o texto apenas dos
+    top_k vencedores. Se o embedding da pergunta falhar, segue só com o BM25.
+    Contextos com similaridade abaixo de `score_minimo` são descartados;
+    `filtro` (data, fonte, tags, recência) vale para os contextos privados.
+    Com `limiar_redundancia`, candidatos quase idênticos a um mais relevante
+    (cosseno dos embeddings já pontuados) saem antes da fase 2; o ranking pede
+    CANDIDATOS_EXTRAS a mais para repô-los e é cortado em top_k antes da leitura.
     """
     try:
-        db = init_firebase()
-        
         # Gera o embedding da busca com rotação robusta
         search_query = f"Contexto para {role}: {query}" if role else query
         print(f"🧠 Gerando embedding para busca: {search_query[:50]}...")
-        
+
+        # Embedding da query (Gemini), STREAM A (Privado) e STREAM B (Global) são
+        # round trips independentes: disparados juntos, o tempo total fica
+        # próximo do mais lento deles em vez da soma
+        escopos = [escopo_usuario(user_id)] + ([escopo_global(role)] if role else [])
+        futuro_embedding = executor_rag.submit(gerar_embedding_consulta, query, role)
+        futuros_indices = [executor_rag.submit(armazem_vetorial.carregar_indice, escopo) for escopo in escopos]
+
         try:
-            query_embedding = gerar_embedding_google(search_query)
+            query_embedding = futuro_embedding.result()
         except Exception as e:
-            print(f"❌ Abortando RAG: Falha ao gerar embedding de busca: {e}")
-            return []
-        
-        contexts = []
-
-        # STREAM A: Privado (User)
-        print(f"📡 Buscando Stream Privado (User: {user_id} | Collection: inteligencia_critica)")
-        user_docs_ref = db.collection('users').document(user_id).collection('inteligencia_critica')
-        user_docs = list(user_docs_ref.stream())
-        
-        print(f"📊 Documentos encontrados no Firestore (Privado): {len(user_docs)}")
-        
-        for doc in user_docs:
-            data = doc.to_dict()
-            if 'embedding' in data and 'contexto' in data:
-                try:
-                    similarity = np.dot(query_embedding, data['embedding']) / (np.linalg.norm(query_embedding) * np.linalg.norm(data['embedding']))
-                    contexts.append({
-                        'texto': data['contexto'], 
-                        'similarity': similarity, 
-                        'source': 'private',
-                        'id': doc.id
-                    })
-                except Exception as sim_err:
-                    print(f"⚠️ Erro ao calcular similaridade para doc {doc.id}: {sim_err}")
+            if not BUSCA_HIBRIDA:
+                # As leituras em andamento terminam sozinhas e apenas aquecem o cache
+                print(f"❌ Abortando RAG: Falha ao gerar embedding de busca: {e}")
+                return []
+            print(f"⚠️ Falha ao gerar embedding de busca ({e}); seguindo só com a busca léxica.")
+            query_embedding = None
+
+        if query_embedding is not None:
+            indices = [futuro.result() for futuro in futuros_indices]
+            # BM25 só se já estiver em cache (a montagem, se cabível, fica em segundo plano)
+            lexicos = [
+                armazem_vetorial.indice_lexico_disponivel(escopo, len(indice)) for escopo, indice in zip(escopos, indices)
+            ] if BUSCA_HIBRIDA else []
+        else:
+            # Fallback sem embedding: o BM25 é a única busca possível, então é montado na hora
+            indices = []
+            lexicos = list(executor_rag.map(armazem_vetorial.carregar_indice_lexico, escopos))
+
+        # Uma multiplicação matriz-vetor por índice + seleção parcial dos top_k,
+        # fundida por RRF ao ranking BM25 da pergunta (sem o prefixo do papel)
+        descarta_redundantes = limiar_redundancia is not None and query_embedding is not None
+        candidatos = top_k + CANDIDATOS_EXTRAS if descarta_redundantes else top_k
+        ranking, escopos_por_indice = ranquear_escopos(
+            escopos, query_embedding, indices, query, lexicos, candidatos, score_minimo, filtro
+        )
+
+        redundantes = 0
+        if ranking and descarta_redundantes:
+            antes = len(ranking)
+            ranking = descartar_redundantes(ranking, indices, escopos_por_indice, len(query_embedding),
+                                            limiar_redundancia)
+            redundantes = antes - len(ranking)
+        # Só os top_k vencedores têm o texto lido na fase 2
+        ranking = ranking[:top_k]
+
+        if ranking:
+            # Com os dois rankings o score é o do RRF, não uma similaridade
+            if query_embedding is None:
+                tipo_score = 'BM25'
+            elif any(indice is not None for indice in lexicos):
+                tipo_score = 'RRF'
             else:
-                missing = [f for f in ['embedding', 'contexto'] if f not in data]
-                print(f"⚠️ Documento {doc.id} ignorado. Campos faltando: {missing}")
-
-        # STREAM B: Global (Role)
-        if role:
-            print(f"🌍 Buscando Stream Global (Role: {role} | Collection: global_knowledge)")
-            global_docs_ref = db.collection('global_knowledge').document(role.lower()).collection('concepts')
-            global_docs = list(global_docs_ref.stream())
-            print(f"📊 Documentos encontrados no Firestore (Global): {len(global_docs)}")
-            
-            for doc in global_docs:
-                data = doc.to_dict()
-                if 'embedding' in data and 'content' in data:
-                    try:
-                        similarity = np.dot(query_embedding, data['embedding']) / (np.linalg.norm(query_embedding) * np.linalg.norm(data['embedding']))
-                        contexts.append({
-                            'texto': data['content'], 
-                            'similarity': similarity, 
-                            'source': 'global',
-                            'id': doc.id
-                        })
-                    except Exception as sim_err:
-                        print(f"⚠️ Erro no cálculo global doc {doc.id}: {sim_err}")
-
-        if contexts:
-            # Ordena por similaridade e pega os top_k
-            contexts.sort(key=lambda x: x['similarity'], reverse=True)
-            top_score = contexts[0]['similarity']
-            print(f"🎯 Melhor similaridade encontrada: {top_score:.4f}")
-            
-            final_selection = [ctx['texto'] for ctx in contexts[:top_k]]
-            print(f"📦 Selecionados {len(final_selection)} contextos mais relevantes.")
+                tipo_score = 'cosseno'
+            print(f"🎯 Melhor score encontrado ({tipo_score}): {ranking[0][2]:.4f}")
+
+            # FASE 2: textos dos vencedores (o índice mapeado já os tem em disco)
+            trechos = armazem_vetorial.trechos_vencedores(ranking, escopos_por_indice)
+            if redundantes and trechos:
+                # Os textos descartados não são lidos: estima pelo tamanho médio dos vencedores
+                media = sum(estimar_tokens(trecho[3]) for trecho in trechos) / len(trechos)
+                print(f"♻️ {redundantes} candidatos redundantes descartados antes da fase 2 "
+                      f"(~{round(media * redundantes)} tokens economizados)")
+
+            # Chunks vencedores de um mesmo contexto viram um único trecho
+            final_selection = agrupar_chunks(trechos)
+            print(f"📦 Selecionados {len(final_selection)} contextos mais relevantes ({len(trechos)} trechos).")
             return final_selection
         
         print("⚠️ Busca finalizada, mas nenhum contexto foi acumulado.")
@@ -265,40 +478,64 @@ def buscar_contextos_relevantes(user_id: str, query: str, top_k: int = 5, role:
         return []
 
 
+def definir_modo_ann(user_id: str, modo: Optional[str]) -> None:
+    """Aplica a preferência de busca aproximada (UserProfile.ann_mode) ao índice privado deste worker."""
+    armazem_vetorial.cache.definir_modo_ann(escopo_usuario(user_id), modo)
+
+
+def documento_contexto(contexto_texto: str, embedding: List[float], contexto_pai: Optional[str] = None,
+                       chunk_indice: int = 0, chunk_inicio: int = 0, hash_contexto: Optional[str] = None) -> Dict:
+    """
+    Documento de contexto para o armazém vetorial (embedding já normalizado).
+    Chunks de um contexto longo levam o id do contexto pai e sua posição nele;
+    `hash_contexto` é o hash do contexto inteiro (igual em todos os chunks).
+    """
+    documento = {'texto': contexto_texto, 'embedding': embedding}
+    if hash_contexto is not None:
+        documento[CAMPO_HASH] = hash_contexto
+    if contexto_pai is not None:
+        documento.update({CAMPO_PAI: contexto_pai, CAMPO_INDICE: chunk_indice, CAMPO_INICIO: chunk_inicio})
+    return documento
+
+
+def hashes_ja_salvos(escopo: str, hashes: List[str]) -> set:
+    """Deduplicação é só economia: se a consulta falhar, o contexto é gravado normalmente."""
+    try:
+        return armazem_vetorial.hashes_existentes(escopo, hashes)
+    except Exception as e:
+        print(f"⚠️ Verificação de duplicados indisponível: {e}")
+        return set()
+
+
 def salvar_contexto_usuario(user_id: str, contexto_texto: str, google_api_key: Optional[str] = None) -> Tuple[bool, Optional[str]]:
     """Salva novo contexto com embedding na collection 'inteligencia_critica'"""
+    if len(dividir_em_chunks(contexto_texto)) > 1:
+        # Contextos longos são gravados como chunks, todos no mesmo WriteBatch
+        return salvar_contextos_usuario_em_lote(user_id, [contexto_texto])[0]
+
     try:
         print("\n--- INICIANDO salvar_contexto_usuario ---")
-        
+        escopo = escopo_usuario(user_id)
+
+        # Passo 0: o mesmo texto (normalizado) já salvo não gasta outro embedding
+        hash_contexto = hash_conteudo(contexto_texto)
+        if hashes_ja_salvos(escopo, [hash_contexto]):
+            print(f"LOG: ♻️ Contexto idêntico já salvo para o user_id: {user_id}. Nada a gravar.")
+            return True, None
+
         # Passo 1: Gera o embedding com rotação
         print("LOG: Gerando embedding para o arquivo/contexto...")
         try:
-            embedding = gerar_embedding_google(contexto_texto)
+            # Gravado já normalizado em float32 para a busca usar só o produto escalar
+            embedding = normalizar_embedding(gerar_embeddings_documentos([contexto_texto])[0])
             print("LOG: Embedding gerado com sucesso via rotação.")
         except Exception as e:
              return False, f"Falha ao gerar embedding após tentar todas as chaves: {e}"
 
-        # Passo 2: Salva no Firestore na collection 'inteligencia_critica'
-        print("LOG: Inicializando cliente Firebase...")
-        db = init_firebase()
-        print(f"LOG: Cliente Firebase inicializado: {db}")
-        
-        print("LOG: Acessando collection 'users'...")
-        users_collection = db.collection('users')
-        
-        print(f"LOG: Acessando document '{user_id}'...")
-        user_doc = users_collection.document(user_id)
-        
-        print("LOG: Acessando sub-collection 'inteligencia_critica'...")
-        contexts_collection = user_doc.collection('inteligencia_critica')
-        
-        print("LOG: Tentando executar .add() no Firestore...")
-        contexts_collection.add({
-            'contexto': contexto_texto,
-            'embedding': embedding,
-            'timestamp': firestore.SERVER_TIMESTAMP
-        })
-        print(f"LOG: ✅ Contexto salvo com sucesso no Firestore (inteligencia_critica) para o user_id: {user_id}")
+        # Passo 2: Salva no armazém vetorial (Firestore: collection 'inteligencia_critica')
+        print("LOG: Gravando contexto no armazém vetorial...")
+        doc_id = armazem_vetorial.adicionar(escopo, documento_contexto(contexto_texto, embedding, hash_contexto=hash_contexto))
+        print(f"LOG: ✅ Contexto {doc_id} salvo com sucesso (inteligencia_critica) para o user_id: {user_id}")
         
         print("--- FIM salvar_contexto_usuario ---\\n")
         return True, None
@@ -311,6 +548,111 @@ def salvar_contexto_usuario(user_id: str, contexto_texto: str, google_api_key: O
         return False, error_message
 
 
+def salvar_contextos_usuario_em_lote(user_id: str, textos: List[str], ids_origem: Optional[List[str]] = None,
+                                     metadados: Optional[List[Dict]] = None) -> List[Tuple[bool, Optional[str]]]:
+    """
+    Salva vários contextos de uma vez: cada texto é dividido em chunks, os
+    embeddings saem via batchEmbedContents e as escritas vão em WriteBatch de
+    até 500 documentos (os chunks de um contexto ficam sempre no mesmo lote).
+    Textos já salvos pelo usuário (mesmo hash de conteúdo) contam como sucesso
+    sem nova gravação; repetidos dentro do lote seguem o resultado do primeiro.
+    Com `ids_origem` (um id estável por texto), os documentos recebem ids
+    determinísticos ({id} ou {id}-{chunk}): regravar o mesmo item sobrescreve
+    em vez de duplicar, o que torna o reenvio pela outbox idempotente.
+    `metadados` (timestamp, fonte, tags por texto) vão para todos os chunks.
+    Retorna (sucesso, erro) por item, na mesma ordem de `textos`.
+    """
+    print(f"\n--- INICIANDO salvar_contextos_usuario_em_lote ({len(textos)} itens) ---")
+    resultados: List[Tuple[bool, Optional[str]]] = [(False, "Falha ao gerar embedding.")] * len(textos)
+    escopo = escopo_usuario(user_id)
+
+    hashes = [hash_conteudo(texto) for texto in textos]
+    ja_salvos = hashes_ja_salvos(escopo, hashes)
+    primeiro_por_hash: Dict[str, int] = {}
+    repetidos: Dict[int, int] = {}
+
+    # Textos curtos continuam como um único documento, sem campos de chunk
+    chunks_por_texto = {}
+    for i, texto in enumerate(textos):
+        if hashes[i] in ja_salvos:
+            resultados[i] = (True, None)
+            continue
+        if hashes[i] in primeiro_por_hash:
+            repetidos[i] = primeiro_por_hash[hashes[i]]
+            continue
+        primeiro_por_hash[hashes[i]] = i
+
+        chunks = dividir_em_chunks(texto)
+        if len(chunks) > LOTE_FIRESTORE_MAX_ESCRITAS:
+            resultados[i] = (False, f"Contexto longo demais ({len(chunks)} chunks; máximo {LOTE_FIRESTORE_MAX_ESCRITAS}).")
+        else:
+            chunks_por_texto[i] = chunks if len(chunks) > 1 else [(0, texto)]
+
+    planos = [(i, j) for i, chunks in chunks_por_texto.items() for j in range(len(chunks))]
+    try:
+        embeddings = gerar_embeddings_documentos([chunks_por_texto[i][j][1] for i, j in planos]) if planos else []
+    except Exception as e:
+        erro = f"Falha ao gerar embeddings após tentar todas as chaves: {e}"
+        print(f"❌ {erro}")
+        return [(False, erro) if i in chunks_por_texto or i in repetidos else resultado
+                for i, resultado in enumerate(resultados)]
+
+    # Um contexto só é gravado se todos os seus chunks tiverem embedding
+    embeddings_por_texto: Dict[int, List] = {i: [] for i in chunks_por_texto}
+    for (i, _), embedding in zip(planos, embeddings):
+        embeddings_por_texto[i].append(embedding)
+    pendentes = [
+        (i, [normalizar_embedding(e) for e in embeddings_por_texto[i]])
+        for i in chunks_por_texto if all(e is not None for e in embeddings_por_texto[i])
+    ]
+
+    blocos, bloco, escritas = [], [], 0
+    for i, embeddings_texto in pendentes:
+        if bloco and escritas + len(embeddings_texto) > LOTE_FIRESTORE_MAX_ESCRITAS:
+            blocos.append(bloco)
+            bloco, escritas = [], 0
+        bloco.append((i, embeddings_texto))
+        escritas += len(embeddings_texto)
+    if bloco:
+        blocos.append(bloco)
+
+    for bloco in blocos:
+        documentos = []
+        for i, embeddings_texto in bloco:
+            chunks = chunks_por_texto[i]
+            origem = ids_origem[i] if ids_origem else None
+            contexto_pai = (origem or uuid.uuid4().hex) if len(chunks) > 1 else None
+            for j, ((inicio, chunk), embedding) in enumerate(zip(chunks, embeddings_texto)):
+                documento = documento_contexto(chunk, embedding, contexto_pai, j, inicio, hashes[i])
+                if origem:
+                    documento['id'] = f"{origem}-{j}" if len(chunks) > 1 else origem
+                if metadados:
+                    documento.update(metadados[i])
+                documentos.append(documento)
+
+        try:
+            armazem_vetorial.adicionar_varios(escopo, documentos)
+        except Exception as e:
+            print(f"❌ Falha ao gravar lote ({len(documentos)} documentos): {e}")
+            traceback.print_exc()
+            for i, _ in bloco:
+                resultados[i] = (False, f"Erro ao gravar no armazém vetorial: {e}")
+            continue
+
+        for i, _ in bloco:
+            resultados[i] = (True, None)
+        print(f"LOG: ✅ Lote com {len(bloco)} contextos ({len(documentos)} documentos) gravado para o user_id: {user_id}")
+
+    for i, original in repetidos.items():
+        resultados[i] = resultados[original]
+    duplicados = len(repetidos) + sum(hash_ in ja_salvos for hash_ in hashes)
+    if duplicados:
+        print(f"LOG: ♻️ {duplicados} contextos duplicados ignorados (já salvos ou repetidos no lote).")
+
+    print("--- FIM salvar_contextos_usuario_em_lote ---\n")
+    return resultados
+
+
 # ============================================ 
 # FUNÇÕES DE GERAÇÃO DE RESPOSTA
 # ============================================ 
@@ -318,20 +660,11 @@ def salvar_contexto_usuario(user_id: str, contexto_texto: str, google_api_key: O
 def get_owner_google_keys() -> List[str]:
     """Lê as chaves de API do proprietário das variáveis de ambiente."""
     keys = []
-    i = 1
-    while True:
+    # Procura no máximo até 20 chaves, aceitando buracos na numeração (ex: 1, 2, 4)
+    for i in range(1, 21):
         key = os.environ.get(f"GEMINI_API_KEY_{i}")
         if key:
             keys.append(key)
-            i += 1
-        else:
-            # Procura no máximo até 20 chaves para não entrar em loop infinito
-            if i > 20: 
-                break
-            # Continua verificando para o caso de haver um buraco na numeração (ex: 1, 2, 4)
-            i += 1
-            if i > 20: # Checagem dupla
-                 break
 
     print(f"🔑 Encontradas {len(keys)} chaves de API do proprietário.")
     return keys
@@ -446,28 +779,56 @@ def gerar_resposta_google(prompt: str, api_key: Optional[str] = None, model_name
 # ============================================ 
 # FUNÇÃO PRINCIPAL DE PROCESSAMENTO
 # ============================================ 
+def montar_prompt_usuario(user_id: str, query: str, role: str = 'mentor',
+                          filtro: Optional[FiltroBusca] = None) -> Tuple[str, List[str]]:
+    """RAG + persona: devolve o prompt final e os contextos usados nele."""
+    # A persona é lida do disco enquanto a busca RAG acontece
+    futuro_persona = executor_rag.submit(carregar_persona, arquivo_persona(role))
+
+    perfil = perfil_recuperacao(role)
+    print(f"🔍 Buscando contextos para user_id: {user_id} com papel: {role} ({perfil})")
+    contextos_relevantes = buscar_contextos_relevantes(
+        user_id, query, top_k=perfil.top_k, role=role, score_minimo=perfil.score_minimo,
+        filtro=filtro, limiar_redundancia=LIMIAR_REDUNDANCIA
+    )
+    # Só o que cabe no orçamento de tokens do papel vai para o prompt
+    contextos_relevantes = aplicar_orcamento(contextos_relevantes, perfil.max_tokens_contexto)
+
+    if contextos_relevantes:
+        tokens = sum(estimar_tokens(contexto) for contexto in contextos_relevantes)
+        print(f"✅ {len(contextos_relevantes)} contextos encontrados (~{tokens} tokens)")
+    else:
+        print("⚠️ Nenhum contexto encontrado")
+
+    prompt_sistema = gerar_prompt_sistema(contextos_relevantes, role, prompt_base=futuro_persona.result())
+    prompt_final = f"""{prompt_sistema}\n\n---\n**MENSAGEM DO USUÁRIO:**\n{query}\n\n---\n\n**INSTRUÇÕES:**\n- Responda de forma natural e conversacional em português do Brasil.\n- Não use estruturas rígidas ou listas obrigatórias.\n- Integre as informações do contexto organicamente na resposta."""
+    return prompt_final, contextos_relevantes
+
+
+def ordem_chaves_usuario(preferred_provider: Optional[str], groq_api_key: Optional[str],
+                         google_api_key: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+    """Ordem de tentativa das chaves do usuário conforme o provedor preferido."""
+    if preferred_provider in ['google', 'google_user']:
+        return [('google_user', google_api_key), ('groq', groq_api_key)]
+    # Padrão: tenta Groq primeiro (geralmente mais rápido)
+    return [('groq', groq_api_key), ('google_user', google_api_key)]
+
+
 def processar_query_usuario(
     user_id: str, 
     query: str, 
     groq_api_key: Optional[str] = None,
     google_api_key: Optional[str] = None,
     preferred_provider: Optional[str] = None,
-    role: str = 'mentor'
+    role: str = 'mentor',
+    filtro: Optional[FiltroBusca] = None
 ) -> Dict[str, any]:
     """
     Processa a query do usuário com RAG e IA, com sistema de rotação de chaves.
+    `filtro` restringe os contextos privados usados no RAG.
     """ 
     try:
-        print(f"🔍 Buscando contextos para user_id: {user_id} com papel: {role}")
-        contextos_relevantes = buscar_contextos_relevantes(user_id, query, top_k=5, role=role)
-        
-        if contextos_relevantes:
-            print(f"✅ {len(contextos_relevantes)} contextos encontrados")
-        else:
-            print("⚠️ Nenhum contexto encontrado")
-        
-        prompt_sistema = gerar_prompt_sistema(contextos_relevantes, role)
-        prompt_final = f"""{prompt_sistema}\n\n---\n**MENSAGEM DO USUÁRIO:**\n{query}\n\n---\n\n**INSTRUÇÕES:**\n- Responda de forma natural e conversacional em português do Brasil.\n- Não use estruturas rígidas ou listas obrigatórias.\n- Integre as informações do contexto organicamente na resposta."""
+        prompt_final, contextos_relevantes = montar_prompt_usuario(user_id, query, role, filtro)
         
         resposta_ia = None
         erro = None
@@ -475,14 +836,7 @@ def processar_query_usuario(
         erros_acumulados = []
 
         # Determina a ordem de tentativa baseada na preferência
-        tentativas = []
-        if preferred_provider == 'groq':
-            tentativas = [('groq', groq_api_key), ('google_user', google_api_key)]
-        elif preferred_provider in ['google', 'google_user']:
-            tentativas = [('google_user', google_api_key), ('groq', groq_api_key)]
-        else:
-            # Padrão: tenta Groq primeiro (geralmente mais rápido)
-            tentativas = [('groq', groq_api_key), ('google_user', google_api_key)]
+        tentativas = ordem_chaves_usuario(preferred_provider, groq_api_key, google_api_key)
 
         # 1️⃣ e 2️⃣ Tenta as chaves do usuário na ordem definida
         for provedor, chave in tentativas:
@@ -0,0 +1,459 @@
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from .filtros import FiltroBusca, MetadadosIndice
+from .quantization import MODO_QUANTIZACAO, CodigosQuantizados
+
+
+# ============================================
+# ÍNDICE VETORIAL (NUMPY)
+# ============================================
+
+# Onde a matriz float32 de índices quantizados é guardada (arquivos anônimos,
+# apagados na criação). Evite um tmpfs: ele ocupa a mesma RAM que se quer poupar.
+DIRETORIO_MATRIZES_QUANTIZADAS = os.environ.get(
+    'SENSEI_QUANT_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'tmp'),
+)
+
+def montar_matriz(embeddings: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    Empilha uma lista de embeddings em uma única matriz float32 (N x D).
+    Todos os vetores devem ter a mesma dimensão.
+    """
+    if len(embeddings) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+# Campo gravado junto do embedding quando o vetor já foi salvo com norma L2 = 1
+CAMPO_NORMALIZADO = 'embedding_normalizado'
+
+# Dimensão dos embeddings gerados (outputDimensionality do gemini-embedding-001).
+# Valores menores cortam armazenamento, payload e custo do produto escalar;
+# o modelo é treinado com MRL, então 768 e 1536 perdem pouca qualidade.
+# A dimensão é gravada em cada documento (CAMPO_DIMENSAO); documentos sem o
+# campo são anteriores à configuração e têm a dimensão completa.
+DIMENSAO_EMBEDDING_COMPLETA = 3072
+DIMENSAO_EMBEDDING = int(os.environ.get('SENSEI_EMBEDDING_DIM', str(DIMENSAO_EMBEDDING_COMPLETA)))
+if not 128 <= DIMENSAO_EMBEDDING <= DIMENSAO_EMBEDDING_COMPLETA:
+    raise ValueError(f"SENSEI_EMBEDDING_DIM inválido: {DIMENSAO_EMBEDDING} (use de 128 a {DIMENSAO_EMBEDDING_COMPLETA}).")
+CAMPO_DIMENSAO = 'embedding_dim'
+
+
+def normalizar_linhas(matriz: np.ndarray, ja_normalizadas: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Normaliza cada linha da matriz pela norma L2 (linhas nulas permanecem nulas).
+    Linhas marcadas em `ja_normalizadas` não têm a norma recalculada.
+    """
+    if ja_normalizadas is not None:
+        pendentes = ~np.asarray(ja_normalizadas, dtype=bool)
+        if not pendentes.any():
+            return matriz
+        matriz = matriz.copy()
+        matriz[pendentes] = normalizar_linhas(matriz[pendentes])
+        return matriz
+
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+
+def normalizar_embedding(embedding: Sequence[float]) -> List[float]:
+    """
+    Converte o embedding para float32 com norma L2 = 1, no formato lista
+    aceito pelo Firestore. Vetores gravados assim dispensam a norma na busca.
+    """
+    vetor = np.asarray(embedding, dtype=np.float32)
+    norma = np.linalg.norm(vetor)
+    if norma > 0:
+        vetor = vetor / norma
+    return vetor.tolist()
+
+
+def similaridade_cosseno(query_embedding: Sequence[float], matriz: np.ndarray) -> np.ndarray:
+    """
+    Calcula a similaridade de cosseno entre a query e todas as linhas da matriz
+    com um único produto matriz-vetor.
+    """
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norma_query = np.linalg.norm(query)
+    if norma_query == 0 or matriz.shape[0] == 0:
+        return np.zeros(matriz.shape[0], dtype=np.float32)
+
+    scores = matriz @ (query / norma_query)
+    normas = np.linalg.norm(matriz, axis=1)
+    normas[normas == 0] = 1.0
+    return scores / normas
+
+
+def selecionar_top_k(scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Retorna (índices, scores) dos top_k maiores valores em ordem decrescente.
+    Usa argpartition (O(N)) e ordena apenas os k vencedores.
+    """
+    total = scores.shape[0]
+    if total == 0 or top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)
+
+    k = min(top_k, total)
+    if k < total:
+        candidatos = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidatos = np.arange(total)
+
+    ordem = candidatos[np.argsort(-scores[candidatos], kind='stable')]
+    return ordem, scores[ordem]
+
+
+
+def alocar_matriz(linhas: int, dimensao: int, em_disco: bool = False) -> np.ndarray:
+    """
+    Matriz float32 vazia. Em disco, é um arquivo temporário já apagado e
+    mapeado em memória: o sistema pode descartar as páginas quando faltar RAM.
+    """
+    if not em_disco:
+        return np.empty((linhas, dimensao), dtype=np.float32)
+    os.makedirs(DIRETORIO_MATRIZES_QUANTIZADAS, exist_ok=True)
+    arquivo = tempfile.TemporaryFile(dir=DIRETORIO_MATRIZES_QUANTIZADAS)
+    return np.memmap(arquivo, dtype=np.float32, mode='w+', shape=(max(1, linhas), max(1, dimensao)))
+
+
+def eh_mapeada(matriz: np.ndarray) -> bool:
+    """True se a matriz (ou a matriz de que ela é uma visão) vem de um arquivo mapeado."""
+    return isinstance(matriz, np.memmap) or isinstance(getattr(matriz, 'base', None), np.memmap)
+
+
+class IndiceVetorial:
+    """
+    Conjunto de documentos pronto para busca: matriz float32 com linhas já
+    normalizadas (N x D) e colunas paralelas de ids e, opcionalmente, textos.
+    Sem textos (textos=None), o chamador busca o texto só dos vencedores.
+    A matriz cresce com folga para que anexar um documento seja O(D) amortizado.
+
+    Com quantização ('int8' ou 'binaria'), a varredura usa só os códigos em
+    memória e a matriz float32 fica em arquivo mapeado, lida apenas para
+    reescorar os candidatos.
+
+    `metadados` (data, fonte e tags por posição) existe só nos índices privados
+    e permite restringir a busca a um subconjunto antes de pontuar.
+    """
+
+    def __init__(self, ids: List[str], textos: Optional[List[str]], matriz: np.ndarray,
+                 quantizacao: Optional[str] = None, codigos: Optional[CodigosQuantizados] = None,
+                 metadados: Optional[MetadadosIndice] = None):
+        self.ids = list(ids)
+        self._posicoes_ids = {doc_id: posicao for posicao, doc_id in enumerate(self.ids)}
+        self.textos = list(textos) if textos is not None else None
+        self.metadados = metadados
+        self._tamanho = matriz.shape[0]
+        if eh_mapeada(matriz) and matriz.dtype == np.float32 and matriz.flags.c_contiguous:
+            # Mantém a subclasse memmap: a matriz continua compartilhada no page cache
+            # (ascontiguousarray devolveria um ndarray comum e a quantização a copiaria)
+            self._matriz = matriz
+        else:
+            self._matriz = np.ascontiguousarray(matriz, dtype=np.float32)
+        self._bytes_textos = sum(len(t.encode('utf-8')) for t in self.textos or [])
+        # Índice aproximado (IVF), criado sob demanda para coleções grandes;
+        # `modo_ann` é a preferência do usuário (ann.usar_ann), None = automático
+        self.modo_ann: Optional[str] = None
+        self._ivf = None
+        self._lock_ivf = threading.Lock()
+
+        self.quantizacao = quantizacao or MODO_QUANTIZACAO
+        self._codigos = None
+        if self.quantizacao != 'nenhuma':
+            self._codigos = codigos or CodigosQuantizados.de_matriz(self.quantizacao, self._matriz)
+            if not eh_mapeada(self._matriz) and self._tamanho:
+                em_disco = alocar_matriz(self._tamanho, self.dimensao, em_disco=True)
+                em_disco[:] = self._matriz
+                self._matriz = em_disco
+
+    @classmethod
+    def de_embeddings(cls, ids: List[str], textos: Optional[List[str]], embeddings: Sequence[Sequence[float]],
+                      normalizados: Optional[Sequence[bool]] = None, quantizacao: Optional[str] = None,
+                      dimensao: Optional[int] = None, metadados: Optional[Sequence[Dict]] = None) -> 'IndiceVetorial':
+        """
+        Monta o índice a partir de embeddings. Vetores com dimensão diferente de
+        `dimensao` (ou da predominante, se não informada) são descartados: não é
+        possível empilhá-los nem compará-los com a query.
+        `normalizados` indica quais vetores já foram gravados com norma 1;
+        `metadados` (um dict por documento) habilita os filtros de busca.
+        """
+        if dimensao is None and embeddings:
+            dimensao = Counter(len(e) for e in embeddings).most_common(1)[0][0]
+        validos = [i for i, e in enumerate(embeddings) if len(e) == dimensao]
+        if len(validos) != len(embeddings):
+            print(f"⚠️ {len(embeddings) - len(validos)} documentos ignorados por dimensão diferente de {dimensao} "
+                  f"(manage.py regerar_embeddings).")
+        colunas = None if metadados is None else MetadadosIndice.de_documentos([metadados[i] for i in validos])
+        if not validos:
+            return cls([], None if textos is None else [], np.empty((0, 0), dtype=np.float32), quantizacao,
+                       metadados=colunas)
+
+        mascara = None if normalizados is None else [bool(normalizados[i]) for i in validos]
+        matriz = normalizar_linhas(montar_matriz([embeddings[i] for i in validos]), mascara)
+        return cls([ids[i] for i in validos], None if textos is None else [textos[i] for i in validos], matriz,
+                   quantizacao, metadados=colunas)
+
+    @property
+    def matriz(self) -> np.ndarray:
+        return self._matriz[:self._tamanho]
+
+    @property
+    def dimensao(self) -> int:
+        return self._matriz.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes em memória do processo (matrizes mapeadas de arquivo não contam)."""
+        total = self._bytes_textos
+        if not eh_mapeada(self._matriz):
+            total += self._matriz.nbytes
+        if self._codigos is not None:
+            total += self._codigos.nbytes
+        if self.metadados is not None:
+            total += self.metadados.nbytes
+        return total
+
+    def __len__(self) -> int:
+        return self._tamanho
+
+    def posicao(self, doc_id: str) -> Optional[int]:
+        """Posição do documento no índice (None se ausente ou ainda não visível)."""
+        posicao = self._posicoes_ids.get(doc_id)
+        return posicao if posicao is not None and posicao < self._tamanho else None
+
+    def anexar(self, doc_id: str, texto: Optional[str], embedding: Sequence[float],
+               metadados: Optional[Dict] = None) -> bool:
+        """
+        Acrescenta um documento normalizado. Retorna False se a dimensão não bater
+        ou se o doc_id já estiver no índice (regravação: o chamador recarrega).
+        """
+        if doc_id in self._posicoes_ids:
+            return False
+        vetor = np.asarray(embedding, dtype=np.float32)
+        if self._tamanho and vetor.shape[0] != self.dimensao:
+            return False
+
+        norma = np.linalg.norm(vetor)
+        if norma > 0:
+            vetor = vetor / norma
+
+        em_disco = self._codigos is not None
+        if self._tamanho == 0 and self._matriz.shape[1] != vetor.shape[0]:
+            self._matriz = alocar_matriz(4, vetor.shape[0], em_disco)
+        elif self._tamanho == self._matriz.shape[0]:
+            nova = alocar_matriz(max(4, self._tamanho * 2), self.dimensao, em_disco)
+            nova[:self._tamanho] = self._matriz[:self._tamanho]
+            self._matriz = nova
+
+        # A linha é escrita antes de o tamanho crescer: leitores concorrentes
+        # que já pegaram `matriz` continuam vendo um estado consistente.
+        self._matriz[self._tamanho] = vetor
+        if self._codigos is not None:
+            if len(self._codigos) == 0:
+                self._codigos = CodigosQuantizados.de_matriz(self.quantizacao, vetor[None, :])
+            else:
+                self._codigos.anexar(vetor)
+        self.ids.append(doc_id)
+        self._posicoes_ids[doc_id] = self._tamanho
+        if self.textos is not None:
+            self.textos.append(texto)
+            self._bytes_textos += len(texto.encode('utf-8'))
+        if self.metadados is not None:
+            self.metadados.anexar(metadados)
+        self._tamanho += 1
+        if self._ivf is not None:
+            self._ivf.anexar(self._tamanho - 1)
+        return True
+
+    def buscar(self, query: np.ndarray, top_k: int,
+               posicoes: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top_k deste índice para uma query já normalizada: (posições, similaridades).
+        Com quantização, os candidatos vêm dos códigos compactos; sem ela, acima
+        de LIMIAR_ANN documentos usa o IVF e, abaixo disso, força bruta. Em todos
+        os casos o score final é o produto escalar exato em float32.
+        Com `posicoes` (resultado de um filtro), só essas linhas são pontuadas.
+        """
+        matriz = self.matriz
+        if posicoes is not None:
+            posicoes = posicoes[posicoes < matriz.shape[0]]
+            escolhidos, scores = selecionar_top_k(matriz[posicoes] @ query, top_k)
+            return posicoes[escolhidos], scores
+
+        if self._codigos is not None:
+            # Códigos compactos escolhem os candidatos; o float32 dá o score final
+            posicoes = self._codigos.candidatos(query, top_k)
+            posicoes = np.sort(posicoes[posicoes < matriz.shape[0]])
+            escolhidos, scores = selecionar_top_k(matriz[posicoes] @ query, top_k)
+            return posicoes[escolhidos], scores
+
+        ivf = self._obter_ivf(matriz)
+        if ivf is not None:
+            return ivf.buscar(matriz, query, top_k)
+        return selecionar_top_k(matriz @ query, top_k)
+
+    def _obter_ivf(self, matriz: np.ndarray):
+        from .ann import IndiceIVF, usar_ann
+
+        if not usar_ann(matriz.shape[0], self.modo_ann):
+            return None
+
+        ivf = self._ivf
+        if ivf is None or ivf.precisa_retreinar():
+            with self._lock_ivf:
+                if self._ivf is None or self._ivf.precisa_retreinar():
+                    print(f"🧭 Treinando índice IVF para {matriz.shape[0]} documentos...")
+                    novo = IndiceIVF(matriz)
+                    # Documentos anexados durante o treino entram como pendentes
+                    for posicao in range(matriz.shape[0], self._tamanho):
+                        novo.anexar(posicao)
+                    self._ivf = novo
+                ivf = self._ivf
+        return ivf
+
+
+def ranquear_indices(query_embedding: Sequence[float], indices: List[IndiceVetorial], top_k: int,
+                     filtro: Optional[FiltroBusca] = None) -> List[Tuple[IndiceVetorial, int, float]]:
+    """
+    Pontua vários índices com a mesma query e devolve os top_k globais como
+    (índice de origem, posição no índice, similaridade). Índices com dimensão
+    diferente da query são ignorados; `filtro` restringe os índices com metadados.
+    """
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norma = np.linalg.norm(query)
+    if norma == 0:
+        return []
+    query = query / norma
+
+    candidatos = []
+    for indice in indices:
+        if len(indice) == 0:
+            continue
+        if indice.dimensao != query.shape[0]:
+            print(f"⚠️ Índice ignorado: dimensão {indice.dimensao} != {query.shape[0]} da query.")
+            continue
+        filtradas = indice.metadados.posicoes(filtro, len(indice)) if indice.metadados is not None else None
+        if filtradas is not None and len(filtradas) == 0:
+            continue
+        posicoes, scores = indice.buscar(query, top_k, filtradas)
+        candidatos.extend((indice, int(p), float(s)) for p, s in zip(posicoes, scores))
+
+    candidatos.sort(key=lambda c: c[2], reverse=True)
+    return candidatos[:top_k]
+
+
+class CacheIndicesUsuario:
+    """
+    Cache LRU em memória de IndiceVetorial por usuário, limitado pelo total de bytes.
+    Entradas expiram após `ttl` segundos para que escritas feitas em outros workers
+    do gunicorn acabem sendo vistas; escritas locais são anexadas incrementalmente.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entradas: 'OrderedDict[str, Tuple[IndiceVetorial, float]]' = OrderedDict()
+        # Preferência de busca aproximada por usuário, aplicada a cada índice armazenado
+        self._modos_ann: Dict[str, Optional[str]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def obter(self, user_id: str) -> Optional[IndiceVetorial]:
+        with self._lock:
+            entrada = self._entradas.get(user_id)
+            if entrada is None or time.monotonic() - entrada[1] > self.ttl:
+                if entrada is not None:
+                    self._remover(user_id)
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(user_id)
+            self.hits += 1
+            return entrada[0]
+
+    def armazenar(self, user_id: str, indice: IndiceVetorial) -> None:
+        with self._lock:
+            if user_id in self._modos_ann:
+                indice.modo_ann = self._modos_ann[user_id]
+            if user_id in self._entradas:
+                self._remover(user_id)
+            if indice.nbytes > self.max_bytes:
+                print(f"⚠️ Índice de {user_id} ({indice.nbytes} bytes) excede o limite do cache. Não armazenado.")
+                return
+            self._entradas[user_id] = (indice, time.monotonic())
+            self._bytes += indice.nbytes
+            self._despejar()
+
+    def anexar(self, user_id: str, doc_id: str, texto: str, embedding: Sequence[float],
+               metadados: Optional[Dict] = None) -> bool:
+        """Atualiza o índice em cache (se houver) sem forçar recarga completa."""
+        with self._lock:
+            entrada = self._entradas.get(user_id)
+            if entrada is None:
+                return False
+            indice = entrada[0]
+            antes = indice.nbytes
+            if not indice.anexar(doc_id, texto, embedding, metadados):
+                # Dimensão incompatível ou id regravado (retentativa da outbox, reenvio):
+                # anexar duplicaria o documento, então é mais seguro recarregar do backend
+                self._remover(user_id)
+                return False
+            self._bytes += indice.nbytes - antes
+            self._despejar()
+            return True
+
+    def invalidar(self, user_id: str) -> None:
+        with self._lock:
+            if user_id in self._entradas:
+                self._remover(user_id)
+
+    def definir_modo_ann(self, user_id: str, modo: Optional[str]) -> None:
+        """Preferência de IVF do usuário ('auto', 'sempre', 'nunca'), para o índice em cache e os próximos."""
+        from .ann import MODO_ANN_AUTO
+        with self._lock:
+            # Só as preferências fora do padrão ficam guardadas: o dict não cresce com cada usuário
+            if modo in (None, MODO_ANN_AUTO):
+                self._modos_ann.pop(user_id, None)
+            else:
+                self._modos_ann[user_id] = modo
+            entrada = self._entradas.get(user_id)
+            if entrada is not None:
+                entrada[0].modo_ann = modo
+
+    def estatisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _remover(self, user_id: str) -> None:
+        indice, _ = self._entradas.pop(user_id)
+        self._bytes -= indice.nbytes
+
+    def _despejar(self) -> None:
+        while self._bytes > self.max_bytes and self._entradas:
+            user_id = next(iter(self._entradas))
+            self._remover(user_id)
+            self.evictions += 1
+
+
+# Instância compartilhada pelo processo (cada worker do gunicorn tem a sua)
+cache_indices_usuario = CacheIndicesUsuario(
+    max_bytes=int(os.environ.get('SENSEI_INDEX_CACHE_MAX_MB', '256')) * 1024 * 1024,
+    ttl=float(os.environ.get('SENSEI_INDEX_CACHE_TTL', '300')),
+)
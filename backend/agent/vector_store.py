@@ -0,0 +1,732 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from firebase_admin import firestore
+
+from .chunking import CAMPO_INDICE, CAMPO_INICIO, CAMPO_PAI, agrupar_chunks
+from .embedding_cache import CAMPO_HASH
+from .filtros import CAMPO_FONTE, CAMPO_TAGS, CAMPO_TIMESTAMP, CAMPOS_METADADOS, FiltroBusca, aplicar_recencia
+from .global_index import IndicesGlobaisMapeados, indices_globais
+from .lexical import (
+    BUSCA_HIBRIDA,
+    CANDIDATOS_RRF,
+    LIMITE_DOCS_HIBRIDA,
+    IndiceLexico,
+    cache_indices_lexicos,
+    fundir_rrf,
+    ranquear_lexico,
+)
+from .recuperacao import LIMIAR_REDUNDANCIA, nao_redundantes
+from .vector_index import (
+    CAMPO_DIMENSAO,
+    CAMPO_NORMALIZADO,
+    DIMENSAO_EMBEDDING,
+    DIMENSAO_EMBEDDING_COMPLETA,
+    CacheIndicesUsuario,
+    IndiceVetorial,
+    cache_indices_usuario,
+    ranquear_indices,
+)
+
+
+# ============================================
+# ARMAZÉM VETORIAL (VECTOR STORE) PLUGÁVEL
+# ============================================
+# A busca e a gravação de contextos passam por um ArmazemVetorial, escolhido
+# por SENSEI_VECTOR_STORE:
+#   firestore -> users/{id}/inteligencia_critica e global_knowledge/{role}/concepts
+#   local     -> um arquivo SQLite com os vetores em float32 (sem rede e sem credenciais)
+#
+# Documentos trafegam como dicts neutros:
+#   {'texto', 'embedding' (normalizado), [id], [hash_conteudo], [contexto_pai, chunk_indice, chunk_inicio],
+#    [timestamp (epoch), fonte, tags]}
+# e cada escopo ("users/{id}" ou "global_knowledge/{role}") é um espaço de busca.
+# Com 'id', a gravação usa esse id e sobrescreve um documento existente (idempotente).
+# Nos escopos de usuário, data/fonte/tags entram nos índices e viram filtros de busca.
+# Com `dimensao` definida (SENSEI_EMBEDDING_DIM), vetores de outra dimensão
+# ficam fora dos índices até serem regerados (manage.py regerar_embeddings).
+
+BACKEND_VECTOR_STORE = os.environ.get('SENSEI_VECTOR_STORE', 'firestore').lower()
+CAMINHO_STORE_LOCAL = os.environ.get(
+    'SENSEI_LOCAL_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'vector_store.sqlite3'),
+)
+
+CAMPOS_CHUNK = (CAMPO_PAI, CAMPO_INDICE, CAMPO_INICIO)
+
+# Limite do Firestore: 500 escritas por WriteBatch
+LOTE_FIRESTORE_MAX_ESCRITAS = 500
+
+# Limite do Firestore: 30 valores por filtro 'in'
+LOTE_FIRESTORE_MAX_IN = 30
+
+
+def escopo_usuario(user_id: str) -> str:
+    return f"users/{user_id}"
+
+
+def escopo_global(role: str) -> str:
+    return f"global_knowledge/{role.lower()}"
+
+
+def _separar_escopo(escopo: str) -> Tuple[str, str]:
+    raiz, nome = escopo.split('/', 1)
+    return raiz, nome
+
+
+def _escopo_privado(escopo: str) -> bool:
+    return _separar_escopo(escopo)[0] == 'users'
+
+
+def metadados_documento(documento: Dict, timestamp_padrao: Optional[float] = None) -> Dict:
+    """Data, fonte e tags de um documento; sem data, vale a da gravação."""
+    return {
+        CAMPO_TIMESTAMP: documento.get(CAMPO_TIMESTAMP) or timestamp_padrao or time.time(),
+        CAMPO_FONTE: documento.get(CAMPO_FONTE),
+        CAMPO_TAGS: documento.get(CAMPO_TAGS) or [],
+    }
+
+
+def vetores_dos_candidatos(ranking: List, indices: List[IndiceVetorial], escopos_por_indice: Dict[int, str],
+                           dimensao: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Linha normalizada do índice vetorial de cada candidato do ranking (os do
+    BM25 são achados pelo doc_id no índice vetorial do mesmo escopo) e a
+    máscara de quem tem uma; sem linha, o vetor fica zerado.
+    """
+    vetoriais = {escopos_por_indice[id(indice)]: indice for indice in indices
+                 if len(indice) and indice.dimensao == dimensao}
+    vetores = np.zeros((len(ranking), dimensao), dtype=np.float32)
+    encontrados = np.zeros(len(ranking), dtype=bool)
+    for k, (origem, pos, _) in enumerate(ranking):
+        indice = vetoriais.get(escopos_por_indice[id(origem)])
+        posicao = None
+        if indice is not None:
+            posicao = pos if origem is indice else indice.posicao(origem.ids[pos])
+        if posicao is not None:
+            vetores[k] = indice.matriz[posicao]
+            encontrados[k] = True
+    return vetores, encontrados
+
+
+def lexicos_acima_do_limiar(ranking_lexico: List, query_embedding: Sequence[float], indices: List[IndiceVetorial],
+                            escopos_por_indice: Dict[int, str], score_minimo: float) -> List:
+    """
+    Candidatos BM25 cujo documento tem similaridade >= score_minimo com a query.
+    Um acerto por palavra-chave sem correspondente no índice vetorial (ex.:
+    embedding de outra dimensão) não tem como ser avaliado e sai.
+    """
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norma = np.linalg.norm(query)
+    if norma == 0:
+        return []
+    vetores, encontrados = vetores_dos_candidatos(ranking_lexico, indices, escopos_por_indice, query.shape[0])
+    mantidos = encontrados & (vetores @ (query / norma) >= score_minimo)
+    return [candidato for candidato, mantido in zip(ranking_lexico, mantidos) if mantido]
+
+
+def descartar_redundantes(ranking: List, indices: List[IndiceVetorial], escopos_por_indice: Dict[int, str],
+                          dimensao: int, limiar: float = LIMIAR_REDUNDANCIA) -> List:
+    """Remove do ranking os candidatos quase idênticos a um mais relevante (cosseno dos embeddings)."""
+    vetores, _ = vetores_dos_candidatos(ranking, indices, escopos_por_indice, dimensao)
+    return [ranking[i] for i in nao_redundantes(vetores, limiar)]
+
+
+def ranquear_escopos(escopos: Sequence[str], query_embedding: Optional[Sequence[float]], indices: List[IndiceVetorial],
+                     query_texto: Optional[str], lexicos: List[Optional[IndiceLexico]], top_k: int,
+                     score_minimo: Optional[float] = None,
+                     filtro: Optional[FiltroBusca] = None) -> Tuple[List, Dict[int, str]]:
+    """
+    Ranking final dos escopos: vetorial puro, léxico puro (sem embedding da
+    query) ou os dois fundidos por RRF. Retorna (ranking, escopo de cada índice).
+    `lexicos` segue a ordem de `escopos`; None = escopo sem índice BM25 pronto.
+    Com `score_minimo`, candidatos abaixo dessa similaridade saem antes da fusão,
+    inclusive os do BM25 (avaliados pelo cosseno do mesmo documento no índice
+    vetorial do escopo); sem embedding da query não há como aplicá-lo. `filtro`
+    restringe os documentos antes da pontuação e pode reordenar por recência.
+    """
+    escopos_por_indice = {id(indice): escopo for indice, escopo in zip(indices, escopos)}
+    escopos_por_indice.update({id(indice): escopo for indice, escopo in zip(lexicos, escopos) if indice is not None})
+    lexicos = [indice for indice in lexicos if indice is not None]
+
+    rankings = []
+    # Sem filtro explícito ainda vale o decaimento padrão (SENSEI_RECENCIA_MEIA_VIDA_DIAS)
+    filtro = filtro or FiltroBusca()
+    reordena = filtro.meia_vida_dias > 0
+    candidatos = max(top_k, CANDIDATOS_RRF) if (query_texto and lexicos) or reordena else top_k
+    if query_embedding is not None:
+        ranking_vetorial = ranquear_indices(query_embedding, indices, candidatos, filtro)
+        if score_minimo is not None:
+            ranking_vetorial = [candidato for candidato in ranking_vetorial if candidato[2] >= score_minimo]
+        rankings.append(aplicar_recencia(ranking_vetorial, filtro))
+    if query_texto and lexicos:
+        ranking_lexico = ranquear_lexico(query_texto, lexicos, candidatos, filtro)
+        if score_minimo is not None and query_embedding is not None:
+            ranking_lexico = lexicos_acima_do_limiar(ranking_lexico, query_embedding, indices, escopos_por_indice,
+                                                     score_minimo)
+        rankings.append(aplicar_recencia(ranking_lexico, filtro))
+
+    if len(rankings) <= 1:
+        return (rankings[0][:top_k] if rankings else []), escopos_por_indice
+    return fundir_rrf(rankings, escopos_por_indice, top_k), escopos_por_indice
+
+
+class ArmazemVetorial:
+    """
+    Interface comum dos backends: adicionar, adicionar_varios, buscar, remover e contar.
+    Os backends implementam o carregamento do índice (fase 1) e a leitura dos
+    documentos vencedores (fase 2); a busca em si é compartilhada.
+    """
+
+    def carregar_indice(self, escopo: str) -> IndiceVetorial:
+        raise NotImplementedError
+
+    def ler_documentos(self, escopo: str, doc_ids: List[str]) -> Dict[str, Dict]:
+        raise NotImplementedError
+
+    def adicionar_varios(self, escopo: str, documentos: List[Dict]) -> List[str]:
+        raise NotImplementedError
+
+    def remover(self, escopo: str, doc_ids: List[str]) -> int:
+        raise NotImplementedError
+
+    def contar(self, escopo: str) -> int:
+        raise NotImplementedError
+
+    def hashes_existentes(self, escopo: str, hashes: Sequence[str]) -> Set[str]:
+        """Quais dos hashes de conteúdo já estão gravados no escopo."""
+        raise NotImplementedError
+
+    def escopos(self) -> List[str]:
+        """Todos os escopos com documentos (usado pelas rotinas de manutenção)."""
+        raise NotImplementedError
+
+    def documentos_fora_da_dimensao(self, escopo: str, dimensao: int) -> List[Tuple[str, str]]:
+        """(doc_id, texto) dos documentos cujo embedding não tem a dimensão pedida."""
+        raise NotImplementedError
+
+    def textos_do_escopo(self, escopo: str) -> Tuple[List[str], List[str], Optional[List[Dict]]]:
+        """
+        (ids, textos, metadados) de todos os documentos do escopo, para o índice
+        léxico; metadados só nos escopos de usuário (None nos demais).
+        """
+        raise NotImplementedError
+
+    def atualizar_embeddings(self, escopo: str, embeddings: Dict[str, List[float]]) -> int:
+        """Substitui os embeddings (já normalizados) dos documentos informados."""
+        raise NotImplementedError
+
+    def invalidar(self, escopo: str) -> None:
+        """Descarta os índices (vetorial e léxico) em cache do escopo."""
+        self.cache.invalidar(escopo)
+        self.cache_lexico.invalidar(escopo)
+
+    def adicionar(self, escopo: str, documento: Dict) -> str:
+        return self.adicionar_varios(escopo, [documento])[0]
+
+    def _anexar_em_cache(self, escopo: str, doc_id: str, documento: Dict) -> None:
+        """Mantém os índices em memória coerentes sem forçar recarga completa."""
+        metadados = metadados_documento(documento)
+        self.cache.anexar(escopo, doc_id, documento['texto'], documento['embedding'], metadados)
+        self.cache_lexico.anexar(escopo, doc_id, documento['texto'], (), metadados)
+
+    def carregar_indice_lexico(self, escopo: str) -> IndiceLexico:
+        """Índice BM25 do escopo, montado na hora se não estiver em cache (lê todos os textos)."""
+        indice = self.cache_lexico.obter(escopo)
+        if indice is None:
+            ids, textos, metadados = self.textos_do_escopo(escopo)
+            indice = IndiceLexico.de_textos(ids, textos, metadados=metadados)
+            print(f"🔤 Índice léxico montado ({escopo} | {len(indice)} docs)")
+            self.cache_lexico.armazenar(escopo, indice)
+        return indice
+
+    # Escopos com montagem do índice léxico em andamento (compartilhado entre instâncias)
+    _montagens_lexicas: Set[Tuple[int, str]] = set()
+    _lock_montagens = threading.Lock()
+
+    def indice_lexico_disponivel(self, escopo: str, total_documentos: int) -> Optional[IndiceLexico]:
+        """
+        Índice BM25 para a busca híbrida sem ler textos no caminho da requisição:
+        o que já está em cache ou None. Na falta, agenda a montagem em segundo
+        plano, se o escopo tiver até LIMITE_DOCS_HIBRIDA documentos.
+        """
+        indice = self.cache_lexico.obter(escopo)
+        if indice is not None or total_documentos == 0 or total_documentos > LIMITE_DOCS_HIBRIDA:
+            return indice
+
+        chave = (id(self), escopo)
+        with self._lock_montagens:
+            if chave in self._montagens_lexicas:
+                return None
+            self._montagens_lexicas.add(chave)
+
+        def montar():
+            try:
+                self.carregar_indice_lexico(escopo)
+            except Exception as e:
+                print(f"⚠️ Falha ao montar o índice léxico de {escopo}: {e}")
+            finally:
+                with self._lock_montagens:
+                    self._montagens_lexicas.discard(chave)
+
+        threading.Thread(target=montar, name='indice-lexico', daemon=True).start()
+        return None
+
+    def trechos_vencedores(self, ranking, escopos_por_indice: Dict[int, str]) -> List[Tuple[Hashable, Optional[int], int, str]]:
+        """
+        Fase 2: lê, em lote por escopo, os documentos do ranking e devolve os
+        trechos no formato de agrupar_chunks. Índices que já têm os textos
+        (ex.: índice global mapeado) não vão ao backend.
+        """
+        ids_por_escopo: Dict[str, List[str]] = {}
+        for indice, pos, _ in ranking:
+            if indice.textos is None:
+                ids_por_escopo.setdefault(escopos_por_indice[id(indice)], []).append(indice.ids[pos])
+        dados_por_escopo = {escopo: self.ler_documentos(escopo, ids) for escopo, ids in ids_por_escopo.items()}
+
+        trechos = []
+        for indice, pos, _ in ranking:
+            escopo = escopos_por_indice[id(indice)]
+            doc_id = indice.ids[pos]
+            if indice.textos is not None:
+                trechos.append(((escopo, doc_id), None, 0, indice.textos[pos]))
+            elif doc_id in dados_por_escopo[escopo]:
+                data = dados_por_escopo[escopo][doc_id]
+                trechos.append(((escopo, data.get(CAMPO_PAI) or doc_id), data.get(CAMPO_INDICE),
+                                data.get(CAMPO_INICIO) or 0, data['texto']))
+            else:
+                # Documento apagado depois que o índice foi montado
+                print(f"⚠️ Documento {doc_id} não encontrado na fase 2. Índice será recarregado.")
+                self.invalidar(escopo)
+        return trechos
+
+    def buscar(self, escopos: Sequence[str], query_embedding: Optional[Sequence[float]], top_k: int,
+               query_texto: Optional[str] = None, score_minimo: Optional[float] = None,
+               filtro: Optional[FiltroBusca] = None) -> List[str]:
+        """
+        Top_k contextos dos escopos combinados, com os chunks de um mesmo contexto
+        reagrupados. Com `query_texto` (e SENSEI_BUSCA_HIBRIDA), o BM25 entra na
+        fusão; sem embedding, só ele é usado. `score_minimo` descarta os
+        candidatos vetoriais pouco similares; `filtro` restringe data, fonte e
+        tags dos contextos do usuário.
+        """
+        indices, lexicos = [], []
+        if query_embedding is not None:
+            indices = [self.carregar_indice(escopo) for escopo in escopos]
+            if query_texto and BUSCA_HIBRIDA:
+                lexicos = [self.indice_lexico_disponivel(escopo, len(indice)) for escopo, indice in zip(escopos, indices)]
+        elif query_texto:
+            lexicos = [self.carregar_indice_lexico(escopo) for escopo in escopos]
+        ranking, escopos_por_indice = ranquear_escopos(
+            escopos, query_embedding, indices, query_texto, lexicos, top_k, score_minimo, filtro
+        )
+        return agrupar_chunks(self.trechos_vencedores(ranking, escopos_por_indice))
+
+
+# ============================================
+# BACKEND FIRESTORE
+# ============================================
+
+def colecao_privada(db, user_id: str):
+    return db.collection('users').document(user_id).collection('inteligencia_critica')
+
+
+def colecao_global(db, role: str):
+    return db.collection('global_knowledge').document(role.lower()).collection('concepts')
+
+
+def indice_de_documentos(docs, dimensao: Optional[int] = None, com_metadados: bool = False) -> IndiceVetorial:
+    """
+    Converte documentos projetados (id + embedding) em um IndiceVetorial sem textos;
+    os textos são lidos depois, apenas para os vencedores (buscar_textos).
+    """
+    ids, embeddings, normalizados, metadados = [], [], [], []
+    for doc in docs:
+        data = doc.to_dict()
+        if data.get('embedding'):
+            ids.append(doc.id)
+            embeddings.append(data['embedding'])
+            normalizados.append(data.get(CAMPO_NORMALIZADO, False))
+            metadados.append({campo: data.get(campo) for campo in CAMPOS_METADADOS})
+        else:
+            print(f"⚠️ Documento {doc.id} ignorado. Campo faltando: ['embedding']")
+    return IndiceVetorial.de_embeddings(ids, None, embeddings, normalizados, dimensao=dimensao,
+                                        metadados=metadados if com_metadados else None)
+
+
+def stream_embeddings(colecao_ref, com_metadados: bool = False):
+    """Fase 1: lê só id + embedding (projeção), sem trafegar os textos longos."""
+    campos = ['embedding', CAMPO_NORMALIZADO, *(CAMPOS_METADADOS if com_metadados else ())]
+    return list(colecao_ref.select(campos).stream())
+
+
+def buscar_textos(db, colecao_ref, doc_ids: List[str], campo_texto: str,
+                  campos_extras: Sequence[str] = ()) -> Dict[str, Dict]:
+    """
+    Fase 2: lê apenas o campo de texto (e os campos extras pedidos) dos
+    documentos vencedores com um único get_all.
+    """
+    if not doc_ids:
+        return {}
+    refs = [colecao_ref.document(doc_id) for doc_id in doc_ids]
+    dados = {}
+    for snap in db.get_all(refs, field_paths=[campo_texto, *campos_extras]):
+        data = snap.to_dict() if snap.exists else None
+        if data and campo_texto in data:
+            dados[snap.id] = data
+    return dados
+
+
+class ArmazemFirestore(ArmazemVetorial):
+    """
+    Backend atual: índice privado em cache por processo, índice global via mmap
+    quando exportado (manage.py construir_indice_global) e busca em duas fases.
+    """
+
+    def __init__(self, obter_db: Callable, cache: CacheIndicesUsuario = cache_indices_usuario,
+                 indices_mapeados: IndicesGlobaisMapeados = indices_globais, dimensao: Optional[int] = None,
+                 cache_lexico: CacheIndicesUsuario = cache_indices_lexicos):
+        self.obter_db = obter_db
+        self.cache = cache
+        self.cache_lexico = cache_lexico
+        self.indices_mapeados = indices_mapeados
+        self.dimensao = dimensao
+
+    def _colecao(self, db, escopo: str):
+        raiz, nome = _separar_escopo(escopo)
+        return colecao_privada(db, nome) if raiz == 'users' else colecao_global(db, nome)
+
+    @staticmethod
+    def _campo_texto(escopo: str) -> str:
+        return 'contexto' if _separar_escopo(escopo)[0] == 'users' else 'content'
+
+    def _documento_firestore(self, escopo: str, documento: Dict) -> Dict:
+        dados = {k: v for k, v in documento.items() if k not in ('texto', 'id')}
+        dados[self._campo_texto(escopo)] = documento['texto']
+        dados[CAMPO_NORMALIZADO] = True
+        dados[CAMPO_DIMENSAO] = len(documento['embedding'])
+        # Contextos vindos da fila mantêm a data de criação original
+        dados[CAMPO_TIMESTAMP] = (
+            datetime.fromtimestamp(documento[CAMPO_TIMESTAMP], tz=timezone.utc)
+            if documento.get(CAMPO_TIMESTAMP) else firestore.SERVER_TIMESTAMP
+        )
+        return dados
+
+    def carregar_indice(self, escopo: str) -> IndiceVetorial:
+        raiz, nome = _separar_escopo(escopo)
+        if raiz != 'users':
+            # Conceitos globais: índice em disco mapeado em memória, se existir
+            indice = self.indices_mapeados.obter(nome)
+            if indice is not None:
+                return indice
+            print(f"🌍 Buscando Stream Global (Role: {nome} | Collection: global_knowledge)")
+            global_docs = stream_embeddings(self._colecao(self.obter_db(), escopo))
+            print(f"📊 Documentos encontrados no Firestore (Global): {len(global_docs)}")
+            return indice_de_documentos(global_docs, self.dimensao)
+
+        indice = self.cache.obter(escopo)
+        if indice is not None:
+            print(f"⚡ Índice privado em cache (User: {nome} | {len(indice)} docs)")
+            return indice
+
+        print(f"📡 Buscando Stream Privado (User: {nome} | Collection: inteligencia_critica)")
+        user_docs = stream_embeddings(self._colecao(self.obter_db(), escopo), com_metadados=True)
+        print(f"📊 Documentos encontrados no Firestore (Privado): {len(user_docs)}")
+
+        indice = indice_de_documentos(user_docs, self.dimensao, com_metadados=True)
+        self.cache.armazenar(escopo, indice)
+        return indice
+
+    def ler_documentos(self, escopo: str, doc_ids: List[str]) -> Dict[str, Dict]:
+        db = self.obter_db()
+        campo_texto = self._campo_texto(escopo)
+        campos_extras = CAMPOS_CHUNK if campo_texto == 'contexto' else ()
+        dados = buscar_textos(db, self._colecao(db, escopo), doc_ids, campo_texto, campos_extras)
+        for data in dados.values():
+            data['texto'] = data.pop(campo_texto)
+        return dados
+
+    def adicionar(self, escopo: str, documento: Dict) -> str:
+        if documento.get('id'):
+            # add() falha se o documento existir; set() em lote sobrescreve
+            return self.adicionar_varios(escopo, [documento])[0]
+        _, doc_ref = self._colecao(self.obter_db(), escopo).add(self._documento_firestore(escopo, documento))
+        self._anexar_em_cache(escopo, doc_ref.id, documento)
+        return doc_ref.id
+
+    def adicionar_varios(self, escopo: str, documentos: List[Dict]) -> List[str]:
+        """WriteBatch de até 500 documentos (lotes maiores viram vários commits)."""
+        db = self.obter_db()
+        colecao_ref = self._colecao(db, escopo)
+        ids = []
+        for inicio in range(0, len(documentos), LOTE_FIRESTORE_MAX_ESCRITAS):
+            bloco = documentos[inicio:inicio + LOTE_FIRESTORE_MAX_ESCRITAS]
+            batch = db.batch()
+            refs = []
+            for documento in bloco:
+                doc_ref = colecao_ref.document(documento.get('id'))
+                batch.set(doc_ref, self._documento_firestore(escopo, documento))
+                refs.append(doc_ref)
+            batch.commit()
+
+            for documento, doc_ref in zip(bloco, refs):
+                self._anexar_em_cache(escopo, doc_ref.id, documento)
+                ids.append(doc_ref.id)
+        return ids
+
+    def remover(self, escopo: str, doc_ids: List[str]) -> int:
+        db = self.obter_db()
+        colecao_ref = self._colecao(db, escopo)
+        for inicio in range(0, len(doc_ids), LOTE_FIRESTORE_MAX_ESCRITAS):
+            batch = db.batch()
+            for doc_id in doc_ids[inicio:inicio + LOTE_FIRESTORE_MAX_ESCRITAS]:
+                batch.delete(colecao_ref.document(doc_id))
+            batch.commit()
+        self.invalidar(escopo)
+        return len(doc_ids)
+
+    def contar(self, escopo: str) -> int:
+        resultado = self._colecao(self.obter_db(), escopo).count().get()
+        return int(resultado[0][0].value)
+
+    def hashes_existentes(self, escopo: str, hashes: Sequence[str]) -> Set[str]:
+        """Consultas 'in' de até 30 hashes, lendo só o próprio campo."""
+        colecao_ref = self._colecao(self.obter_db(), escopo)
+        unicos = list(dict.fromkeys(hashes))
+        existentes = set()
+        for inicio in range(0, len(unicos), LOTE_FIRESTORE_MAX_IN):
+            consulta = colecao_ref.where(CAMPO_HASH, 'in', unicos[inicio:inicio + LOTE_FIRESTORE_MAX_IN])
+            for doc in consulta.select([CAMPO_HASH]).stream():
+                existentes.add(doc.to_dict().get(CAMPO_HASH))
+        return existentes
+
+    def escopos(self) -> List[str]:
+        db = self.obter_db()
+        return ([escopo_usuario(ref.id) for ref in db.collection('users').list_documents()]
+                + [escopo_global(ref.id) for ref in db.collection('global_knowledge').list_documents()])
+
+    def documentos_fora_da_dimensao(self, escopo: str, dimensao: int) -> List[Tuple[str, str]]:
+        """Lê só texto e dimensão; documentos sem o campo são da dimensão completa."""
+        campo_texto = self._campo_texto(escopo)
+        documentos = []
+        for doc in self._colecao(self.obter_db(), escopo).select([campo_texto, CAMPO_DIMENSAO]).stream():
+            data = doc.to_dict()
+            if data.get(campo_texto) and data.get(CAMPO_DIMENSAO, DIMENSAO_EMBEDDING_COMPLETA) != dimensao:
+                documentos.append((doc.id, data[campo_texto]))
+        return documentos
+
+    def atualizar_embeddings(self, escopo: str, embeddings: Dict[str, List[float]]) -> int:
+        db = self.obter_db()
+        colecao_ref = self._colecao(db, escopo)
+        itens = list(embeddings.items())
+        for inicio in range(0, len(itens), LOTE_FIRESTORE_MAX_ESCRITAS):
+            batch = db.batch()
+            for doc_id, embedding in itens[inicio:inicio + LOTE_FIRESTORE_MAX_ESCRITAS]:
+                batch.update(colecao_ref.document(doc_id), {
+                    'embedding': embedding, CAMPO_NORMALIZADO: True, CAMPO_DIMENSAO: len(embedding),
+                })
+            batch.commit()
+        self.invalidar(escopo)
+        return len(itens)
+
+    def textos_do_escopo(self, escopo: str) -> Tuple[List[str], List[str], Optional[List[Dict]]]:
+        campo_texto = self._campo_texto(escopo)
+        privado = _escopo_privado(escopo)
+        campos = [campo_texto, *(CAMPOS_METADADOS if privado else ())]
+        ids, textos, metadados = [], [], []
+        for doc in self._colecao(self.obter_db(), escopo).select(campos).stream():
+            data = doc.to_dict()
+            if data.get(campo_texto):
+                ids.append(doc.id)
+                textos.append(data[campo_texto])
+                metadados.append({campo: data.get(campo) for campo in CAMPOS_METADADOS})
+        return ids, textos, metadados if privado else None
+
+    def carregar_indice_lexico(self, escopo: str) -> IndiceLexico:
+        raiz, nome = _separar_escopo(escopo)
+        mapeado = self.indices_mapeados.obter(nome) if raiz != 'users' else None
+        if mapeado is None:
+            return super().carregar_indice_lexico(escopo)
+
+        # Conceitos globais exportados: os textos já estão no sidecar do índice mapeado
+        indice = self.cache_lexico.obter(escopo)
+        if indice is None or indice.ids != mapeado.ids:
+            indice = IndiceLexico.de_textos(mapeado.ids, mapeado.textos, guardar_textos=True)
+            self.cache_lexico.armazenar(escopo, indice)
+        return indice
+
+    def indice_lexico_disponivel(self, escopo: str, total_documentos: int) -> Optional[IndiceLexico]:
+        raiz, nome = _separar_escopo(escopo)
+        if raiz != 'users' and self.indices_mapeados.obter(nome) is not None:
+            # Sem rede: os textos vêm do sidecar já mapeado
+            return self.carregar_indice_lexico(escopo)
+        return super().indice_lexico_disponivel(escopo, total_documentos)
+
+
+# ============================================
+# BACKEND LOCAL (SQLITE + NUMPY)
+# ============================================
+
+class ArmazemLocal(ArmazemVetorial):
+    """
+    Um arquivo SQLite com os vetores em float32 (BLOB). O índice de cada escopo
+    é montado com np.frombuffer e guardado no mesmo cache LRU do backend
+    Firestore; a busca não faz nenhuma chamada de rede.
+    """
+
+    def __init__(self, caminho: str = CAMINHO_STORE_LOCAL, cache: Optional[CacheIndicesUsuario] = None,
+                 dimensao: Optional[int] = None, cache_lexico: Optional[CacheIndicesUsuario] = None):
+        self.caminho = caminho
+        self.cache = cache if cache is not None else cache_indices_usuario
+        self.cache_lexico = cache_lexico if cache_lexico is not None else cache_indices_lexicos
+        self.dimensao = dimensao
+        self._local = threading.local()
+
+    def _conexao(self) -> sqlite3.Connection:
+        """Uma conexão por thread; cria a tabela na primeira vez."""
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+            conexao = sqlite3.connect(self.caminho, timeout=10)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS documentos ("
+                "escopo TEXT NOT NULL, doc_id TEXT NOT NULL, texto TEXT NOT NULL, embedding BLOB NOT NULL, "
+                "contexto_pai TEXT, chunk_indice INTEGER, chunk_inicio INTEGER, criado_em REAL NOT NULL, "
+                "hash_conteudo TEXT, fonte TEXT, tags TEXT, PRIMARY KEY (escopo, doc_id))"
+            )
+            # Arquivos criados antes da deduplicação/dos filtros não têm essas colunas
+            colunas = {linha[1] for linha in conexao.execute("PRAGMA table_info(documentos)")}
+            for coluna in (CAMPO_HASH, CAMPO_FONTE, CAMPO_TAGS):
+                if coluna not in colunas:
+                    try:
+                        conexao.execute(f"ALTER TABLE documentos ADD COLUMN {coluna} TEXT")
+                    except sqlite3.OperationalError:
+                        pass  # outra conexão acabou de criá-la
+            conexao.execute("CREATE INDEX IF NOT EXISTS documentos_hash ON documentos (escopo, hash_conteudo)")
+            self._local.conexao = conexao
+        return conexao
+
+    def carregar_indice(self, escopo: str) -> IndiceVetorial:
+        indice = self.cache.obter(escopo)
+        if indice is not None:
+            return indice
+
+        linhas = self._conexao().execute(
+            "SELECT doc_id, embedding, criado_em, fonte, tags FROM documentos WHERE escopo = ? ORDER BY rowid", (escopo,)
+        ).fetchall()
+        ids = [linha[0] for linha in linhas]
+        vetores = [np.frombuffer(linha[1], dtype=np.float32) for linha in linhas]
+        metadados = [self._metadados_linha(*linha[2:]) for linha in linhas] if _escopo_privado(escopo) else None
+        indice = IndiceVetorial.de_embeddings(ids, None, vetores, [True] * len(vetores), dimensao=self.dimensao,
+                                              metadados=metadados)
+        self.cache.armazenar(escopo, indice)
+        return indice
+
+    @staticmethod
+    def _metadados_linha(criado_em: float, fonte: Optional[str], tags: Optional[str]) -> Dict:
+        return {CAMPO_TIMESTAMP: criado_em, CAMPO_FONTE: fonte, CAMPO_TAGS: json.loads(tags) if tags else []}
+
+    def ler_documentos(self, escopo: str, doc_ids: List[str]) -> Dict[str, Dict]:
+        if not doc_ids:
+            return {}
+        marcadores = ",".join("?" * len(doc_ids))
+        linhas = self._conexao().execute(
+            f"SELECT doc_id, texto, contexto_pai, chunk_indice, chunk_inicio FROM documentos "
+            f"WHERE escopo = ? AND doc_id IN ({marcadores})", (escopo, *doc_ids)
+        ).fetchall()
+        return {
+            doc_id: {'texto': texto, CAMPO_PAI: pai, CAMPO_INDICE: indice, CAMPO_INICIO: inicio}
+            for doc_id, texto, pai, indice, inicio in linhas
+        }
+
+    def adicionar_varios(self, escopo: str, documentos: List[Dict]) -> List[str]:
+        """Todos os documentos entram numa única transação."""
+        agora = time.time()
+        linhas = [
+            (escopo, documento.get('id') or uuid.uuid4().hex, documento['texto'],
+             np.asarray(documento['embedding'], dtype=np.float32).tobytes(),
+             documento.get(CAMPO_PAI), documento.get(CAMPO_INDICE), documento.get(CAMPO_INICIO),
+             documento.get(CAMPO_TIMESTAMP) or agora, documento.get(CAMPO_HASH), documento.get(CAMPO_FONTE),
+             json.dumps(documento[CAMPO_TAGS]) if documento.get(CAMPO_TAGS) else None)
+            for documento in documentos
+        ]
+        conexao = self._conexao()
+        with conexao:
+            conexao.executemany(
+                "INSERT OR REPLACE INTO documentos (escopo, doc_id, texto, embedding, contexto_pai, chunk_indice, "
+                "chunk_inicio, criado_em, hash_conteudo, fonte, tags) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", linhas
+            )
+
+        for documento, linha in zip(documentos, linhas):
+            self._anexar_em_cache(escopo, linha[1], {**documento, CAMPO_TIMESTAMP: linha[7]})
+        return [linha[1] for linha in linhas]
+
+    def remover(self, escopo: str, doc_ids: List[str]) -> int:
+        conexao = self._conexao()
+        with conexao:
+            removidos = conexao.executemany(
+                "DELETE FROM documentos WHERE escopo = ? AND doc_id = ?", [(escopo, doc_id) for doc_id in doc_ids]
+            ).rowcount
+        self.invalidar(escopo)
+        return removidos
+
+    def contar(self, escopo: str) -> int:
+        return self._conexao().execute("SELECT COUNT(*) FROM documentos WHERE escopo = ?", (escopo,)).fetchone()[0]
+
+    def hashes_existentes(self, escopo: str, hashes: Sequence[str]) -> Set[str]:
+        if not hashes:
+            return set()
+        marcadores = ",".join("?" * len(hashes))
+        return {hash_ for hash_, in self._conexao().execute(
+            f"SELECT DISTINCT hash_conteudo FROM documentos WHERE escopo = ? AND hash_conteudo IN ({marcadores})",
+            (escopo, *hashes),
+        )}
+
+    def escopos(self) -> List[str]:
+        return [escopo for escopo, in self._conexao().execute("SELECT DISTINCT escopo FROM documentos ORDER BY escopo")]
+
+    def documentos_fora_da_dimensao(self, escopo: str, dimensao: int) -> List[Tuple[str, str]]:
+        # O BLOB é float32 contíguo: a dimensão é o tamanho em bytes / 4
+        return self._conexao().execute(
+            "SELECT doc_id, texto FROM documentos WHERE escopo = ? AND length(embedding) != ? ORDER BY rowid",
+            (escopo, dimensao * 4),
+        ).fetchall()
+
+    def atualizar_embeddings(self, escopo: str, embeddings: Dict[str, List[float]]) -> int:
+        conexao = self._conexao()
+        with conexao:
+            atualizados = conexao.executemany(
+                "UPDATE documentos SET embedding = ? WHERE escopo = ? AND doc_id = ?",
+                [(np.asarray(embedding, dtype=np.float32).tobytes(), escopo, doc_id)
+                 for doc_id, embedding in embeddings.items()],
+            ).rowcount
+        self.invalidar(escopo)
+        return atualizados
+
+    def textos_do_escopo(self, escopo: str) -> Tuple[List[str], List[str], Optional[List[Dict]]]:
+        linhas = self._conexao().execute(
+            "SELECT doc_id, texto, criado_em, fonte, tags FROM documentos WHERE escopo = ? ORDER BY rowid", (escopo,)
+        ).fetchall()
+        metadados = [self._metadados_linha(*linha[2:]) for linha in linhas] if _escopo_privado(escopo) else None
+        return [linha[0] for linha in linhas], [linha[1] for linha in linhas], metadados
+
+    def indice_lexico_disponivel(self, escopo: str, total_documentos: int) -> Optional[IndiceLexico]:
+        # Textos no SQLite local: montar na hora não custa rede
+        return self.carregar_indice_lexico(escopo)
+
+
+def criar_armazem(obter_db: Callable, backend: str = BACKEND_VECTOR_STORE) -> ArmazemVetorial:
+    """Instancia o backend configurado em SENSEI_VECTOR_STORE."""
+    if backend == 'local':
+        print(f"🗄️ Armazém vetorial local (SQLite): {CAMINHO_STORE_LOCAL}")
+        return ArmazemLocal(CAMINHO_STORE_LOCAL, dimensao=DIMENSAO_EMBEDDING)
+    if backend != 'firestore':
+        raise ValueError(f"SENSEI_VECTOR_STORE inválido: '{backend}' (use 'firestore' ou 'local').")
+    return ArmazemFirestore(obter_db, dimensao=DIMENSAO_EMBEDDING)
@@ -1,22 +1,32 @@
 from rest_framework.views import APIView
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
 from rest_framework import status, generics, serializers
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from django.http import StreamingHttpResponse
 from django.contrib.auth.models import User # Import Django's User model
 import os
+import json
 import traceback
 
 from .utils import (
+    definir_modo_ann,
     processar_query_usuario,
-    salvar_contexto_usuario,
     init_firebase,
     InvalidGroqApiKey,
     InvalidGoogleApiKey,
     QuotaExceededError,
 )
+from .embedding_cache import cache_embeddings
+from .filtros import FiltroBusca
+from .streaming import eventos_chat
+from .fila_embeddings import enfileirar_contextos, fila_embeddings
+from .ingestion import UPLOAD_MAX_BYTES, FormatoNaoSuportado, blocos_do_arquivo, ingerir_arquivo
+from .vector_index import cache_indices_usuario
 from .models import UserProfile, Context
-from .serializers import UserProfileSerializer, ContextSerializer
+from .serializers import UserProfileSerializer, ContextSerializer, ContextBulkSerializer
 
 
 class UserApiKeysView(APIView):
@@ -37,6 +47,16 @@ class UserApiKeysView(APIView):
             user_profile.groq_api_key = groq_api_key
         if google_api_key is not None:
             user_profile.google_api_key = google_api_key
+
+        ann_mode = request.data.get('ann_mode')
+        if ann_mode is not None:
+            if ann_mode not in UserProfile.AnnMode.values:
+                return Response(
+                    {"erro": f"'ann_mode' deve ser um de: {', '.join(UserProfile.AnnMode.values)}."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            user_profile.ann_mode = ann_mode
+            definir_modo_ann(str(request.user.username), ann_mode)
         
         user_profile.save()
         serializer = UserProfileSerializer(user_profile)
@@ -44,38 +64,138 @@ class UserApiKeysView(APIView):
 
 
 class ContextListView(generics.ListCreateAPIView):
+    """
+    Criação assíncrona: o contexto volta na hora com status 'pending' e o
+    embedding é feito pela fila (fila_embeddings). Filtre com ?status=pending|ready|failed.
+    """
     serializer_class = ContextSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         user_profile, created = UserProfile.objects.get_or_create(user=self.request.user)
-        return Context.objects.filter(user_profile=user_profile).order_by('-timestamp')
+        # A listagem só mostra textos: o embedding nem sai do banco
+        queryset = Context.objects.filter(user_profile=user_profile).defer('embedding').order_by('-timestamp')
+
+        status_filtro = self.request.query_params.get('status')
+        if status_filtro:
+            if status_filtro not in Context.Status.values:
+                raise serializers.ValidationError({"status": f"Use um de: {', '.join(Context.Status.values)}."})
+            queryset = queryset.filter(status=status_filtro)
+            if status_filtro == Context.Status.PENDING:
+                # Itens deixados por um processo anterior voltam a andar
+                fila_embeddings.iniciar()
+        return queryset
 
     def perform_create(self, serializer):
         user_profile, created = UserProfile.objects.get_or_create(user=self.request.user)
-        contexto_texto = serializer.validated_data.get('text')
 
-        # Use the utility function to save to Firestore and get embedding
         # We need the user's Google API key for embedding generation
         google_api_key_for_embedding = user_profile.google_api_key or os.environ.get("GOOGLE_API_KEY")
 
         if not google_api_key_for_embedding:
-            raise status.HTTP_400_BAD_REQUEST("Google API Key not available for embedding.")
+            raise serializers.ValidationError("Google API Key not available for embedding.")
 
-        # Call the utility function to save to Firestore and generate embedding
-        sucesso, erro_msg = salvar_contexto_usuario(str(self.request.user.username), contexto_texto, google_api_key_for_embedding)
-        
-        if not sucesso:
-            raise serializers.ValidationError(f"Failed to save context to Firestore: {erro_msg}")
-        
-        # Then save to Django model
-        serializer.save(user_profile=user_profile)
+        # Uma única escrita local (Context + outbox na mesma transação); embedding e
+        # gravação no armazém vetorial ficam com a fila ('ready' ou 'failed' depois)
+        serializer.instance = enfileirar_contextos([Context(user_profile=user_profile, **serializer.validated_data)])[0]
+
+
+class ContextDetailView(generics.RetrieveAPIView):
+    """Consulta de um contexto (ex.: acompanhar o status após a criação)."""
+    serializer_class = ContextSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Context.objects.filter(user_profile__user=self.request.user).defer('embedding')
+
+
+class ContextBulkCreateView(APIView):
+    """
+    Ingestão em lote: {"contextos": ["texto 1", "texto 2", ...], "tags": [...]}.
+    Os contextos entram na outbox numa única transação; a fila faz os embeddings
+    em lote e a escrita em WriteBatch no Firestore. Retorna o status de cada item
+    na ordem enviada (202 se todos foram aceitos, 207 caso contrário); acompanhe
+    com GET /contextos/<id>/ ou ?status=.
+    """
+    permission_classes = [IsAuthenticated]
+    max_itens = int(os.environ.get('SENSEI_LOTE_CONTEXTOS_MAX', '500'))
+
+    def post(self, request):
+        serializer = ContextBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        textos = serializer.validated_data['contextos']
+
+        if len(textos) > self.max_itens:
+            return Response(
+                {"erro": f"Máximo de {self.max_itens} contextos por requisição."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        user_profile, created = UserProfile.objects.get_or_create(user=request.user)
+        resultados = [{"indice": i, "status": "erro", "erro": "Texto vazio."} for i in range(len(textos))]
+        validos = [i for i, texto in enumerate(textos) if texto]
+
+        tags = serializer.validated_data.get('tags', [])
+        criados = enfileirar_contextos([
+            Context(user_profile=user_profile, text=textos[i], source=Context.Source.BULK, tags=tags) for i in validos
+        ])
+        for i, context in zip(validos, criados):
+            resultados[i] = {"indice": i, "status": context.status, "id": context.id}
+
+        return Response(
+            {"total": len(textos), "sucesso": len(validos), "resultados": resultados},
+            status=status.HTTP_202_ACCEPTED if len(validos) == len(textos) else status.HTTP_207_MULTI_STATUS
+        )
+
+
+class ContextUploadView(APIView):
+    """
+    Upload multipart (campo 'arquivo') de .txt, .md ou .pdf. O arquivo é lido em
+    fluxo, dividido em chunks, embedado e gravado em lotes; a resposta é NDJSON
+    com uma linha de progresso por lote e uma linha final ('concluido' ou 'erro').
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        arquivo = request.FILES.get('arquivo')
+        if arquivo is None:
+            return Response({"erro": "Envie o arquivo no campo 'arquivo'."}, status=status.HTTP_400_BAD_REQUEST)
+        if arquivo.size > UPLOAD_MAX_BYTES:
+            return Response(
+                {"erro": f"Arquivo maior que o limite de {UPLOAD_MAX_BYTES // (1024 * 1024)} MB."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        try:
+            blocos_do_arquivo(arquivo, arquivo.name)
+        except FormatoNaoSuportado as e:
+            return Response({"erro": str(e)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        user_profile, created = UserProfile.objects.get_or_create(user=request.user)
+        user_id = str(request.user.username)
+
+        def eventos():
+            for evento in ingerir_arquivo(user_id, arquivo, arquivo.name):
+                if evento['evento'] != 'progresso' and evento['gravados']:
+                    # O texto completo fica só no Firestore (em chunks); aqui vai um registro do arquivo
+                    context = Context.objects.create(
+                        user_profile=user_profile,
+                        text=f"[arquivo] {arquivo.name} ({evento['gravados']} trechos)",
+                        status=Context.Status.READY,
+                        source=Context.Source.UPLOAD,
+                    )
+                    evento['id'] = context.id
+                yield json.dumps(evento, ensure_ascii=False) + "\n"
+
+        return StreamingHttpResponse(eventos(), content_type='application/x-ndjson', status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
 def chat_endpoint(request):
     """
-    Endpoint principal do chat
+    Endpoint principal do chat. Opcional: "filtros": {"desde", "ate" (ISO 8601),
+    "fontes": ["manual" | "bulk" | "upload"], "tags": [...], "meia_vida_dias"}
+    para restringir (e ponderar por recência) os contextos usados no RAG.
     """
     try:
         if not request.user.is_authenticated:
@@ -86,6 +206,8 @@ def chat_endpoint(request):
         
         user_profile, created = UserProfile.objects.get_or_create(user=request.user)
         user_id = str(request.user.username) # Firebase UID is stored as username
+        # Cada worker tem seu cache de índices: a preferência de IVF vem do perfil a cada pergunta
+        definir_modo_ann(user_id, user_profile.ann_mode)
 
         query = request.data.get('query')
         role = request.data.get('role', 'mentor') # Get role from request, default to mentor
@@ -97,6 +219,11 @@ def chat_endpoint(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        try:
+            filtro = FiltroBusca.de_dados(request.data.get('filtros'))
+        except (TypeError, ValueError) as e:
+            return Response({"erro": f"'filtros' inválido: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
         # Get API keys from user profile
         groq_api_key = user_profile.groq_api_key
         google_api_key = user_profile.google_api_key
@@ -107,7 +234,8 @@ def chat_endpoint(request):
             groq_api_key, 
             google_api_key, 
             preferred_provider=preferred_provider,
-            role=role # Pass the role to the processing function
+            role=role, # Pass the role to the processing function
+            filtro=filtro
         )
         
         return Response(resultado, status=status.HTTP_200_OK)
@@ -136,6 +264,58 @@ def chat_endpoint(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+class EventStreamRenderer(BaseRenderer):
+    """Só para a negociação aceitar 'Accept: text/event-stream'; o corpo vem do StreamingHttpResponse."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+@api_view(['POST'])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def chat_stream_endpoint(request):
+    """
+    Mesmo contrato de entrada do chat_endpoint, mas a resposta chega em
+    Server-Sent Events: contexto, inicio, token..., e fim (com ia_usada e o
+    tempo até o primeiro token) ou erro.
+    """
+    if not request.user.is_authenticated:
+        return Response({"erro": "Autenticação necessária."}, status=status.HTTP_401_UNAUTHORIZED)
+
+    user_profile, created = UserProfile.objects.get_or_create(user=request.user)
+    user_id = str(request.user.username)
+    definir_modo_ann(user_id, user_profile.ann_mode)
+
+    query = request.data.get('query')
+    if not query:
+        return Response({"erro": "'query' é obrigatório"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        filtro = FiltroBusca.de_dados(request.data.get('filtros'))
+    except (TypeError, ValueError) as e:
+        return Response({"erro": f"'filtros' inválido: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(
+        eventos_chat(
+            user_id,
+            query,
+            user_profile.groq_api_key,
+            user_profile.google_api_key,
+            preferred_provider=request.data.get('provider'),
+            role=request.data.get('role', 'mentor'),
+            filtro=filtro,
+        ),
+        content_type='text/event-stream',
+        status=status.HTTP_200_OK,
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Sem buffer no nginx, senão os tokens chegam todos de uma vez
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 # Refactor salvar_contexto_endpoint into ContextListView's perform_create
 # @api_view(['POST'])
 # def salvar_contexto_endpoint(request):
@@ -165,6 +345,28 @@ def check_user_contexts(request, user_id=None):
         return Response({"erro": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+def index_cache_stats(request):
+    """Contadores do cache de índices vetoriais deste worker (hits/misses/evictions)"""
+    if not request.user.is_authenticated:
+        return Response(
+            {"erro": "Autenticação necessária."},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    return Response(cache_indices_usuario.estatisticas(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def embedding_cache_stats(request):
+    """Contadores do cache de embeddings de consulta deste worker (memória/disco)"""
+    if not request.user.is_authenticated:
+        return Response(
+            {"erro": "Autenticação necessária."},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    return Response(cache_embeddings.estatisticas(), status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 def health_check(request):
     """Health check endpoint"""
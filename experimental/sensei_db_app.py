@@ -63,6 +63,50 @@ def chamar_api_chat(user_id, query, groq_api_key=None):
     except requests.exceptions.RequestException as e:
         return {"erro": f"Erro de conexão: {str(e)}"}
 
+def chamar_api_chat_stream(user_id, query, resultado, groq_api_key=None):
+    """
+    Chama o endpoint de chat em fluxo (Server-Sent Events) e gera os tokens
+    conforme chegam. Preenche `resultado` com ia_usada/num_contextos/erro.
+    """
+    payload = {
+        'user_id': user_id,
+        'query': query
+    }
+
+    if groq_api_key:
+        payload['groq_api_key'] = groq_api_key
+
+    try:
+        # (conexão, intervalo máximo entre eventos): não há mais espera pela resposta inteira
+        with requests.post(
+            f"{BACKEND_URL}/chat/stream/",
+            json=payload,
+            headers={'Accept': 'text/event-stream'},
+            stream=True,
+            timeout=(10, 60)
+        ) as response:
+            if response.status_code != 200:
+                resultado["erro"] = f"Status {response.status_code}: {response.text}"
+                return
+
+            evento = None
+            for linha in response.iter_lines(decode_unicode=True):
+                if linha.startswith("event:"):
+                    evento = linha[6:].strip()
+                elif linha.startswith("data:"):
+                    dados = json.loads(linha[5:].strip())
+                    if evento == "token":
+                        yield dados["texto"]
+                    elif evento == "erro":
+                        resultado["erro"] = dados.get("erro", "Erro desconhecido")
+                    else:
+                        resultado.update(dados)
+
+    except requests.exceptions.Timeout:
+        resultado["erro"] = "Timeout: O servidor parou de responder"
+    except requests.exceptions.RequestException as e:
+        resultado["erro"] = f"Erro de conexão: {str(e)}"
+
 def salvar_contexto_api(user_id, contexto):
     """Chama o endpoint de salvar contexto"""
     try:
@@ -291,38 +335,35 @@ if st.session_state.user_info:
             
             # Gera resposta do assistente
             with st.chat_message("assistant"):
-                with st.spinner("🤔 Analisando contexto e gerando resposta..."):
-                    # Prepara chave Groq (None se for usar Google)
-                    groq_key_to_send = None
-                    if groq_key and groq_key != "usar_google":
-                        groq_key_to_send = groq_key
-                    
-                    # Chama API
-                    resultado = chamar_api_chat(user_id, prompt, groq_key_to_send)
-                    
-                    # Verifica se houve erro
-                    if "erro" in resultado:
-                        st.error(f"❌ Erro: {resultado['erro']}")
+                # Prepara chave Groq (None se for usar Google)
+                groq_key_to_send = None
+                if groq_key and groq_key != "usar_google":
+                    groq_key_to_send = groq_key
+
+                # Chama API em fluxo: o texto aparece conforme é gerado
+                resultado = {}
+                resposta = st.write_stream(chamar_api_chat_stream(user_id, prompt, resultado, groq_key_to_send))
+
+                # Verifica se houve erro
+                if "erro" in resultado:
+                    st.error(f"❌ Erro: {resultado['erro']}")
+                    if not resposta:
                         resposta = "Desculpe, ocorreu um erro ao processar sua mensagem. Por favor, tente novamente."
-                        ia_usada = "erro"
-                    else:
-                        resposta = resultado.get("resposta", "Sem resposta")
-                        ia_usada = resultado.get("ia_usada", "desconhecida")
-                        num_contextos = resultado.get("num_contextos", 0)
-                        
-                        # Exibe resposta
-                        st.markdown(resposta)
-                        
-                        # Badge da IA usada
-                        ia_badge = "🚀 Groq" if ia_usada == "groq" else "🌐 Google"
-                        st.caption(f"Gerado por: {ia_badge} | Contextos usados: {num_contextos}")
-                    
-                    # Adiciona ao histórico
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": resposta,
-                        "ia_usada": ia_usada
-                    })
+                    ia_usada = resultado.get("ia_usada", "erro")
+                else:
+                    ia_usada = resultado.get("ia_usada", "desconhecida")
+                    num_contextos = resultado.get("num_contextos", 0)
+
+                    # Badge da IA usada
+                    ia_badge = "🚀 Groq" if ia_usada == "groq" else "🌐 Google"
+                    st.caption(f"Gerado por: {ia_badge} | Contextos usados: {num_contextos}")
+
+                # Adiciona ao histórico
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": resposta,
+                    "ia_usada": ia_usada
+                })
 
 # --- ÁREA DE LOGIN ---
 else:
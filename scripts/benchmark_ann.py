@@ -0,0 +1,71 @@
+"""
+Benchmark de recall@k e latência do IVF (agent/ann.py) contra a busca exata,
+para escolher SENSEI_ANN_NPROBE e o número de listas.
+
+Uso:
+    python scripts/benchmark_ann.py --n 50000 --dim 256 --nprobe 1,2,4,8,16,32
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR / "backend"))
+
+from agent.ann import IndiceIVF  # noqa: E402
+from agent.vector_index import normalizar_linhas, selecionar_top_k  # noqa: E402
+
+
+def gerar_corpus(rng, n, dim, n_topicos):
+    """Embeddings de texto se agrupam por assunto; uma mistura de gaussianas imita isso."""
+    centros = rng.standard_normal((n_topicos, dim)).astype(np.float32)
+    topicos = rng.integers(0, n_topicos, n)
+    ruido = rng.standard_normal((n, dim)).astype(np.float32) * 0.6
+    return normalizar_linhas(centros[topicos] + ruido).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--listas", default="auto", help="Ex.: auto,400 (auto = sqrt(N))")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    matriz = gerar_corpus(rng, args.n, args.dim, n_topicos=max(8, args.n // 500))
+    consultas = gerar_corpus(rng, args.consultas, args.dim, n_topicos=max(8, args.n // 500))
+
+    inicio = time.perf_counter()
+    exatos = [set(selecionar_top_k(matriz @ q, args.top_k)[0].tolist()) for q in consultas]
+    lat_exata = (time.perf_counter() - inicio) / args.consultas * 1000
+
+    print(f"📊 IVF vs exato (N={args.n}, dim={args.dim}, top_k={args.top_k}, consultas={args.consultas})")
+    print(f"   Busca exata: {lat_exata:.2f} ms/consulta")
+    print(f"{'listas':>7} | {'nprobe':>6} | {'recall@k':>8} | {'ms/consulta':>11} | {'speedup':>7} | {'treino (s)':>10}")
+    print("-" * 66)
+
+    for listas in args.listas.split(","):
+        inicio = time.perf_counter()
+        ivf = IndiceIVF(matriz, n_listas=None if listas == "auto" else int(listas), seed=args.seed)
+        t_treino = time.perf_counter() - inicio
+
+        for n_probe in [int(p) for p in args.nprobe.split(",")]:
+            acertos = 0
+            inicio = time.perf_counter()
+            for q, esperado in zip(consultas, exatos):
+                posicoes, _ = ivf.buscar(matriz, q, args.top_k, n_probe=n_probe)
+                acertos += len(esperado & set(posicoes.tolist()))
+            lat = (time.perf_counter() - inicio) / args.consultas * 1000
+            recall = acertos / (args.consultas * args.top_k)
+            print(f"{ivf.n_listas:>7} | {n_probe:>6} | {recall:>8.3f} | {lat:>11.2f} | {lat_exata / lat:>6.1f}x | {t_treino:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
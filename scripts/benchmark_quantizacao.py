@@ -0,0 +1,76 @@
+"""
+Benchmark da quantização (agent/quantization.py): memória por 100 mil vetores,
+recall@k contra a busca exata em float32 e latência por consulta.
+
+Uso:
+    python scripts/benchmark_quantizacao.py --n 100000 --dim 3072 --top-k 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR / "backend"))
+
+from agent import vector_index  # noqa: E402
+from agent.vector_index import IndiceVetorial, normalizar_linhas, selecionar_top_k  # noqa: E402
+
+
+def gerar_corpus(rng, n, dim, n_topicos):
+    """Embeddings de texto se agrupam por assunto; uma mistura de gaussianas imita isso."""
+    centros = rng.standard_normal((n_topicos, dim)).astype(np.float32)
+    matriz = np.empty((n, dim), dtype=np.float32)
+    for inicio in range(0, n, 10000):
+        fim = min(inicio + 10000, n)
+        topicos = rng.integers(0, n_topicos, fim - inicio)
+        matriz[inicio:fim] = centros[topicos] + rng.standard_normal((fim - inicio, dim)).astype(np.float32) * 0.6
+    return normalizar_linhas(matriz).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--consultas", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    matriz = gerar_corpus(rng, args.n, args.dim, n_topicos=max(8, args.n // 500))
+    # Consultas próximas de documentos existentes (perguntas sobre o que foi salvo)
+    amostra = rng.choice(args.n, args.consultas, replace=False)
+    consultas = normalizar_linhas(matriz[amostra] + rng.standard_normal((args.consultas, args.dim)).astype(np.float32) * 0.02)
+    exatos = [set(selecionar_top_k(matriz @ q, args.top_k)[0].tolist()) for q in consultas]
+    ids = [str(i) for i in range(args.n)]
+
+    vector_index.DIRETORIO_MATRIZES_QUANTIZADAS = tempfile.mkdtemp(prefix="sensei-quant-")
+    fator_100k = 100000 / args.n
+
+    print(f"📊 Quantização vs exato (N={args.n}, dim={args.dim}, top_k={args.top_k}, consultas={args.consultas})")
+    print(f"{'modo':>8} | {'MB/100k (RAM)':>13} | {'recall@k':>8} | {'ms/consulta':>11}")
+    print("-" * 52)
+    for modo in ('nenhuma', 'int8', 'binaria'):
+        indice = IndiceVetorial(ids, None, matriz, modo)
+        acertos = 0
+        inicio = time.perf_counter()
+        for q, esperado in zip(consultas, exatos):
+            posicoes, _ = indice.buscar(q, args.top_k)
+            acertos += len(esperado & set(posicoes.tolist()))
+        lat = (time.perf_counter() - inicio) / args.consultas * 1000
+        recall = acertos / (args.consultas * args.top_k)
+        print(f"{modo:>8} | {indice.nbytes * fator_100k / 2**20:>13.1f} | {recall:>8.3f} | {lat:>11.2f}")
+        del indice
+
+    print(f"\nMatriz float32 fora da RAM (modos quantizados) em: {vector_index.DIRETORIO_MATRIZES_QUANTIZADAS}")
+    for nome in os.listdir(vector_index.DIRETORIO_MATRIZES_QUANTIZADAS):
+        os.remove(os.path.join(vector_index.DIRETORIO_MATRIZES_QUANTIZADAS, nome))
+
+
+if __name__ == "__main__":
+    main()
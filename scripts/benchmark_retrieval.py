@@ -0,0 +1,78 @@
+"""
+Benchmark do ranqueamento de contextos: loop Python (caminho antigo) x
+matriz float32 + argpartition (agent/vector_index.py).
+
+Uso:
+    python scripts/benchmark_retrieval.py --dim 768 --tamanhos 1000,10000,100000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR / "backend"))
+
+from agent.vector_index import montar_matriz, similaridade_cosseno, selecionar_top_k  # noqa: E402
+
+
+def caminho_antigo(query, embeddings, top_k):
+    """Réplica do loop original: np.dot + duas normas por documento e sort completo."""
+    contexts = []
+    for i, emb in enumerate(embeddings):
+        similarity = np.dot(query, emb) / (np.linalg.norm(query) * np.linalg.norm(emb))
+        contexts.append({'id': i, 'similarity': similarity})
+    contexts.sort(key=lambda x: x['similarity'], reverse=True)
+    return [ctx['id'] for ctx in contexts[:top_k]]
+
+
+def caminho_novo(query, embeddings, top_k):
+    """Empilha as listas (como chegam do Firestore) e ranqueia vetorizado."""
+    matriz = montar_matriz(embeddings)
+    indices, _ = selecionar_top_k(similaridade_cosseno(query, matriz), top_k)
+    return indices.tolist()
+
+
+def cronometrar(func, repeticoes):
+    melhor = float('inf')
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--tamanhos", default="1000,10000,100000")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    query = rng.standard_normal(args.dim).tolist()
+
+    print(f"📊 Benchmark de ranqueamento (dim={args.dim}, top_k={args.top_k})")
+    print(f"{'N':>8} | {'antigo (s)':>11} | {'novo (s)':>9} | {'só matriz (s)':>13} | {'speedup':>7}")
+    print("-" * 62)
+
+    for n in [int(t) for t in args.tamanhos.split(",")]:
+        # Firestore entrega listas de floats Python, então os dois caminhos partem delas
+        embeddings = rng.standard_normal((n, args.dim)).astype(np.float32).tolist()
+        matriz = montar_matriz(embeddings)
+
+        t_antigo, ids_antigo = cronometrar(lambda: caminho_antigo(query, embeddings, args.top_k), max(1, args.repeticoes if n <= 10000 else 1))
+        t_novo, ids_novo = cronometrar(lambda: caminho_novo(query, embeddings, args.top_k), args.repeticoes)
+        t_matriz, _ = cronometrar(lambda: selecionar_top_k(similaridade_cosseno(query, matriz), args.top_k), args.repeticoes)
+
+        status = "✅" if ids_antigo == ids_novo else "⚠️ ranking divergente"
+        print(f"{n:>8} | {t_antigo:>11.4f} | {t_novo:>9.4f} | {t_matriz:>13.5f} | {t_antigo / t_novo:>6.1f}x {status}")
+
+
+if __name__ == "__main__":
+    main()
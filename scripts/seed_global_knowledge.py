@@ -1,8 +1,15 @@
 import os
 import firebase_admin
 from firebase_admin import credentials, firestore
-import requests
 import json
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR / "backend"))
+
+from agent.utils import gerar_embeddings_em_lote  # noqa: E402
+from agent.vector_index import CAMPO_DIMENSAO, CAMPO_NORMALIZADO, normalizar_embedding  # noqa: E402
 
 # Setup Firebase
 def init_firebase():
@@ -11,28 +18,25 @@ def init_firebase():
         firebase_admin.initialize_app()
     return firestore.client()
 
-def get_embedding(text):
-    api_key = os.environ.get('GOOGLE_API_KEY')
-    if not api_key:
-        raise Exception("GOOGLE_API_KEY not found")
-    
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-embedding-001:embedContent?key={api_key}"
-    payload = {"model": "models/gemini-embedding-001", "content": {"parts": [{"text": text}]}}
-    response = requests.post(url, json=payload, timeout=30)
-    response.raise_for_status()
-    return response.json()['embedding']['values']
-
 def seed_role(db, role, concepts):
     print(f"📦 Seeding global knowledge for role: {role}")
     collection = db.collection('global_knowledge').document(role).collection('concepts')
     
-    for concept in concepts:
+    # Todos os conceitos do papel em poucas chamadas batchEmbedContents
+    embeddings = gerar_embeddings_em_lote([f"{c['title']}: {c['content']}" for c in concepts])
+
+    for concept, embedding in zip(concepts, embeddings):
+        if embedding is None:
+            print(f"  ⚠️ Skipping concept (embedding failed): {concept['title']}")
+            continue
         print(f"  - Adding concept: {concept['title']}")
-        embedding = get_embedding(f"{concept['title']}: {concept['content']}")
+        embedding = normalizar_embedding(embedding)
         collection.add({
             'title': concept['title'],
             'content': concept['content'],
             'embedding': embedding,
+            CAMPO_NORMALIZADO: True,
+            CAMPO_DIMENSAO: len(embedding),
             'timestamp': firestore.SERVER_TIMESTAMP
         })
 